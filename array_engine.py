@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Array-backed CLR simulation engine.
+
+Keeps the state of every coffee plant in contiguous NumPy arrays (struct-of-arrays)
+instead of a list of Plant instances. Plants are laid out cell by cell in row-major
+order of the coffee cells, so the plants of one cell always occupy a contiguous
+range of indices. The landscape is held as a SparseLandscape (coffee cells and their
+CSR neighbour lists only), so memory and per-day work scale with the coffee area.
+Progression, infectivity, production and the daily summary are vectorized; the spread
+rules follow model.py and draw from the replicate's Generator in the same order.
+"""
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from model import DEFAULT_CONFIG, SimulationConfig, default_rng, weather_effects
+from phase_timer import NULL_TIMER, NullTimer, PhaseTimer
+from sparse_landscape import SparseLandscape
+
+Selector = Union[slice, np.ndarray]
+
+
+@dataclass
+class PlantArrays:
+    """
+    Struct-of-arrays store for all coffee plants of a landscape.
+
+    Attributes
+    ----------
+    row, col : np.ndarray
+        Grid row and column of each plant.
+    plant : np.ndarray
+        ID of each plant within its grid cell.
+    infection, infectivity, production, resistance : np.ndarray
+        Per-plant state, with the same meaning as the Plant attributes in model.py.
+    cell : np.ndarray
+        Index of the coffee cell each plant belongs to.
+    cell_start : np.ndarray
+        Plants of coffee cell ``c`` are ``cell_start[c]:cell_start[c + 1]``.
+    landscape : SparseLandscape
+        Coffee cells (in cell index order) and their coffee neighbours.
+    config : SimulationConfig
+        Simulation parameters used by the engine functions.
+    """
+    row: np.ndarray
+    col: np.ndarray
+    plant: np.ndarray
+    infection: np.ndarray
+    infectivity: np.ndarray
+    production: np.ndarray
+    resistance: np.ndarray
+    cell: np.ndarray
+    cell_start: np.ndarray
+    landscape: SparseLandscape
+    config: SimulationConfig = field(default=DEFAULT_CONFIG, repr=False)
+
+    @classmethod
+    def from_landscape(cls, landscape: pd.DataFrame, plants_per_cell: int,
+                       resistance: float = 1.0, config: SimulationConfig = DEFAULT_CONFIG) -> "PlantArrays":
+        """
+        Create ``plants_per_cell`` healthy plants in every coffee cell of the landscape.
+
+        Parameters
+        ----------
+        landscape : pd.DataFrame
+            Boolean landscape from make_landscape (True = coffee).
+        plants_per_cell : int
+            Number of plants placed in each coffee cell.
+        resistance : float
+            Resistance assigned to every plant.
+        config : SimulationConfig
+            Simulation parameters.
+
+        Returns
+        -------
+        PlantArrays
+            Plant store in the same order as the List[Plant] built in model.py.
+        """
+        wrap = config.boundary == "toroidal"
+        return cls.from_sparse(SparseLandscape.from_mask(landscape, wrap), plants_per_cell, resistance, config)
+
+    @classmethod
+    def from_sparse(cls, landscape: SparseLandscape, plants_per_cell: int,
+                    resistance: float = 1.0, config: SimulationConfig = DEFAULT_CONFIG) -> "PlantArrays":
+        """
+        Create ``plants_per_cell`` healthy plants in every coffee cell of a sparse landscape.
+        Same parameters as from_landscape.
+        """
+        n_cells = landscape.n_cells
+        n_plants = n_cells * plants_per_cell
+        cell = np.repeat(np.arange(n_cells), plants_per_cell)
+        return cls(
+            row=landscape.rows[cell],
+            col=landscape.cols[cell],
+            plant=np.tile(np.arange(plants_per_cell), n_cells),
+            infection=np.zeros(n_plants),
+            infectivity=np.zeros(n_plants),
+            production=np.ones(n_plants),
+            resistance=np.full(n_plants, resistance, dtype=float),
+            cell=cell,
+            cell_start=np.arange(n_cells + 1) * plants_per_cell,
+            landscape=landscape,
+            config=config,
+        )
+
+    @property
+    def n_cells(self) -> int:
+        return self.cell_start.size - 1
+
+    def __len__(self) -> int:
+        return self.infection.size
+
+    def __getitem__(self, i: int) -> "PlantView":
+        return PlantView(self, i)
+
+    def views(self) -> List["PlantView"]:
+        """Return a PlantView for every plant, for code written against List[Plant]."""
+        return [PlantView(self, i) for i in range(len(self))]
+
+
+class PlantView:
+    """
+    Thin Plant-compatible view of one plant in a PlantArrays store.
+
+    Reads and writes go straight to the underlying arrays, so code written against
+    the Plant dataclass keeps working without copying state out of the arrays.
+    """
+    __slots__ = ("_plants", "_i")
+    cost: int = 100
+
+    def __init__(self, plants: PlantArrays, i: int) -> None:
+        self._plants = plants
+        self._i = i
+
+    @property
+    def grid(self) -> Tuple[int, int]:
+        return (int(self._plants.row[self._i]), int(self._plants.col[self._i]))
+
+    @property
+    def plant(self) -> int:
+        return int(self._plants.plant[self._i])
+
+    @property
+    def infection(self) -> float:
+        return float(self._plants.infection[self._i])
+
+    @infection.setter
+    def infection(self, value: float) -> None:
+        self._plants.infection[self._i] = value
+
+    @property
+    def infectivity(self) -> float:
+        return float(self._plants.infectivity[self._i])
+
+    @infectivity.setter
+    def infectivity(self, value: float) -> None:
+        self._plants.infectivity[self._i] = value
+
+    @property
+    def production(self) -> float:
+        return float(self._plants.production[self._i])
+
+    @production.setter
+    def production(self, value: float) -> None:
+        self._plants.production[self._i] = value
+
+    @property
+    def resistance(self) -> float:
+        return float(self._plants.resistance[self._i])
+
+    @resistance.setter
+    def resistance(self, value: float) -> None:
+        self._plants.resistance[self._i] = value
+
+    def progression(self) -> None:
+        progression(self._plants, slice(self._i, self._i + 1))
+
+    def get_production(self) -> None:
+        get_production(self._plants, slice(self._i, self._i + 1))
+
+    def define_infectivity(self) -> float:
+        define_infectivity(self._plants, slice(self._i, self._i + 1))
+        return self.infectivity
+
+    def __repr__(self) -> str:
+        return (f"PlantView(grid={self.grid}, plant={self.plant}, infection={self.infection}, "
+                f"infectivity={self.infectivity}, production={self.production}, "
+                f"resistance={self.resistance})")
+
+
+def progress_infection(infection: np.ndarray, resistance: np.ndarray,
+                       config: SimulationConfig = DEFAULT_CONFIG) -> np.ndarray:
+    """
+    Return infection levels advanced by one day: each level grows by the scaling of
+    the first cutoff it has not reached (20 beyond the last cutoff) and is capped at 1.
+    Works on arrays of any shape.
+    """
+    days = config.days
+    thresholds = np.asarray(config.progression_cutoff) * days
+    scaling = np.append(np.asarray(config.progression_scaling, dtype=float), 20.0)
+    step = scaling[np.searchsorted(thresholds, infection, side="right")]
+    active = (infection > 0) & (infection < 1)
+    infection = np.where(active, infection + step * days * resistance, infection)
+    return np.minimum(infection, 1.0)
+
+
+def infectivity_of(infection: np.ndarray, config: SimulationConfig = DEFAULT_CONFIG) -> np.ndarray:
+    """
+    Return infectivity for the given infection levels: plants are infective once past
+    the 20-day latency period, with infectivity equal to their infection level.
+    """
+    return np.where(infection < 20 * config.days, 0.0, infection)
+
+
+# Trajectories are cached per (resistance, config); a run only holds a few resistances
+@lru_cache(maxsize=256)
+def trajectory(resistance: float, config: SimulationConfig = DEFAULT_CONFIG) -> np.ndarray:
+    """
+    Infection levels of a plant with the given resistance, 0, 1, 2, ... days after its
+    infection, up to and including full infection. Built with progress_infection, so the
+    levels are exactly those reached by stepping day by day.
+
+    The trajectory ends early, below full infection, once the level stops increasing
+    (resistance <= 0) or after config.n_days days, the longest a plant can progress
+    in a run.
+    """
+    levels = [config.days]
+    x = np.array([config.days])
+    r = np.array([resistance])
+    while x[0] < 1 and len(levels) <= config.n_days:
+        following = progress_infection(x, r, config)
+        if not following[0] > x[0]:
+            break
+        x = following
+        levels.append(x[0])
+    return np.array(levels)
+
+
+def advance_infections(infection: np.ndarray, resistance: np.ndarray, n_days: int,
+                       config: SimulationConfig = DEFAULT_CONFIG) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Advance infected plants by ``n_days`` days of progression without spread in one jump.
+
+    Each plant's age is recovered by looking its level up in the trajectory of its
+    resistance; its level after the jump is the trajectory ``n_days`` further on. The
+    summed infectivity of every skipped day comes from the histogram of ages.
+
+    Parameters
+    ----------
+    infection, resistance : np.ndarray
+        Levels and resistance of the infected plants.
+    n_days : int
+        Number of days to advance.
+    config : SimulationConfig
+        Simulation parameters.
+
+    Returns
+    -------
+    tuple or None
+        (infection after the jump, (n_days,) infectivity sum after each day), or None if
+        a level is not on its trajectory (e.g. set by hand) or would move past the end
+        of a trajectory that stops below full infection, in which case the caller has
+        to step day by day.
+    """
+    advanced = np.empty_like(infection)
+    scores = np.zeros(n_days)
+    steps = np.arange(1, n_days + 1)
+    for r in np.unique(resistance):
+        which = resistance == r
+        levels = trajectory(float(r), config)
+        age = np.minimum(np.searchsorted(levels, infection[which]), levels.size - 1)
+        if not np.array_equal(levels[age], infection[which]):
+            return None
+        if levels[-1] < 1 and age.max() + n_days >= levels.size:
+            return None
+        ages, counts = np.unique(age, return_counts=True)
+        later = np.minimum(ages[:, np.newaxis] + steps, levels.size - 1)
+        scores += counts @ infectivity_of(levels, config)[later]
+        advanced[which] = levels[np.minimum(age + n_days, levels.size - 1)]
+    return advanced, scores
+
+
+def progression(plants: PlantArrays, which: Selector = slice(None)) -> None:
+    """
+    Vectorized Plant.progression.
+
+    Parameters
+    ----------
+    plants : PlantArrays
+        Plant store.
+    which : slice or np.ndarray
+        Plants to progress (boolean mask, index array or slice).
+    """
+    plants.infection[which] = progress_infection(plants.infection[which], plants.resistance[which],
+                                                 plants.config)
+
+
+def define_infectivity(plants: PlantArrays, which: Selector = slice(None)) -> None:
+    """Vectorized Plant.define_infectivity."""
+    plants.infectivity[which] = infectivity_of(plants.infection[which], plants.config)
+
+
+def get_production(plants: PlantArrays, which: Selector = slice(None)) -> None:
+    """Vectorized Plant.get_production: production falls linearly with infection."""
+    plants.production[which] = (1 - 0.5 * plants.infection[which]) * plants.config.max_production
+
+
+def get_harvest(plants: PlantArrays) -> float:
+    """Array equivalent of model.get_harvest."""
+    return float(plants.config.max_production * plants.production.sum())
+
+
+def get_gridscores(plants: PlantArrays) -> np.ndarray:
+    """Return the summed infectivity of every coffee cell."""
+    return np.bincount(plants.cell, weights=plants.infectivity, minlength=plants.n_cells)
+
+
+def coffee_neighbors(plants: PlantArrays, cell: int) -> np.ndarray:
+    """
+    Return the coffee cells among the 8 neighbours of a coffee cell, in ascending
+    cell order. Positions outside the grid are dropped.
+    """
+    return plants.landscape.neighbors(cell)
+
+
+def plants_in_cells(plants: PlantArrays, cells: np.ndarray) -> np.ndarray:
+    """Return the indices of all plants in the given cells, in plant order."""
+    if cells.size == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([np.arange(plants.cell_start[c], plants.cell_start[c + 1]) for c in cells])
+
+
+def within_cell_infection(plants: PlantArrays, cells: np.ndarray, scores: np.ndarray) -> None:
+    """
+    Infect the first healthy plant of every given cell whose infection score is at least 0.4.
+
+    Parameters
+    ----------
+    plants : PlantArrays
+        Plant store.
+    cells : np.ndarray
+        Infected coffee cells.
+    scores : np.ndarray
+        Infection score of each of ``cells``.
+    """
+    healthy = np.flatnonzero(plants.infection < 0.001)
+    first_healthy = np.full(plants.n_cells, -1)
+    # Reverse order so the lowest plant index of each cell is written last.
+    first_healthy[plants.cell[healthy[::-1]]] = healthy[::-1]
+    targets = first_healthy[cells[scores >= 0.4]]
+    plants.infection[targets[targets >= 0]] = plants.config.days
+
+
+def neighbor_cell_infection(plants: PlantArrays, cell: int, score: float,
+                            rng: Optional[np.random.Generator] = None) -> Optional[int]:
+    """
+    Infect one healthy plant in a cell adjacent to ``cell`` based on its infection score
+    and return it (None if no plant was infected). Draws follow model.neighbor_cell_infection.
+    """
+    rng = rng or default_rng
+    candidates = plants_in_cells(plants, coffee_neighbors(plants, cell))
+    healthy_neighbors = candidates[plants.infection[candidates] < 0.0001]
+    a = max(1, rng.integers(0, len(healthy_neighbors) + 1))
+    if score < 0.6 or len(healthy_neighbors) < 1:
+        return None
+    if rng.random() < 0.8:
+        plants.infection[healthy_neighbors[a - 1]] = plants.config.days
+        return int(healthy_neighbors[a - 1])
+    return None
+
+
+def neighbor_convolution_infection(plants: PlantArrays, cells: np.ndarray, scores: np.ndarray,
+                                   rng: Optional[np.random.Generator] = None,
+                                   healthy: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> None:
+    """
+    Neighbour spread for all cells at once.
+
+    Mean-field version of neighbor_cell_infection: every infected cell with a score of
+    at least 0.6 infects, with probability 0.8, one of the healthy plants in its
+    neighbouring cells. Spreading that 0.8 evenly over the healthy neighbour plants
+    and summing over sources with the coffee adjacency matrix (the 8-neighbourhood
+    convolution restricted to coffee cells) gives the expected
+    number of new infections in every cell. The number of infections per cell is drawn
+    from a Poisson distribution with that mean (capped at the healthy plants in the
+    cell) and applied to the first healthy plants of the cell.
+
+    Parameters
+    ----------
+    plants : PlantArrays
+        Plant store.
+    cells : np.ndarray
+        Infected coffee cells.
+    scores : np.ndarray
+        Infection score of each of ``cells``.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
+    healthy : tuple, optional
+        healthy_counts of the plants, if already computed; both steps of the rule use it.
+    """
+    rng = rng or default_rng
+    healthy = healthy or healthy_counts(plants)
+    pressure = plants.landscape.adjacency @ source_weights(plants, cells, scores, healthy[1])
+    infect_under_pressure(plants, pressure, rng, healthy)
+
+
+def healthy_counts(plants: PlantArrays) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the healthy plants (ascending) and the number of healthy plants of every cell."""
+    healthy = np.flatnonzero(plants.infection < 0.0001)
+    return healthy, np.bincount(plants.cell[healthy], minlength=plants.n_cells)
+
+
+def source_weights(plants: PlantArrays, cells: np.ndarray, scores: np.ndarray,
+                   healthy_count: np.ndarray) -> np.ndarray:
+    """
+    Return the per-cell source weight of the convolution rule: 0.8 spread over the
+    healthy plants around every cell of ``cells`` with a score of at least 0.6, 0 elsewhere.
+    ``healthy_count`` is the number of healthy plants of every cell (see healthy_counts).
+    """
+    healthy_around = plants.landscape.adjacency @ healthy_count.astype(float)
+    sources = cells[scores >= 0.6]
+    weight = np.zeros(plants.n_cells)
+    around = healthy_around[sources]
+    weight[sources] = np.divide(0.8, around, out=np.zeros(sources.size), where=around > 0)
+    return weight
+
+
+def infect_under_pressure(plants: PlantArrays, pressure: np.ndarray, rng: np.random.Generator,
+                          healthy: Tuple[np.ndarray, np.ndarray]) -> None:
+    """
+    Draw the new infections of every cell from a Poisson distribution with mean
+    ``pressure`` times its healthy plants (capped at the healthy plants) and infect the
+    first healthy plants of the cell. ``healthy`` is the healthy_counts of the plants.
+    """
+    healthy, healthy_count = healthy
+    new_infections = np.minimum(rng.poisson(pressure * healthy_count), healthy_count)
+    # rank of each healthy plant within its cell (healthy is sorted, so cells are contiguous)
+    healthy_cell = plants.cell[healthy]
+    rank = np.arange(healthy.size) - np.searchsorted(healthy_cell, healthy_cell)
+    plants.infection[healthy[rank < new_infections[healthy_cell]]] = plants.config.days
+
+
+def global_infection(plants: PlantArrays, scores: np.ndarray,
+                     rng: Optional[np.random.Generator] = None) -> None:
+    """
+    Infect three random healthy plants anywhere in the landscape when the total
+    infection score is high enough. Draws follow model.global_infection.
+    """
+    rng = rng or default_rng
+    total_score = scores.sum()
+    healthy = np.flatnonzero(plants.infection < 0.0001)
+    if len(healthy) > 100 and total_score >= 0.5:
+        a = rng.integers(0, len(healthy))
+        b = rng.integers(0, len(healthy))
+        c = rng.integers(0, len(healthy))
+        plants.infection[healthy[[a, b, c]]] = plants.config.days
+
+
+def daily_summary(plants: PlantArrays, day: int) -> List[float]:
+    """
+    Return [infectivity_score, infected_cells, infected_plants, day] for the current state.
+    """
+    infected = plants.infection > 0.001
+    infected_cells = np.count_nonzero(np.bincount(plants.cell[infected], minlength=plants.n_cells))
+    return [float(plants.infectivity.sum()), int(infected_cells), int(np.count_nonzero(infected)), day]
+
+
+def fast_forward(plants: PlantArrays, day: int, n_days: int) -> Optional[List[List[float]]]:
+    """
+    Run days ``day`` .. ``day + n_days - 1`` without any spread (no within-cell weather)
+    in one jump with advance_infections. The set of infected plants does not change, so
+    only the infectivity score of the daily summary varies between the skipped days.
+
+    Returns
+    -------
+    List[List[float]] or None
+        The daily summaries of the skipped days, or None (nothing changed) if the
+        plants have to be stepped day by day.
+    """
+    infected = np.flatnonzero(plants.infection > 0.0001)
+    jump = advance_infections(plants.infection[infected], plants.resistance[infected], n_days, plants.config)
+    if jump is None:
+        return None
+    plants.infection[infected], scores = jump
+    define_infectivity(plants, infected)
+    _, infected_cells, infected_plants, _ = daily_summary(plants, day)
+    return [[float(score), infected_cells, infected_plants, day + k] for k, score in enumerate(scores)]
+
+
+def each_day(plants: PlantArrays, day: int, neighbor_mode: Optional[str] = None,
+             rng: Optional[np.random.Generator] = None, weather: Optional[np.ndarray] = None,
+             timer: Union[PhaseTimer, NullTimer] = NULL_TIMER) -> List[float]:
+    """
+    Array equivalent of model.each_day: progress infections, spread based on weather.
+
+    Parameters
+    ----------
+    plants : PlantArrays
+        Plant store.
+    day : int
+        Current day number.
+    neighbor_mode : str, optional
+        Neighbour spread rule, "cell" (neighbor_cell_infection for each infected cell)
+        or "convolution" (neighbor_convolution_infection); defaults to the config's.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
+    weather : np.ndarray, optional
+        The day's row of a weather_schedule; drawn with weather_effects if not given.
+    timer : PhaseTimer, optional
+        Records the wall time of every phase of the day (see phase_timer.py).
+
+    Returns
+    -------
+    List[float]
+        [infectivity_score, infected_cells, infected_plants, day_number]
+    """
+    neighbor_mode = neighbor_mode or plants.config.neighbor_spread
+    if neighbor_mode not in ("cell", "convolution"):
+        raise ValueError(f"unknown neighbour spread rule: {neighbor_mode}")
+    rng = rng or default_rng
+    if weather is None:
+        weather = weather_effects(day, plants.config, rng)
+    with timer.phase(day, "progression", len(plants)):
+        inf_plants = plants.infection > 0.0001
+        progression(plants, inf_plants)
+        define_infectivity(plants, inf_plants)
+    if weather[0]:
+        inf_grid = np.unique(plants.cell[inf_plants])
+        with timer.phase(day, "within_cell", inf_grid.size):
+            scores = get_gridscores(plants)[inf_grid]
+            within_cell_infection(plants, inf_grid, scores)
+        if weather[1]:
+            with timer.phase(day, "neighbor", inf_grid.size):
+                if neighbor_mode == "convolution":
+                    neighbor_convolution_infection(plants, inf_grid, scores, rng, healthy_counts(plants))
+                else:
+                    for cell, score in zip(inf_grid, scores):
+                        neighbor_cell_infection(plants, cell, score, rng)
+            if weather[2]:
+                with timer.phase(day, "global", inf_grid.size):
+                    global_infection(plants, scores, rng)
+    with timer.phase(day, "summary", len(plants)):
+        return daily_summary(plants, day)
+
+
+def initial_infection(plants: PlantArrays, rng: Optional[np.random.Generator] = None) -> None:
+    """
+    Randomly select one plant and one plant in an adjacent coffee cell to become infected.
+    """
+    rng = rng or default_rng
+    a = rng.integers(0, len(plants))
+    plants.infection[a] = plants.config.days
+    neighbors = plants_in_cells(plants, coffee_neighbors(plants, plants.cell[a]))
+    if len(neighbors) > 0:
+        c = rng.integers(0, min(8, len(neighbors)))
+        plants.infection[neighbors[c]] = plants.config.days
+
+
+def infection_map(plants: PlantArrays) -> np.ndarray:
+    """Array equivalent of model.infection_map: 0 non-coffee, 1 coffee, 2 coffee with infected plants."""
+    landscaped = plants.landscape.to_dense().astype(np.uint8)
+    infected = plants.infection > 0.0001
+    landscaped[plants.row[infected], plants.col[infected]] = 2
+    return landscaped
+
+
+def composition(plants: PlantArrays) -> np.ndarray:
+    """
+    Cell counts [non-coffee, healthy coffee, coffee with infected plants] of the landscape,
+    the counts of the 0/1/2 values of infection_map.
+    """
+    infected = np.count_nonzero(np.bincount(plants.cell[plants.infection > 0.0001], minlength=plants.n_cells))
+    rows, cols = plants.landscape.shape
+    return np.array([rows * cols - plants.n_cells, plants.n_cells - infected, infected], dtype=np.int64)
+
+
+def calculate_returns(plants: PlantArrays) -> float:
+    """Update production from infection and return the total production of all plants."""
+    get_production(plants)
+    return float(plants.production.sum())
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched Monte Carlo replicates for the CLR-Landscape model.
+
+Simulates R replicates at once, with the replicate as the leading dimension of every
+state array, so a single vectorized day step advances all replicates. Plant state is
+stored as a (runs, plants_per_cell, rows, cols) raster. Per-cell healthy counts and
+infectivity scores are kept as (runs, rows, cols) rasters and updated on every
+transition, and only plants whose infection is still progressing are visited each day,
+so the daily work scales with the landscape rasters rather than with all plants.
+Each replicate has its own landscape, weather and numpy.random.Generator; replicate z
+of a batch seeded with s draws from SeedSequence(s, spawn_key=(z,)) only, so it can be
+re-run on its own (or in any other batch) with the same outcome.
+
+Neighbour spread uses the "convolution" rule of array_engine (a Poisson, mean-field
+version of the "cell" rule), with the 8-neighbourhood convolution of all replicates
+done with shifted planes; a batch needs a config with neighbor_spread="convolution",
+such as BATCH_CONFIG. The command line runs any number of replicates, a batch at a
+time, and writes their outputs to data/batched, apart from the runs of the other
+engines:
+
+    python batched.py --runs 5000 --batch-size 250 --proportions 0.25,0.75
+"""
+
+import argparse
+import dataclasses
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from array_engine import infectivity_of, progress_infection
+from clr_landscape import add_config_options
+from model import DEFAULT_CONFIG, SimulationConfig, datadir, make_landscape, weather_schedule, write_map_csv
+
+# Row and column offsets of the 8-neighbourhood
+OFFSETS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+
+# Default config of a batch: the only neighbour spread rule implemented here is "convolution"
+BATCH_CONFIG = dataclasses.replace(DEFAULT_CONFIG, neighbor_spread="convolution")
+
+# SimulationConfig fields a batch does not use, left out of the command line
+IGNORED_FIELDS = ("simulation_engine", "neighbor_spread", "fast_forward", "tiles")
+
+
+@dataclass
+class Batch:
+    """
+    State of R replicates simulated together.
+
+    Attributes
+    ----------
+    coffee : np.ndarray
+        (runs, rows, cols) boolean coffee mask of each replicate's landscape.
+    infection, infectivity, resistance : np.ndarray
+        (runs, plants_per_cell, rows, cols) plant state; plants in non-coffee cells are never infected.
+    healthy_count : np.ndarray
+        (runs, rows, cols) number of healthy plants per cell, 0 for non-coffee cells.
+    score : np.ndarray
+        (runs, rows, cols) summed infectivity per cell.
+    active : np.ndarray
+        Flat indices into infection of the plants with 0 < infection < 1.
+    config : SimulationConfig
+        Simulation parameters.
+    rngs : list of np.random.Generator
+        Random generator of each replicate.
+    """
+    coffee: np.ndarray
+    infection: np.ndarray
+    infectivity: np.ndarray
+    resistance: np.ndarray
+    healthy_count: np.ndarray
+    score: np.ndarray
+    active: np.ndarray
+    config: SimulationConfig = field(default=DEFAULT_CONFIG, repr=False)
+    rngs: List[np.random.Generator] = field(default_factory=list, repr=False)
+
+    @classmethod
+    def from_landscapes(cls, landscapes: Iterable[pd.DataFrame], config: SimulationConfig = BATCH_CONFIG,
+                        rngs: Optional[List[np.random.Generator]] = None) -> "Batch":
+        """
+        Create a batch with one replicate per landscape and healthy plants in every coffee cell.
+
+        Parameters
+        ----------
+        landscapes : iterable of pd.DataFrame
+            Boolean landscapes from make_landscape, all of the same size.
+        config : SimulationConfig
+            Simulation parameters; plants_per_cell and resistance set up the plants.
+            neighbor_spread must be "convolution".
+        rngs : list of np.random.Generator, optional
+            Random generator of each replicate (default: replicate_rngs(None, runs)).
+        """
+        if config.neighbor_spread != "convolution":
+            raise ValueError(f"batches only implement the \"convolution\" neighbour spread rule, "
+                             f"not {config.neighbor_spread!r}")
+        plants_per_cell = config.plants_per_cell
+        # flat views below rely on C-contiguous state arrays
+        coffee = np.ascontiguousarray(np.stack([np.asarray(x, dtype=bool) for x in landscapes]))
+        shape = (coffee.shape[0], plants_per_cell) + coffee.shape[1:]
+        return cls(coffee=coffee, infection=np.zeros(shape), infectivity=np.zeros(shape),
+                   resistance=np.full(shape, config.resistance, dtype=float),
+                   healthy_count=coffee * plants_per_cell, score=np.zeros(coffee.shape),
+                   active=np.empty(0, dtype=np.int64), config=config,
+                   rngs=rngs if rngs is not None else replicate_rngs(None, coffee.shape[0]))
+
+    @property
+    def runs(self) -> int:
+        return self.coffee.shape[0]
+
+    @property
+    def plants_per_cell(self) -> int:
+        return self.infection.shape[1]
+
+    def cell_of(self, plants: np.ndarray) -> np.ndarray:
+        """Map flat plant indices to flat (runs, rows, cols) cell indices."""
+        n_grid = self.coffee[0].size
+        return plants // (self.plants_per_cell * n_grid) * n_grid + plants % n_grid
+
+    def infected_cells(self) -> np.ndarray:
+        """Boolean (runs, rows, cols) raster of coffee cells with at least one infected plant."""
+        return self.coffee & (self.healthy_count < self.plants_per_cell)
+
+
+def replicate_rngs(seed: Optional[int], runs: int, first: int = 0) -> List[np.random.Generator]:
+    """
+    Generators of replicates first .. first + runs - 1, from SeedSequence(seed, spawn_key=(z,)).
+    With seed None, a fresh entropy is shared by the replicates.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    return [np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(z,)))
+            for z in range(first, first + runs)]
+
+
+def make_landscapes(rngs: List[np.random.Generator], config: SimulationConfig = DEFAULT_CONFIG) -> List[pd.DataFrame]:
+    """Generate one landscape per replicate with make_landscape, seeded from its generator."""
+    return [make_landscape(config.size, config.cluster, config.proportions, int(rng.integers(2**32)))
+            for rng in rngs]
+
+
+def weather_schedules(rngs: List[np.random.Generator], config: SimulationConfig = DEFAULT_CONFIG) -> np.ndarray:
+    """
+    Draw the season's weather of every replicate up front with model.weather_schedule,
+    one vectorized call per replicate generator.
+
+    Returns
+    -------
+    np.ndarray
+        (runs, n_days, 3) boolean array of [within_cell, adjacent, global].
+    """
+    return np.stack([weather_schedule(config, rng) for rng in rngs])
+
+
+def neighbor_sum(raster: np.ndarray, wrap: bool = False) -> np.ndarray:
+    """
+    Sum of the 8 neighbours of every cell of a (runs, rows, cols) raster, with cells
+    outside the grid counting as 0, or, with ``wrap``, wrapping around its edges.
+    Equivalent to an 8-neighbourhood convolution over rows and columns only, never
+    across replicates.
+    """
+    # separable 3x3 box sum minus the centre cell
+    padded = np.pad(raster, ((0, 0), (1, 1), (1, 1)), mode="wrap" if wrap else "constant")
+    rows = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+    return rows[:, :, :-2] + rows[:, :, 1:-1] + rows[:, :, 2:] - raster
+
+
+def infect(batch: Batch, plants: np.ndarray) -> None:
+    """Infect the given flat plant indices, skipping plants that are already infected."""
+    plants = np.unique(plants)
+    infection = batch.infection.reshape(-1)
+    plants = plants[infection[plants] < 0.0001]
+    infection[plants] = batch.config.days
+    np.subtract.at(batch.healthy_count.reshape(-1), batch.cell_of(plants), 1)
+    batch.active = np.concatenate([batch.active, plants])
+
+
+def plant_index(batch: Batch, run: np.ndarray, plant: np.ndarray, row: np.ndarray, col: np.ndarray) -> np.ndarray:
+    """Flat index into infection of the given (run, plant, row, col) coordinates."""
+    return np.ravel_multi_index((run, plant, row, col), batch.infection.shape)
+
+
+def initial_infection(batch: Batch) -> None:
+    """
+    Infect one random plant in every replicate and one random plant in a coffee cell
+    adjacent to it.
+    """
+    n_plants, n_rows, n_cols = batch.infection.shape[1:]
+    wrap = batch.config.boundary == "toroidal"
+    seeds = []
+    for run in range(batch.runs):
+        rng = batch.rngs[run]
+        rows, cols = np.nonzero(batch.coffee[run])
+        k = rng.integers(rows.size)
+        r, c = rows[k], cols[k]
+        seeds.append((run, rng.integers(n_plants), r, c))
+        if wrap:
+            around = [((r + dr) % n_rows, (c + dc) % n_cols) for dr, dc in OFFSETS]
+        else:
+            around = [(r + dr, c + dc) for dr, dc in OFFSETS if 0 <= r + dr < n_rows and 0 <= c + dc < n_cols]
+        neighbors = [(nr, nc) for nr, nc in around if batch.coffee[run, nr, nc]]
+        if neighbors:
+            nr, nc = neighbors[rng.integers(len(neighbors))]
+            seeds.append((run, rng.integers(n_plants), nr, nc))
+    infect(batch, plant_index(batch, *np.array(seeds).T))
+
+
+def infect_first_healthy(batch: Batch, count: np.ndarray, threshold: float) -> None:
+    """
+    Infect the first ``count`` healthy plants of every cell; ``count`` is (runs, rows, cols)
+    and must be 0 for non-coffee cells. Only cells with a non-zero count are visited.
+    """
+    runs, rows, cols = np.nonzero(count)
+    healthy = batch.infection[runs, :, rows, cols] < threshold
+    rank = np.cumsum(healthy, axis=1) - 1
+    k, plant = np.nonzero(healthy & (rank < count[runs, rows, cols][:, np.newaxis]))
+    infect(batch, plant_index(batch, runs[k], plant, rows[k], cols[k]))
+
+
+def global_infection(batch: Batch, runs: np.ndarray) -> None:
+    """
+    Infect three random healthy plants (drawn with replacement) anywhere in the
+    landscape of each of the given replicates.
+    """
+    n_plants = batch.infection[0].size
+    for run in np.flatnonzero(runs):
+        healthy = np.flatnonzero(batch.coffee[run] & (batch.infection[run] < 0.0001))
+        infect(batch, run * n_plants + healthy[batch.rngs[run].integers(0, healthy.size, 3)])
+
+
+def progression(batch: Batch) -> None:
+    """
+    Progress the infection of all active plants, update their infectivity and the
+    cell scores, and drop plants that reached full infection from the active set.
+    """
+    active = batch.active
+    infection = progress_infection(batch.infection.reshape(-1)[active], batch.resistance.reshape(-1)[active],
+                                   batch.config)
+    infectivity = infectivity_of(infection, batch.config)
+    delta = infectivity - batch.infectivity.reshape(-1)[active]
+    batch.infection.reshape(-1)[active] = infection
+    batch.infectivity.reshape(-1)[active] = infectivity
+    batch.score += np.bincount(batch.cell_of(active), weights=delta,
+                               minlength=batch.score.size).reshape(batch.score.shape)
+    batch.active = active[infection < 1]
+
+
+def each_day(batch: Batch, day: int, weather: np.ndarray) -> np.ndarray:
+    """
+    Advance every replicate by one day.
+
+    Parameters
+    ----------
+    batch : Batch
+        State of all replicates, updated in place.
+    day : int
+        Current day number.
+    weather : np.ndarray
+        (runs, 3) weather of the day, a slice of weather_schedules.
+
+    Returns
+    -------
+    np.ndarray
+        (runs, 4) array of [infectivity_score, infected_cells, infected_plants, day].
+    """
+    progression(batch)
+
+    if weather[:, 0].any():
+        infected_cell = batch.infected_cells()
+        scores = batch.score.copy()
+
+        # within-cell spread: first healthy plant of each sufficiently infective cell
+        within = weather[:, 0, np.newaxis, np.newaxis] & infected_cell & (scores >= 0.4)
+        infect_first_healthy(batch, within.astype(np.int64), 0.001)
+
+        if weather[:, 1].any():
+            # neighbour spread: convolution rule on every replicate at once
+            healthy_count = batch.healthy_count
+            wrap = batch.config.boundary == "toroidal"
+            healthy_around = neighbor_sum(healthy_count.astype(float), wrap)
+            sources = weather[:, 1, np.newaxis, np.newaxis] & infected_cell & (scores >= 0.6)
+            source_weight = np.divide(0.8, healthy_around, out=np.zeros(healthy_around.shape),
+                                      where=sources & (healthy_around > 0))
+            pressure = neighbor_sum(source_weight, wrap)
+            new_infections = np.zeros(healthy_count.shape, dtype=np.int64)
+            for run in np.flatnonzero(weather[:, 1]):
+                new_infections[run] = batch.rngs[run].poisson(pressure[run] * healthy_count[run])
+            infect_first_healthy(batch, np.minimum(new_infections, healthy_count), 0.0001)
+
+            # global spread
+            total_score = np.where(infected_cell, scores, 0.0).sum(axis=(1, 2))
+            n_healthy = batch.healthy_count.sum(axis=(1, 2))
+            runs = weather[:, 2] & (n_healthy > 100) & (total_score >= 0.5)
+            if runs.any():
+                global_infection(batch, runs)
+
+    return daily_summary(batch, day)
+
+
+def daily_summary(batch: Batch, day: int) -> np.ndarray:
+    """Return the (runs, 4) array of [infectivity_score, infected_cells, infected_plants, day]."""
+    summary = np.empty((batch.runs, 4))
+    summary[:, 0] = batch.score.sum(axis=(1, 2))
+    summary[:, 1] = batch.infected_cells().sum(axis=(1, 2))
+    summary[:, 2] = (batch.coffee * batch.plants_per_cell - batch.healthy_count).sum(axis=(1, 2))
+    summary[:, 3] = day
+    return summary
+
+
+def infection_map(batch: Batch) -> np.ndarray:
+    """Return the (runs, rows, cols) map: 0 non-coffee, 1 coffee, 2 coffee with infected plants."""
+    return batch.coffee + batch.infected_cells().astype(np.int64)
+
+
+def calculate_returns(batch: Batch) -> np.ndarray:
+    """Return the total production of all plants for every replicate."""
+    production = (1 - 0.5 * batch.infection) * batch.config.max_production
+    return np.where(batch.coffee[:, np.newaxis], production, 0.0).sum(axis=(1, 2, 3))
+
+
+def run_batch(batch: Batch, n_days: Optional[int] = None, snapshot_days: Optional[Iterable[int]] = None,
+              weather: Optional[np.ndarray] = None) -> Dict[str, object]:
+    """
+    Run all replicates of a batch for a season.
+
+    Parameters
+    ----------
+    batch : Batch
+        Initially infected batch, updated in place.
+    n_days : int, optional
+        Number of days to simulate (default: the config's n_days).
+    snapshot_days : iterable of int, optional
+        Days after whose step the infection map of every replicate is kept.
+    weather : np.ndarray, optional
+        (runs, n_days, 3) schedules, or one (n_days, 3) schedule shared by all replicates;
+        drawn from the replicates' generators if not given.
+
+    Returns
+    -------
+    dict
+        "results": (runs, n_days, 4) daily results, "maps": {day: (runs, rows, cols) map},
+        "returns": (runs,) total production.
+    """
+    n_days = n_days or batch.config.n_days
+    if weather is None:
+        weather = weather_schedules(batch.rngs, dataclasses.replace(batch.config, n_days=n_days))
+    weather = np.broadcast_to(weather, (batch.runs, n_days, 3))
+    snapshot_days = set(snapshot_days or ())
+    results = np.empty((batch.runs, n_days, 4))
+    maps = {}
+    for day in range(n_days):
+        results[:, day] = each_day(batch, day, weather[:, day])
+        if day in snapshot_days:
+            maps[day] = infection_map(batch)
+    return {"results": results, "maps": maps, "returns": calculate_returns(batch)}
+
+
+def run_replicates(config: SimulationConfig = BATCH_CONFIG, runs: int = 10, seed: int = 0, batch_size: int = 256,
+                   out: Path = datadir / "batched") -> np.ndarray:
+    """
+    Run ``runs`` replicates, ``batch_size`` at a time, and write their map-*, results-*
+    and returns-{label}.csv files to ``out``.
+
+    Replicate z draws from SeedSequence(seed, spawn_key=(z,)) whatever the batch size.
+
+    Returns
+    -------
+    np.ndarray
+        (runs,) total production of every replicate.
+    """
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    label = config.label
+    returns = []
+    for first in range(0, runs, batch_size):
+        rngs = replicate_rngs(seed, min(batch_size, runs - first), first)
+        batch = Batch.from_landscapes(make_landscapes(rngs, config), config, rngs)
+        initial_infection(batch)
+        output = run_batch(batch, snapshot_days=range(0, config.n_days, config.snapshot_every))
+        for day, maps in output["maps"].items():
+            for k, landscaped in enumerate(maps):
+                write_map_csv(landscaped, day, first + k, config, out)
+        for k, daily in enumerate(output["results"]):
+            results = pd.DataFrame(daily, columns=["infection_score", "infected_cells", "infected_plants", "day"])
+            results = results.astype({"infected_cells": int, "infected_plants": int, "day": int})
+            results.to_csv(out / f"results-{first + k}-{label}.csv")
+        returns.append(output["returns"])
+        print(f"finished replicates {first} .. {first + batch.runs - 1} of {runs}")
+    returns = np.concatenate(returns) if returns else np.empty(0)
+    pd.DataFrame([(np.floor(x), runs) for x in returns]).to_csv(out / f"returns-{label}.csv")
+    return returns
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run batched replicates of the CLR-Landscape model "
+                                                 "(convolution neighbour spread).")
+    add_config_options(parser, BATCH_CONFIG, IGNORED_FIELDS)
+    parser.add_argument("--runs", type=int, default=10, help="number of replicates")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the replicates' streams")
+    parser.add_argument("--batch-size", type=int, default=256, help="replicates simulated together")
+    parser.add_argument("--datadir", type=Path, default=datadir / "batched", help="output directory")
+    args = parser.parse_args(argv)
+    config = dataclasses.replace(BATCH_CONFIG, **{f.name: getattr(args, f.name)
+                                                  for f in dataclasses.fields(SimulationConfig)
+                                                  if f.name not in IGNORED_FIELDS})
+    run_replicates(config, args.runs, args.seed, args.batch_size, args.datadir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the CLR-Landscape model.
+
+Times the day step of model.py (each_day) and its parts (within_cell_infection,
+neighbor_cell_infection, global_infection, save_intermediate_infected), and full
+365-day runs with simulate, over a matrix of grid size, plants per cell, coffee
+proportion, clustering and infected fraction. Landscapes are generated once with a
+fixed seed and kept in a LandscapeCache, and the infected plants and all random draws
+come from fixed seeds, so every run of the suite times the same work.
+
+Results are written as JSON, one record per (benchmark, case) with the timings of
+every repeat and the throughput in plant-days per second (plants times simulated
+days, divided by the best time). ``compare`` checks a result file against a stored
+baseline and exits with status 1 if any throughput fell by more than the tolerance:
+
+    python benchmark.py run --sizes 40,200 --output bench.json
+    python benchmark.py compare baseline.json bench.json --tolerance 0.1
+"""
+
+import argparse
+import dataclasses
+import itertools
+import json
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import model
+from array_engine import trajectory
+from landscape_cache import LandscapeCache
+from model import DEFAULT_CONFIG, CellIndex, Plant, SimulationConfig
+
+# Seed of the canonical landscapes, the infected plants and all draws
+SEED = 0
+
+DAY_BENCHMARKS = ("each_day", "within_cell_infection", "neighbor_cell_infection", "global_infection",
+                  "save_intermediate_infected")
+BENCHMARKS = DAY_BENCHMARKS + ("season",)
+
+
+@dataclass(frozen=True)
+class Case:
+    """One point of the benchmark matrix."""
+    size: int
+    plants_per_cell: int
+    coffee: float  # Coffee proportion of the landscape.
+    cluster: float
+    infected: float  # Fraction of infected plants at the start of a day benchmark.
+
+    def config(self, **changes) -> SimulationConfig:
+        return dataclasses.replace(DEFAULT_CONFIG, size=self.size, plants_per_cell=self.plants_per_cell,
+                                   proportions=(self.coffee, round(1 - self.coffee, 10)), cluster=self.cluster,
+                                   **changes)
+
+
+def case_matrix(sizes: List[int], plants_per_cell: List[int], coffee: List[float], clusters: List[float],
+                infected: List[float]) -> List[Case]:
+    """Return every combination of the given parameter values."""
+    return [Case(*values) for values in itertools.product(sizes, plants_per_cell, coffee, clusters, infected)]
+
+
+class DayState:
+    """
+    Plants of a case with a fixed set of infected plants, reset before every repeat.
+
+    The infected plants are drawn with the fixed seed and given the infection levels
+    of random days of their progression, so the cells hold a mix of latent and
+    infective plants as in the middle of a season.
+    """
+
+    def __init__(self, case: Case, cache: LandscapeCache) -> None:
+        self.config = case.config()
+        self.landscape = cache.for_config(self.config, model.landscape_seed(SEED, 0))
+        mask = np.asarray(self.landscape, dtype=bool)
+        self.plants = [Plant(grid=(int(r), int(c)), plant=j, resistance=self.config.resistance,
+                             production=self.config.production)
+                       for r, c in zip(*np.nonzero(mask)) for j in range(self.config.plants_per_cell)]
+        rng = np.random.default_rng(SEED)
+        levels = trajectory(self.config.resistance, self.config)
+        self.infection = np.zeros(len(self.plants))
+        infected = rng.choice(len(self.plants), int(round(case.infected * len(self.plants))), replace=False)
+        self.infection[infected] = levels[rng.integers(0, levels.size, infected.size)]
+
+    def reset(self) -> CellIndex:
+        """Restore the initial infection levels and return a fresh index."""
+        for plant, infection in zip(self.plants, self.infection):
+            plant.infection = float(infection)
+            plant.define_infectivity(self.config)
+        return CellIndex.build(self.plants, self.config)
+
+    def grid_scores(self, index: CellIndex) -> List[Tuple[Tuple[int, int], float]]:
+        """(cell, score) of the infected cells, as passed from within_cell to the spread rules."""
+        return [(cell, index.score[cell]) for cell in sorted(index.infected_cells)]
+
+
+def day_benchmark(name: str, state: DayState, datadir: Path) -> Callable[[], Callable[[], None]]:
+    """
+    Return a setup function for a day benchmark: it resets the state and returns the
+    call to time.
+    """
+    config = state.config
+    plants = state.plants
+
+    def setup() -> Callable[[], None]:
+        index = state.reset()
+        rng = np.random.default_rng(SEED)
+        if name == "each_day":
+            return partial(model.each_day, plants, 1, index, config, rng, np.array([True, True, True]))
+        if name == "within_cell_infection":
+            cells = sorted(index.infected_cells)
+            return lambda: [model.within_cell_infection(cell, plants, index, config) for cell in cells]
+        if name == "neighbor_cell_infection":
+            scores = [x for x in state.grid_scores(index) if x[0] in index.frontier]
+            return lambda: [model.neighbor_cell_infection(x, plants, index, config, rng) for x in scores]
+        if name == "global_infection":
+            return partial(model.global_infection, state.grid_scores(index), plants, index, config, rng)
+        if name == "save_intermediate_infected":
+            writer = partial(model.write_map_csv, datadir=datadir)
+            return partial(model.save_intermediate_infected, plants, state.landscape, 0, 0, config, index, writer)
+        raise ValueError(f"unknown benchmark: {name}")
+
+    return setup
+
+
+def time_repeats(setup: Callable[[], Callable[[], None]], repeat: int) -> List[float]:
+    """Time ``repeat`` calls, each prepared by ``setup`` outside the timed region."""
+    times = []
+    for _ in range(repeat):
+        call = setup()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def record(name: str, case: Case, engine: str, n_plants: int, n_days: int, times: List[float]) -> Dict:
+    """One result record; throughput is based on the best of the repeats."""
+    best = min(times)
+    return {"benchmark": name, "engine": engine, **dataclasses.asdict(case), "n_plants": n_plants,
+            "n_days": n_days, "times": times, "best": best, "median": float(np.median(times)),
+            "plant_days_per_s": n_plants * n_days / best}
+
+
+def key(result: Dict) -> Tuple:
+    """Identity of a record across result files."""
+    return (result["benchmark"], result["engine"], result["size"], result["plants_per_cell"],
+            result["coffee"], result["cluster"], result["infected"])
+
+
+def run_benchmarks(cases: List[Case], benchmarks: List[str], engines: List[str], repeat: int,
+                   cache: LandscapeCache, max_season_size: int,
+                   tilings: List[Tuple[int, int]] = ((1, 1), (2, 2))) -> List[Dict]:
+    """
+    Run the selected benchmarks on every case.
+
+    Day benchmarks time the model.py functions (with a CellIndex) on every case; the
+    season benchmark times simulate for each engine, once per case without regard to
+    the infected fraction (a season starts from the initial infection), and only up to
+    ``max_season_size``. The tiled engine runs once per tiling of ``tilings``, recorded
+    as engine "tiled-{rows}x{cols}", so its scaling with the number of worker processes
+    can be read off the throughputs.
+
+    Returns
+    -------
+    List[Dict]
+        One record per (benchmark, engine, case).
+    """
+    results = []
+    seasons = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in cases:
+            day_names = [name for name in benchmarks if name in DAY_BENCHMARKS]
+            if day_names:
+                state = DayState(case, cache)
+                for name in day_names:
+                    times = time_repeats(day_benchmark(name, state, Path(tmp)), repeat)
+                    results.append(record(name, case, "plants", len(state.plants), 1, times))
+                    print(f"{name:28s} {case} {min(times):.4f} s", flush=True)
+            season_case = dataclasses.replace(case, infected=0.0)
+            if "season" not in benchmarks or case.size > max_season_size or season_case in seasons:
+                continue
+            seasons.add(season_case)
+            landscape = cache.for_config(case.config(), model.landscape_seed(SEED, 0))
+            n_plants = int(np.count_nonzero(np.asarray(landscape))) * case.plants_per_cell
+            for engine in engines:
+                for tiles in (tilings if engine == "tiled" else [None]):
+                    config = case.config(simulation_engine=engine)
+                    name = engine
+                    if tiles is not None:
+                        config = dataclasses.replace(config, tiles=tuple(tiles))
+                        name = f"tiled-{tiles[0]}x{tiles[1]}"
+                    times = time_repeats(lambda: partial(model.simulate, config, SEED, landscape), repeat)
+                    results.append(record("season", season_case, name, n_plants, config.n_days, times))
+                    print(f"{'season ' + name:28s} {season_case} {min(times):.4f} s", flush=True)
+    return results
+
+
+def metadata() -> Dict:
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(baseline: List[Dict], current: List[Dict], tolerance: float) -> pd.DataFrame:
+    """
+    Join two result lists on their keys and compute the relative throughput change.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per record present in both, with the baseline and current throughput,
+        their ratio and whether it is a regression (ratio below 1 - tolerance).
+    """
+    base = {key(r): r["plant_days_per_s"] for r in baseline}
+    rows = []
+    for r in current:
+        if key(r) in base:
+            ratio = r["plant_days_per_s"] / base[key(r)]
+            rows.append(list(key(r)) + [base[key(r)], r["plant_days_per_s"], ratio, ratio < 1 - tolerance])
+    return pd.DataFrame(rows, columns=["benchmark", "engine", "size", "plants_per_cell", "coffee", "cluster",
+                                       "infected", "baseline", "current", "ratio", "regression"])
+
+
+def parse_list(kind: type) -> Callable[[str], list]:
+    return lambda value: [kind(x) for x in value.split(",")]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the CLR-Landscape model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmark matrix")
+    run.add_argument("--sizes", type=parse_list(int), default=[40, 200, 1000])
+    run.add_argument("--plants-per-cell", type=parse_list(int), default=[DEFAULT_CONFIG.plants_per_cell])
+    run.add_argument("--coffee", type=parse_list(float), default=[0.1, 0.4], help="coffee proportions")
+    run.add_argument("--clusters", type=parse_list(float), default=[DEFAULT_CONFIG.cluster])
+    run.add_argument("--infected", type=parse_list(float), default=[0.01, 0.1],
+                     help="infected fractions of the day benchmarks")
+    run.add_argument("--benchmarks", type=parse_list(str), default=list(BENCHMARKS),
+                     help=f"subset of {','.join(BENCHMARKS)}")
+    run.add_argument("--engines", type=parse_list(str), default=["plants", "arrays"],
+                     help="simulation engines of the season benchmark (tiled: once per --tiles entry)")
+    run.add_argument("--tiles", type=parse_list(lambda value: tuple(int(x) for x in value.split("x"))),
+                     default=[(1, 1), (2, 2)], help="tilings of the tiled engine, e.g. 1x1,2x2,2x4")
+    run.add_argument("--max-season-size", type=int, default=200, help="largest size of the season benchmark")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--landscape-cache", type=Path, default=model.datadir / "landscapes")
+    run.add_argument("--output", type=Path, default=Path("benchmark.json"))
+
+    comp = commands.add_parser("compare", help="compare a result file against a baseline")
+    comp.add_argument("baseline", type=Path)
+    comp.add_argument("current", type=Path)
+    comp.add_argument("--tolerance", type=float, default=0.1,
+                      help="largest accepted relative drop of throughput")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        unknown = set(args.benchmarks) - set(BENCHMARKS)
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        cases = case_matrix(args.sizes, args.plants_per_cell, args.coffee, args.clusters, args.infected)
+        results = run_benchmarks(cases, args.benchmarks, args.engines, args.repeat,
+                                 LandscapeCache(args.landscape_cache), args.max_season_size, args.tiles)
+        args.output.write_text(json.dumps({"meta": metadata(), "results": results}, indent=1))
+        print(f"wrote {len(results)} results to {args.output}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())["results"]
+    current = json.loads(args.current.read_text())["results"]
+    table = compare(baseline, current, args.tolerance)
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(table.to_string(index=False))
+    missing = len(current) - len(table)
+    if missing:
+        print(f"{missing} results have no baseline")
+    regressions = int(table["regression"].sum())
+    print(f"{regressions} regressions (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
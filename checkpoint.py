@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpoint/restart of single simulation runs.
+
+A Checkpoint is passed to model.simulate_days (or simulate / run_simulation), which
+saves the state of the engine to one .npz file every ``every`` simulated days: the
+day, the bit-generator state of the replicate's Generator, the landscape (bit-packed)
+and weather schedule, and the infection and infectivity of every plant (plus, for the
+plants engine, the running cell scores and the order of the infected plants, so the
+index is restored exactly). Plant production only changes at harvest and is not
+stored. The days already produced are not kept: the sinks attached to the checkpoint
+(see sinks.py) have persisted them, and each checkpoint only records the state of
+every sink (e.g. the offsets of CSVSink's files), so a checkpoint stays small however
+long the run.
+
+When the run is started again with the same Checkpoint, the sinks are restored to
+the saved state (dropping whatever they received after it), and simulate_days
+restores the engine and continues from the saved day; the outcome is bit-identical to
+an uninterrupted run. At the end the file is replaced by a small final checkpoint
+holding the harvest and the final sink state only, so a finished run is not simulated
+again until its owner (e.g. the sweep driver) has recorded it and calls remove. Files
+are written atomically, so a crash during a save keeps the previous checkpoint.
+"""
+
+import dataclasses
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from model import CellIndex, SimulationConfig
+from sinks import Sink
+
+
+class Checkpoint:
+    """
+    Checkpoint file of one run.
+
+    Parameters
+    ----------
+    path : Path
+        Checkpoint file (.npz); its directory is created if needed.
+    every : int
+        Simulated days between checkpoints (30: one per month).
+    """
+
+    def __init__(self, path: Path, every: int = 30) -> None:
+        self.path = Path(path)
+        self.every = every
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sinks: List[Sink] = []
+        self._next = every
+
+    @property
+    def spool(self) -> Path:
+        """Directory next to the checkpoint file for sinks that persist a run only until it is recorded."""
+        return self.path.parent / f"{self.path.stem}-days"
+
+    def attach(self, sinks: List[Sink]) -> None:
+        """Save the state of ``sinks`` with every checkpoint and restore it when the run is resumed."""
+        self.sinks = list(sinks)
+
+    # ---------------------------------------------------------------------------------
+    # Called by simulate_days
+    # ---------------------------------------------------------------------------------
+
+    def due(self, day: int) -> bool:
+        """Whether a checkpoint should be taken before simulating ``day``."""
+        return day >= self._next
+
+    def save(self, day: int, config: SimulationConfig, rng: np.random.Generator, landscape: pd.DataFrame,
+             weather: np.ndarray, plants: Any, index: Optional[CellIndex] = None) -> None:
+        """
+        Save the state of a run before simulating ``day``.
+
+        Parameters
+        ----------
+        day : int
+            Next day to simulate.
+        config : SimulationConfig
+            Simulation parameters, checked when the run is resumed.
+        rng : np.random.Generator
+            Random generator of the replicate.
+        landscape : pd.DataFrame
+            Landscape of the run.
+        weather : np.ndarray
+            Weather schedule of the run.
+        plants : List[Plant] or PlantArrays
+            Plants of the run.
+        index : CellIndex, optional
+            Cell index of the plants engine.
+        """
+        mask = np.asarray(landscape, dtype=bool)
+        arrays = {"landscape": np.packbits(mask), "landscape_shape": np.array(mask.shape),
+                  "weather": np.packbits(weather), "weather_shape": np.array(weather.shape),
+                  **plant_state(plants, index)}
+        self._write(day, config, {"rng": rng.bit_generator.state}, arrays)
+        self._next = day + self.every
+
+    def finish(self, config: SimulationConfig, coffee_cherries: float) -> None:
+        """Replace the checkpoint by the harvest of the finished run."""
+        self._write(config.n_days, config, {"coffee_cherries": coffee_cherries}, {})
+
+    def load(self, config: SimulationConfig) -> Optional[Dict[str, Any]]:
+        """
+        Read the checkpoint, if there is one, and restore the attached sinks to their
+        saved state.
+
+        Returns
+        -------
+        dict or None
+            day, rng (bit-generator state), landscape, weather, state (plant arrays)
+            and coffee_cherries (None unless the run is finished).
+
+        Raises
+        ------
+        ValueError
+            If the checkpoint was written by a run with a different configuration or
+            other sinks.
+        """
+        if not self.path.exists():
+            return None
+        with np.load(self.path, allow_pickle=False) as data:
+            files = {name: data[name] for name in data.files}
+        meta = json.loads(str(files.pop("meta")))
+        if meta["config"] != repr(config):
+            raise ValueError(f"checkpoint {self.path} belongs to {meta['config']}")
+        if "sinks" not in meta:
+            raise ValueError(f"checkpoint {self.path} was written by an older version that kept the days; "
+                             f"remove it")
+        if len(meta["sinks"]) != len(self.sinks):
+            raise ValueError(f"checkpoint {self.path} was saved with {len(meta['sinks'])} sinks, "
+                             f"not {len(self.sinks)}")
+        for sink, state in zip(self.sinks, meta["sinks"]):
+            sink.restore(state)
+        self._next = meta["day"] + self.every
+        resume = {"day": meta["day"], "rng": meta.get("rng"), "coffee_cherries": meta.get("coffee_cherries")}
+        if "landscape" in files:
+            shape = tuple(files.pop("landscape_shape"))
+            resume["landscape"] = pd.DataFrame(
+                np.unpackbits(files.pop("landscape"), count=int(np.prod(shape))).reshape(shape).astype(bool))
+            shape = tuple(files.pop("weather_shape"))
+            weather = np.unpackbits(files.pop("weather"), count=int(np.prod(shape)))
+            resume["weather"] = weather.reshape(shape).astype(bool)
+        resume["state"] = files
+        return resume
+
+    def restore(self, resume: Dict[str, Any], rng: np.random.Generator, plants: Any,
+                index: Optional[CellIndex] = None) -> None:
+        """Set the Generator and the plants of a freshly built run to the loaded state."""
+        rng.bit_generator.state = resume["rng"]
+        restore_plant_state(plants, resume["state"], index)
+
+    def remove(self) -> None:
+        """Delete the checkpoint file and its spool directory."""
+        self.path.unlink(missing_ok=True)
+        shutil.rmtree(self.spool, ignore_errors=True)
+
+    def _write(self, day: int, config: SimulationConfig, meta: Dict[str, Any],
+               arrays: Dict[str, np.ndarray]) -> None:
+        # the sinks have received every day before ``day``; their state points past it
+        sinks = [sink.state() for sink in self.sinks]
+        meta = {"day": day, "config": repr(config), "sinks": sinks, **meta}
+        arrays = {**arrays, "meta": np.array(json.dumps(meta))}
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self.path)
+
+
+def plant_state(plants: Any, index: Optional[CellIndex] = None) -> Dict[str, np.ndarray]:
+    """
+    Return the state of the plants (List[Plant] with its CellIndex, or PlantArrays)
+    as arrays.
+    """
+    if index is None:
+        return {"infection": plants.infection.copy(), "infectivity": plants.infectivity.copy()}
+    return {"infection": np.array([x.infection for x in plants]),
+            "infectivity": np.array([x.infectivity for x in plants]),
+            "cell_scores": np.array(list(index.score.values())),
+            "total_score": np.array(index.total_score),
+            "infected": np.array([index.position(x) for x in index.infected], dtype=np.int64)}
+
+
+def restore_plant_state(plants: Any, state: Dict[str, np.ndarray], index: Optional[CellIndex] = None) -> None:
+    """
+    Set the plants (and rebuild their CellIndex in place) from the arrays of plant_state.
+    The running scores and the order of the infected plants are restored as saved, so
+    the plants engine continues with bit-identical sums.
+    """
+    if index is None:
+        plants.infection[:] = state["infection"]
+        plants.infectivity[:] = state["infectivity"]
+        return
+    for plant, infection, infectivity in zip(plants, state["infection"].tolist(), state["infectivity"].tolist()):
+        plant.infection = infection
+        plant.infectivity = infectivity
+    fresh = CellIndex.build(plants, index.config)
+    for f in dataclasses.fields(CellIndex):
+        setattr(index, f.name, getattr(fresh, f.name))
+    index.score = dict(zip(index.score, state["cell_scores"].tolist()))
+    index.total_score = float(state["total_score"])
+    index.infected = [plants[i] for i in state["infected"].tolist()]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command-line entry point of the CLR-Landscape model.
+
+Runs a number of replicates of one configuration and writes the maps, daily results,
+snapshot compositions and returns to the data directory. Every field of model.SimulationConfig is available
+as an option (e.g. --size 80 --proportions 0.25,0.75 --simulation-engine arrays);
+tuple fields take comma-separated values. With --seed, the landscape and weather of
+replicate z come from their own streams (model.landscape_seed, model.weather_rng), so
+runs with different parameters share them; --landscape-cache caches the landscapes on
+disk across invocations. With --store the results are appended to
+a columnar result store (result_store.py) instead. --phase-timing records the wall
+time of every phase of the day step (phase_timer.py) and writes it per replicate as
+phases-{z}-{label}.csv and as a Chrome trace, trace-{z}-{label}.json.
+"""
+
+import argparse
+import dataclasses
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import model
+import sinks
+from model import DEFAULT_CONFIG, SimulationConfig
+from landscape_cache import LandscapeCache
+from phase_timer import PhaseTimer
+
+
+# Map writers selectable with --map-format
+MAP_WRITERS = {"csv": model.write_map_csv, "npy": model.write_map_npy}
+
+
+def parse_tuple(value: str) -> tuple:
+    return tuple(float(x) if "." in x else int(x) for x in value.split(","))
+
+
+def parse_bool(value: str) -> bool:
+    if value.lower() not in ("true", "false", "1", "0", "yes", "no"):
+        raise argparse.ArgumentTypeError(f"expected true or false, got {value!r}")
+    return value.lower() in ("true", "1", "yes")
+
+
+def add_config_options(parser: argparse.ArgumentParser, defaults: SimulationConfig = DEFAULT_CONFIG,
+                       exclude: Tuple[str, ...] = ()) -> None:
+    """Add one option per SimulationConfig field not in ``exclude``, defaulting to ``defaults``."""
+    for f in dataclasses.fields(SimulationConfig):
+        if f.name in exclude:
+            continue
+        default = getattr(defaults, f.name)
+        if isinstance(default, tuple):
+            kind = parse_tuple
+        elif isinstance(default, bool):
+            kind = parse_bool
+        else:
+            kind = type(default)
+        parser.add_argument("--" + f.name.replace("_", "-"), dest=f.name, type=kind, default=default,
+                            help=f"default: {default}")
+
+
+def make_parser() -> argparse.ArgumentParser:
+    """Return a parser with one option per SimulationConfig field, plus the run options."""
+    parser = argparse.ArgumentParser(description="Run the CLR-Landscape model.")
+    add_config_options(parser)
+    parser.add_argument("--runs", type=int, default=10, help="number of replicates")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the first replicate's stream")
+    parser.add_argument("--datadir", type=Path, default=model.datadir, help="output directory")
+    parser.add_argument("--landscape-cache", type=Path, nargs="?", const=model.datadir / "landscapes", default=None,
+                        help="cache landscapes on disk (default directory: data/landscapes); needs --seed")
+    parser.add_argument("--cache-mb", type=int, default=256, help="disk budget of the landscape cache in MB")
+    parser.add_argument("--map-format", choices=sorted(MAP_WRITERS), default="csv",
+                        help="file format of the infection maps written to --datadir")
+    parser.add_argument("--store", type=Path, nargs="?", const=model.datadir / "store", default=None,
+                        help="write to a columnar result store (default directory: data/store) instead of CSV files")
+    parser.add_argument("--phase-timing", action="store_true",
+                        help="write per-phase timings and a Chrome trace of every replicate to --datadir")
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> SimulationConfig:
+    return SimulationConfig(**{f.name: getattr(args, f.name) for f in dataclasses.fields(SimulationConfig)})
+
+
+def run(config: SimulationConfig, runs: int, seed: Optional[int] = None,
+        datadir: Path = model.datadir, store: Optional[Path] = None, map_format: str = "csv",
+        cache: Optional[LandscapeCache] = None, phase_timing: bool = False) -> List[float]:
+    """
+    Run ``runs`` replicates, writing map-*, results-* and returns-{label}.csv, or
+    appending them to the result store at ``store``.
+
+    Replicate z is seeded from SeedSequence(seed, spawn_key=(z,)) when a seed is given,
+    its landscape from landscape_seed(seed, z), loaded through ``cache`` if given, and
+    its weather from weather_rng(seed, z). With ``phase_timing``, the phase timings of
+    every replicate are written to ``datadir`` as CSV and Chrome trace.
+
+    Returns
+    -------
+    List[float]
+        Harvested coffee cherries of every replicate.
+    """
+    returns = []
+    results = None
+    if store is not None:
+        # imported here so that CSV runs and the importers of add_config_options do not need pyarrow
+        from result_store import ResultStore
+        results = ResultStore(store, write=True)
+    try:
+        for z in range(runs):
+            print(f"Starting run {z}")
+            seed_z = None if seed is None else np.random.SeedSequence(seed, spawn_key=(z,))
+            landscape = None
+            weather = None
+            if seed is not None:
+                weather = model.weather_schedule(config, model.weather_rng(seed, z))
+                l_seed = model.landscape_seed(seed, z)
+                if cache is not None:
+                    landscape = cache.for_config(config, l_seed)
+                else:
+                    landscape = model.make_landscape(config.size, config.cluster, config.proportions, l_seed)
+            timer = PhaseTimer() if phase_timing else None
+            if results is None:
+                # days are written as they are simulated
+                days = model.simulate_days(config, seed_z, landscape, weather, timer)
+                writer = partial(MAP_WRITERS[map_format], datadir=datadir)
+                coffee_cherries = sinks.run_pipeline(days, [sinks.CSVSink(z, config, datadir, writer)])
+            else:
+                result = model.simulate(config, seed_z, landscape, weather, timer)
+                results.write(result, z)
+                coffee_cherries = result.coffee_cherries
+            if timer is not None:
+                Path(datadir).mkdir(parents=True, exist_ok=True)
+                timer.per_day().to_csv(F"{datadir}/phases-{z}-{config.label}.csv", index=False)
+                timer.write_chrome_trace(datadir / f"trace-{z}-{config.label}.json")
+            returns.append((coffee_cherries, runs))
+    finally:
+        # close the store even if a run fails, so the runs written so far are readable
+        if results is not None:
+            results.close()
+
+    if results is None:
+        b = pd.DataFrame(returns)
+        b.to_csv(F"{datadir}/returns-{config.label}.csv")
+    return [x for x, _ in returns]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.landscape_cache is not None and args.seed is None:
+        parser.error("--landscape-cache needs --seed")
+    cache = None if args.landscape_cache is None else LandscapeCache(args.landscape_cache, args.cache_mb * 2**20)
+    run(config_from_args(args), args.runs, args.seed, args.datadir, args.store, args.map_format, cache,
+        args.phase_timing)
+
+
+if __name__ == "__main__":
+    main()
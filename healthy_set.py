@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indexable set of healthy plants.
+
+HealthySet holds a subset of the positions 0 .. size - 1 of a plant list in a Fenwick
+(binary indexed) tree of membership counts. Besides membership and removal it answers
+"which member is the k-th smallest" (select) and "how many members lie before
+position i" (rank), each in O(log size) without listing the members. The spread rules
+draw a uniform index into the healthy plants in plant-list order, so a draw resolves
+to the same plant as indexing a sorted list of all healthy positions, but only costs
+a descent of the tree; the global phase no longer scans the population, and the
+draws stay those of the other engines (and of a run restored from a checkpoint).
+"""
+
+from array import array
+from typing import Iterator
+
+import numpy as np
+
+
+class HealthySet:
+    """
+    Subset of 0 .. size - 1 with O(log size) removal, rank and select.
+
+    Parameters
+    ----------
+    size : int
+        Number of positions; the set starts empty.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        # Python arrays rather than NumPy ones: the tree is walked one element at a time
+        self._present = bytearray(size)
+        # 1-based Fenwick tree: node i counts the members in positions [i - lowbit(i), i)
+        self._tree = array("q", bytes(8 * (size + 1)))
+        self._count = 0
+        self._top = 1 << max(size.bit_length() - 1, 0)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "HealthySet":
+        """Build in O(size) from a boolean membership mask."""
+        mask = np.asarray(mask, dtype=bool)
+        healthy = cls(mask.size)
+        healthy._present[:] = mask.view(np.uint8).tobytes()
+        prefix = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        nodes = np.arange(mask.size + 1)
+        tree = prefix[nodes] - prefix[nodes - (nodes & -nodes)]
+        healthy._tree = array("q", tree.astype(np.int64).tobytes())
+        healthy._count = int(prefix[-1])
+        return healthy
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, position: int) -> bool:
+        return bool(self._present[position])
+
+    def __iter__(self) -> Iterator[int]:
+        """Members in ascending order."""
+        return iter(np.flatnonzero(np.frombuffer(self._present, dtype=np.uint8)).tolist())
+
+    def discard(self, position: int) -> None:
+        """Remove a position if it is a member."""
+        if not self._present[position]:
+            return
+        self._present[position] = 0
+        self._count -= 1
+        tree = self._tree
+        i = position + 1
+        while i <= self.size:
+            tree[i] -= 1
+            i += i & -i
+
+    def rank(self, position: int) -> int:
+        """Number of members smaller than ``position``."""
+        tree = self._tree
+        total = 0
+        i = position
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def select(self, k: int) -> int:
+        """The k-th smallest member (0-based), as ``sorted(self)[k]``."""
+        if not 0 <= k < self._count:
+            raise IndexError(f"member {k} of a set of {self._count}")
+        tree = self._tree
+        position = 0
+        step = self._top
+        while step:
+            node = position + step
+            if node <= self.size and tree[node] <= k:
+                position = node
+                k -= tree[node]
+            step >>= 1
+        return position
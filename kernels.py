@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Numba-compiled daily step kernel for the array engine.
+
+The kernel covers the whole each_day transition (progression, latency-gated
+infectivity, within-cell, neighbour ("cell" rule) and global spread, daily summary)
+on the flat arrays of a PlantArrays store, with the day's weather taken from a pre-drawn
+weather_schedule. Random draws come from the replicate's
+numpy.random.Generator, which Numba advances in place, so compiled and Python code
+share one stream. Functions are compiled with cache=True so worker processes reuse
+the compiled code.
+"""
+
+import dataclasses
+from typing import List, Optional
+
+import numpy as np
+from numba import njit
+
+from array_engine import PlantArrays
+from model import default_rng, weather_effects, weather_schedule
+
+
+@njit(cache=True)
+def day_step(rng, weather, infection, infectivity, resistance, cell, cell_start, indptr, indices,
+             thresholds, scaling, days):
+    """
+    Advance all plants by one day in place under the day's [within_cell, adjacent, global] weather.
+
+    Returns
+    -------
+    tuple
+        (infectivity_score, infected_cells, infected_plants)
+    """
+    n_plants = infection.size
+    n_cells = cell_start.size - 1
+    weather_cell = weather[0]
+    weather_adjacent = weather[1]
+    weather_grid = weather[2]
+
+    # progression and infectivity of infected plants
+    latency = 20 * days
+    infected_cell = np.zeros(n_cells, dtype=np.bool_)
+    scores = np.zeros(n_cells)
+    for i in range(n_plants):
+        x = infection[i]
+        if x > 0.0001:
+            if x < 1:
+                k = 0
+                while k < thresholds.size and x >= thresholds[k]:
+                    k += 1
+                x = x + scaling[k] * days * resistance[i]
+            if x > 1:
+                x = 1.0
+            infection[i] = x
+            infectivity[i] = 0.0 if x < latency else x
+            infected_cell[cell[i]] = True
+            scores[cell[i]] += infectivity[i]
+
+    if weather_cell:
+        # within-cell spread: first healthy plant of each sufficiently infective cell
+        for c in range(n_cells):
+            if infected_cell[c] and scores[c] >= 0.4:
+                for i in range(cell_start[c], cell_start[c + 1]):
+                    if infection[i] < 0.001:
+                        infection[i] = days
+                        break
+
+        if weather_adjacent:
+            # neighbour spread: one healthy plant in an adjacent coffee cell (CSR neighbour lists)
+            for c in range(n_cells):
+                if not infected_cell[c]:
+                    continue
+                neighbors = indices[indptr[c]:indptr[c + 1]]
+                n_healthy = 0
+                for j in range(neighbors.size):
+                    for i in range(cell_start[neighbors[j]], cell_start[neighbors[j] + 1]):
+                        if infection[i] < 0.0001:
+                            n_healthy += 1
+                a = max(1, rng.integers(0, n_healthy + 1))
+                if scores[c] < 0.6 or n_healthy < 1:
+                    continue
+                if rng.random() < 0.8:
+                    seen = 0
+                    for j in range(neighbors.size):
+                        for i in range(cell_start[neighbors[j]], cell_start[neighbors[j] + 1]):
+                            if infection[i] < 0.0001:
+                                seen += 1
+                                if seen == a:
+                                    infection[i] = days
+                                    break
+                        if seen == a:
+                            break
+
+            if weather_grid:
+                # global spread: three random healthy plants anywhere
+                total_score = 0.0
+                for c in range(n_cells):
+                    if infected_cell[c]:
+                        total_score += scores[c]
+                healthy = np.flatnonzero(infection < 0.0001)
+                if healthy.size > 100 and total_score >= 0.5:
+                    for _ in range(3):
+                        infection[healthy[rng.integers(0, healthy.size)]] = days
+
+    # daily summary
+    infectivity_score = 0.0
+    infected_plants = 0
+    infected_cell[:] = False
+    for i in range(n_plants):
+        infectivity_score += infectivity[i]
+        if infection[i] > 0.001:
+            infected_plants += 1
+            infected_cell[cell[i]] = True
+    return infectivity_score, np.count_nonzero(infected_cell), infected_plants
+
+
+@njit(cache=True)
+def run_season(rng, weather, infection, infectivity, resistance, cell, cell_start, indptr, indices,
+               thresholds, scaling, days):
+    """
+    Run day_step for every day of the (n_days, 3) weather schedule and return the
+    (n_days, 4) daily results [infectivity_score, infected_cells, infected_plants, day].
+    """
+    n_days = weather.shape[0]
+    results = np.empty((n_days, 4))
+    for day in range(n_days):
+        score, cells, plants = day_step(rng, weather[day], infection, infectivity, resistance, cell,
+                                        cell_start, indptr, indices, thresholds, scaling, days)
+        results[day, 0] = score
+        results[day, 1] = cells
+        results[day, 2] = plants
+        results[day, 3] = day
+    return results
+
+
+def _kernel_args(plants: PlantArrays) -> tuple:
+    config = plants.config
+    if config.neighbor_spread != "cell":
+        raise ValueError("the numba kernels only implement the \"cell\" neighbour spread rule")
+    thresholds = np.asarray(config.progression_cutoff, dtype=float) * config.days
+    scaling = np.append(np.asarray(config.progression_scaling, dtype=float), 20.0)
+    return (plants.infection, plants.infectivity, plants.resistance, plants.cell, plants.cell_start,
+            plants.landscape.indptr, plants.landscape.indices, thresholds, scaling, config.days)
+
+
+def each_day(plants: PlantArrays, day: int, rng: Optional[np.random.Generator] = None,
+             weather: Optional[np.ndarray] = None) -> List[float]:
+    """
+    Compiled equivalent of array_engine.each_day.
+
+    Parameters
+    ----------
+    plants : PlantArrays
+        Plant store, updated in place.
+    day : int
+        Current day number.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
+    weather : np.ndarray, optional
+        The day's row of a weather_schedule; drawn with weather_effects if not given.
+
+    Returns
+    -------
+    List[float]
+        [infectivity_score, infected_cells, infected_plants, day_number]
+    """
+    rng = rng or default_rng
+    if weather is None:
+        weather = weather_effects(day, plants.config, rng)
+    weather = np.asarray(weather, dtype=np.bool_)
+    score, cells, infected = day_step(rng, weather, *_kernel_args(plants))
+    return [score, int(cells), int(infected), day]
+
+
+def each_season(plants: PlantArrays, n_days: int = 365, rng: Optional[np.random.Generator] = None,
+                weather: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Run a whole season inside the kernel; returns the (n_days, 4) daily results. The
+    weather schedule is drawn up front from ``rng`` if not given.
+    """
+    rng = rng or default_rng
+    if weather is None:
+        weather = weather_schedule(dataclasses.replace(plants.config, n_days=n_days), rng)
+    return run_season(rng, weather, *_kernel_args(plants))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of generated landscapes.
+
+Generating a neutral landscape with nlmpy is the slowest single step of a run on large
+grids. The cache stores each coffee/non-coffee mask as a bit-packed .npy file (one bit
+per cell) named after all generation parameters and the landscape seed, so every
+landscape of a sweep is generated once and shared by all configurations that only
+differ in weather, resistance or other simulation parameters. Files are written
+atomically, so worker processes can share one cache directory. The cache is kept
+within a disk budget by evicting the least recently used files; a cache hit refreshes
+the file's modification time.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from model import SimulationConfig, datadir, make_landscape
+
+
+class LandscapeCache:
+    """
+    Bit-packed landscape files under ``path``, kept within ``max_bytes``.
+
+    Parameters
+    ----------
+    path : Path
+        Cache directory, created if needed.
+    max_bytes : int
+        Disk budget of the cache.
+    """
+
+    def __init__(self, path: Path = datadir / "landscapes", max_bytes: int = 256 * 2**20) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def file(self, size: int, cluster: float, proportions: Tuple[float, ...], seed: int) -> Path:
+        """Cache file of a landscape; the name holds every generation parameter."""
+        p = "_".join(repr(float(x)) for x in proportions)
+        return self.path / f"landscape-{size}-{float(cluster)!r}-{p}-{seed}.npy"
+
+    def get(self, size: int, cluster: float, proportions: Tuple[float, ...], seed: int) -> pd.DataFrame:
+        """
+        Return the landscape generated by make_landscape(size, cluster, proportions, seed),
+        loading it from the cache or generating and storing it.
+        """
+        file = self.file(size, cluster, proportions, seed)
+        try:
+            packed = np.load(file)
+        except (FileNotFoundError, ValueError, EOFError):
+            landscape = make_landscape(size, cluster, proportions, seed)
+            self._store(file, np.asarray(landscape, dtype=bool))
+            return landscape
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            # evicted by another worker after the load; the data read is still valid
+            pass
+        mask = np.unpackbits(packed, count=size * size).reshape(size, size).astype(bool)
+        return pd.DataFrame(mask)
+
+    def for_config(self, config: SimulationConfig, seed: int) -> pd.DataFrame:
+        """Return the landscape of ``config`` with the given landscape seed."""
+        return self.get(config.size, config.cluster, config.proportions, seed)
+
+    def _store(self, file: Path, mask: np.ndarray) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.packbits(mask))
+        os.replace(tmp, file)
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used files until the cache fits its budget."""
+        files = []
+        for file in self.path.glob("landscape-*.npy"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+        total = sum(size for _, size, _ in files)
+        for _, size, file in sorted(files):
+            if total <= self.max_bytes:
+                break
+            file.unlink(missing_ok=True)
+            total -= size
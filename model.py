@@ -3,54 +3,106 @@
 """
 CLR-Landscape Model
 
-This script simulates Coffee Leaf Rust (CLR) infection spread in a neutral landscape
+This module simulates Coffee Leaf Rust (CLR) infection spread in a neutral landscape
 composed of coffee and non-coffee cells. It models infection progression, daily weather
 effects on transmission, and ultimately calculates coffee berry yields.
+
+All parameters live in a frozen SimulationConfig, and simulate(config, seed) runs one
+replicate and returns its results without touching the filesystem. simulate_days runs
+a replicate as a stream of days instead, for the sinks of sinks.py. Importing the
+module has no side effects; clr_landscape.py is the command-line entry point.
+
+Every stochastic function draws from a numpy.random.Generator passed as ``rng``.
+simulate creates one Generator per replicate from its seed (an int or a SeedSequence
+spawned per configuration and replicate), so replicates are reproducible one by one,
+independent of the process they run in.
 """
 
-from nlmpy import nlmpy
+import glob
 import pandas as pd
-from dataclasses import dataclass
-import random
+from dataclasses import dataclass, field
+from functools import partial
 import numpy as np
 from pathlib import Path
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Generator, List, Optional, Set, Tuple, Union
 
-# -------------------------------------------------------------------------------------
-# Global Parameters
-# -------------------------------------------------------------------------------------
+from healthy_set import HealthySet
+from phase_timer import NULL_TIMER, NullTimer, PhaseTimer
+from sparse_landscape import SparseLandscape
 
-# Data directory path
+if TYPE_CHECKING:
+    import checkpoint
+
+# Data directory path (created by the writers, not on import)
 datadir: Path = Path.cwd() / "data"
-datadir.mkdir(exist_ok=True)
-
-# Grid parameters
-size: int = 40  # The x,y size of the grid.
-cluster: float = 0.4  # Clustering parameter (0-1) for the neutral landscape model.
-proportions: List[float] = [0.4, 0.6]  # Proportions of coffee vs. non-coffee in the landscape.
-plants_per_cell: int = 8  # Number of plants placed in each coffee cell.
-
-# Plant production parameters
-max_production: int = 4000  # Typical production of coffee beans per plant.
-resistance: float = 1.0  # Base resistance of the plant (1 = no extra resistance).
-production: float = 1.0  # Base production percentage (1 = 100% production).
-
-# Weather parameters affecting infection
-weather_within_cell_dry: float = 0.2  # Probability of infection within the same cell in dry conditions.
-weather_within_cell_wet: float = 0.7  # Probability of infection within the same cell in wet conditions.
-weather_adj: float = 0.6  # Probability that infection spreads to adjacent cells.
-weather_cluster: float = 0.05  # Probability that infection spreads beyond adjacent cells (clusters).
-
-# Infection progression parameters
-days: float = 1 / 365  # Days used for infection progression speed (1/365 for daily).
-progression_cutoff: List[int] = [20, 40, 60, 120]  # Infection progression cutoffs in days.
-progression_scaling: List[int] = [1, 4, 8, 16]  # Scaling factors for infection progression at cutoffs.
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    """
+    All parameters of a simulation run.
+
+    Being frozen, a config can be shared between workers, used as a dictionary key and
+    varied per call with dataclasses.replace.
+    """
+    # Grid parameters
+    size: int = 40  # The x,y size of the grid.
+    cluster: float = 0.4  # Clustering parameter (0-1) for the neutral landscape model.
+    proportions: Tuple[float, ...] = (0.4, 0.6)  # Proportions of coffee vs. non-coffee in the landscape.
+    plants_per_cell: int = 8  # Number of plants placed in each coffee cell.
+
+    # Plant production parameters
+    max_production: int = 4000  # Typical production of coffee beans per plant.
+    resistance: float = 1.0  # Base resistance of the plant (1 = no extra resistance).
+    production: float = 1.0  # Base production percentage (1 = 100% production).
+
+    # Weather parameters affecting infection
+    weather_within_cell_dry: float = 0.2  # Probability of infection within the same cell in dry conditions.
+    weather_within_cell_wet: float = 0.7  # Probability of infection within the same cell in wet conditions.
+    weather_adj: float = 0.6  # Probability that infection spreads to adjacent cells.
+    weather_cluster: float = 0.05  # Probability that infection spreads beyond adjacent cells (clusters).
+
+    # Infection progression parameters
+    days: float = 1 / 365  # Days used for infection progression speed (1/365 for daily).
+    progression_cutoff: Tuple[int, ...] = (20, 40, 60, 120)  # Infection progression cutoffs in days.
+    progression_scaling: Tuple[int, ...] = (1, 4, 8, 16)  # Scaling factors for infection progression at cutoffs.
+
+    # Simulation parameters
+    n_days: int = 365  # Number of simulated days.
+    snapshot_every: int = 120  # Keep an infection map every this many days.
+    simulation_engine: str = "plants"  # "plants" (List[Plant], below), "arrays" (NumPy struct-of-arrays,
+                                       # array_engine.py), "numba" (arrays advanced by kernels.py) or
+                                       # "tiled" (arrays split over worker processes, tiled.py).
+    neighbor_spread: str = "cell"  # Neighbour spread rule: "cell" (one source cell at a time, as
+                                   # neighbor_cell_infection) or "convolution" (all cells at once, as a sparse
+                                   # adjacency product; "arrays" and "tiled" engines only).
+    fast_forward: bool = True  # Advance runs of days without spread weather in one jump (see fast_forward).
+    tiles: Tuple[int, ...] = (2, 2)  # Rows and columns of tiles of the "tiled" engine, one worker process each.
+    boundary: str = "bounded"  # Edges of the grid: "bounded" (edge cells have fewer neighbours) or "toroidal"
+                               # (opposite edges are adjacent, so every cell has 8 neighbour cells).
+
+    @property
+    def label(self) -> str:
+        """Configuration part of the output file names, e.g. "[0.4, 0.6]-0.4"."""
+        return f"{list(self.proportions)}-{self.cluster}"
+
+
+DEFAULT_CONFIG = SimulationConfig()
+
+# Generator used when no rng is passed (unseeded)
+default_rng: np.random.Generator = np.random.default_rng()
+
+# spawn_key prefixes of the landscape and weather streams, kept apart from the replicate streams
+LANDSCAPE_STREAM: int = 2**32 - 1
+WEATHER_STREAM: int = 2**32 - 2
 
 #######################################
 # make landscape
 #######################################
 
-def make_landscape(size: int, cluster: float) -> pd.DataFrame:
+def make_landscape(size: int, cluster: float,
+                   proportions: Tuple[float, ...] = DEFAULT_CONFIG.proportions,
+                   seed: Optional[int] = None) -> pd.DataFrame:
     """
     Generate a neutral landscape model using randomClusterNN and classify cells
     into coffee (True) vs. non-coffee (False) based on specified proportions.
@@ -61,17 +113,41 @@ def make_landscape(size: int, cluster: float) -> pd.DataFrame:
         Size of the grid (x and y dimensions).
     cluster : float
         Clustering parameter (0 to 1).
+    proportions : tuple
+        Proportions of coffee vs. non-coffee cells.
+    seed : int, optional
+        Seed of the landscape. nlmpy draws from NumPy's global generator, which is
+        seeded for the generation and restored afterwards, so a seeded landscape does
+        not consume draws of the simulation.
 
     Returns
     -------
     pd.DataFrame
         DataFrame with boolean values indicating coffee (True) or non-coffee (False).
     """
-    landscape = nlmpy.randomClusterNN(size, size, cluster, "8-neighbourhood")
-    landscape = pd.DataFrame(nlmpy.classifyArray(landscape, proportions))
+    # nlmpy pulls in numba, so it is only imported when a landscape is needed
+    from nlmpy import nlmpy
+
+    if seed is not None:
+        state = np.random.get_state()
+        np.random.seed(seed)
+    try:
+        landscape = nlmpy.randomClusterNN(size, size, cluster, "8-neighbourhood")
+        landscape = pd.DataFrame(nlmpy.classifyArray(landscape, list(proportions)))
+    finally:
+        if seed is not None:
+            np.random.set_state(state)
     landscape = landscape.astype(bool)
     return landscape
 
+
+def landscape_seed(seed: int, run: int) -> int:
+    """
+    Seed of the landscape of replicate ``run``. It does not depend on the configuration,
+    so configurations with the same size, cluster and proportions share their landscapes.
+    """
+    return int(np.random.SeedSequence(seed, spawn_key=(LANDSCAPE_STREAM, run)).generate_state(1)[0])
+
 @dataclass
 class Plant:
     """
@@ -103,13 +179,14 @@ class Plant:
     resistance: float = 1.0  # resistance to CLR slows spread of the virus
     cost: int = 100
 
-    def progression(self) -> None:
+    def progression(self, config: SimulationConfig = DEFAULT_CONFIG) -> None:
         """
         Progress the infection level based on defined cutoffs and scaling factors.
         Caps infection at 1.
         """
+        days = config.days
         if 0 < self.infection < 1:
-            for cutoff, scaling in zip(progression_cutoff, progression_scaling):
+            for cutoff, scaling in zip(config.progression_cutoff, config.progression_scaling):
                 if self.infection < cutoff * days:
                     self.infection += scaling * days * self.resistance
                     break
@@ -118,14 +195,14 @@ class Plant:
         if self.infection > 1:
             self.infection = 1.0
 
-    def get_production(self) -> None:
+    def get_production(self, config: SimulationConfig = DEFAULT_CONFIG) -> None:
         """
         Calculate the production of coffee berries based on infection level.
         Production decreases with higher infection.
         """
-        self.production = (1 - 0.5 * self.infection) * max_production
+        self.production = (1 - 0.5 * self.infection) * config.max_production
 
-    def define_infectivity(self) -> float:
+    def define_infectivity(self, config: SimulationConfig = DEFAULT_CONFIG) -> float:
         """
         Defines infectivity based on the infection level and a latency period.
 
@@ -134,14 +211,14 @@ class Plant:
         float
             Updated infectivity value.
         """
-        if self.infection < 20 * days:
+        if self.infection < 20 * config.days:
             self.infectivity = 0.0
         else:
             self.infectivity = self.infection
         return self.infectivity
 
 
-def get_harvest(myplants: List[Plant]) -> float:
+def get_harvest(myplants: List[Plant], config: SimulationConfig = DEFAULT_CONFIG) -> float:
     """
     Calculate the total coffee berries harvested based on plant production.
 
@@ -149,6 +226,8 @@ def get_harvest(myplants: List[Plant]) -> float:
     ----------
     myplants : List[Plant]
         List of all Plant instances in the simulation.
+    config : SimulationConfig
+        Simulation parameters.
 
     Returns
     -------
@@ -157,11 +236,12 @@ def get_harvest(myplants: List[Plant]) -> float:
     """
     total_berries: float = 0.0
     for plant in myplants:
-        total_berries += max_production * plant.production
+        total_berries += config.max_production * plant.production
     return total_berries
 
 
-def weather_effects(day: int) -> List[bool]:
+def weather_effects(day: int, config: SimulationConfig = DEFAULT_CONFIG,
+                    rng: Optional[np.random.Generator] = None) -> List[bool]:
     """
     Define whether weather conditions are favorable for spreading infection on a given day.
     Returns three booleans indicating:
@@ -173,25 +253,30 @@ def weather_effects(day: int) -> List[bool]:
     ----------
     day : int
         Current day of the simulation.
+    config : SimulationConfig
+        Simulation parameters.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
 
     Returns
     -------
     List[bool]
         [within_cell, adjacent, global]
     """
-    if day < 180:
-        cell = random.uniform(0, 1) < weather_within_cell_dry
+    rng = rng or default_rng
+    if day % 365 < 180:
+        cell = rng.random() < config.weather_within_cell_dry
     else:
-        cell = random.uniform(0, 1) < weather_within_cell_wet
+        cell = rng.random() < config.weather_within_cell_wet
     cluster = False
     grid = False
 
     # if it is, is weather ok to spread further to neighboring grids (small wind, normal conditions)
     if cell:
-        cluster = random.uniform(0, 1) < weather_adj
+        cluster = rng.random() < config.weather_adj
         # if it is, is weather ok to spread to other clusters (e.g. wind and rain)
         if cluster and cell:
-            grid = random.uniform(0, 1) < weather_cluster
+            grid = rng.random() < config.weather_cluster
             return [cell, cluster, grid]
         else:
             return [cell, cluster, grid]
@@ -199,19 +284,70 @@ def weather_effects(day: int) -> List[bool]:
         return [cell, cluster, grid]
 
 
-def get_neighbors(grid: Tuple[int, int]) -> List[Tuple[int, int]]:
+def weather_schedule(config: SimulationConfig = DEFAULT_CONFIG, rng: Optional[np.random.Generator] = None,
+                     replicates: Optional[int] = None) -> np.ndarray:
+    """
+    Draw the weather of a whole run up front, with the dry/wet split at day 180 of every
+    year and the conditional structure of weather_effects (within cell -> adjacent -> global).
+
+    All uniforms are drawn in one call and then compared with the config's
+    probabilities, so configurations that only differ in weather parameters see the
+    same underlying draws when given generators in the same state.
+
+    Parameters
+    ----------
+    config : SimulationConfig
+        Simulation parameters (n_days and the weather probabilities).
+    rng : np.random.Generator, optional
+        Random generator of the schedule.
+    replicates : int, optional
+        Number of replicates; if given a schedule is drawn for each.
+
+    Returns
+    -------
+    np.ndarray
+        (n_days, 3), or (replicates, n_days, 3), boolean array of [within_cell, adjacent, global].
+    """
+    rng = rng or default_rng
+    shape = (config.n_days, 3) if replicates is None else (replicates, config.n_days, 3)
+    draws = rng.random(shape)
+    p_cell = np.where(np.arange(config.n_days) % 365 < 180, config.weather_within_cell_dry,
+                      config.weather_within_cell_wet)
+    weather = np.empty(shape, dtype=bool)
+    weather[..., 0] = draws[..., 0] < p_cell
+    weather[..., 1] = weather[..., 0] & (draws[..., 1] < config.weather_adj)
+    weather[..., 2] = weather[..., 1] & (draws[..., 2] < config.weather_cluster)
+    return weather
+
+
+def weather_rng(seed: int, run: int) -> np.random.Generator:
+    """
+    Generator of the weather schedule of replicate ``run``. It does not depend on the
+    configuration, so all configurations of a sweep see the same weather per replicate.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(WEATHER_STREAM, run)))
+
+
+def get_neighbors(grid: Tuple[int, int], config: Optional[SimulationConfig] = None) -> List[Tuple[int, int]]:
     """
     Compute the list of 8-neighbors around a given grid cell.
 
+    The simulation looks neighbours up in the neighbour table of its CellIndex; this
+    is for single cells.
+
     Parameters
     ----------
     grid : tuple
         (row, column) coordinates.
+    config : SimulationConfig, optional
+        Simulation parameters; if given, the neighbours are those inside the grid of
+        config.size cells, wrapped around its edges for a toroidal config.boundary.
+        Without a config all 8 offsets are returned, unchecked.
 
     Returns
     -------
     list of tuples
-        Coordinates of the 8 surrounding cells.
+        Coordinates of the surrounding cells.
     """
     possible: List[Tuple[int, int]] = [
         (grid[0] + 1, grid[1] + 1),
@@ -223,10 +359,204 @@ def get_neighbors(grid: Tuple[int, int]) -> List[Tuple[int, int]]:
         (grid[0] + 1, grid[1] - 1),
         (grid[0] + 1, grid[1])
     ]
-    return possible
+    if config is None:
+        return possible
+    if config.boundary == "toroidal":
+        wrapped = [(x % config.size, y % config.size) for x, y in possible]
+        return [x for x in dict.fromkeys(wrapped) if x != tuple(grid)]
+    return [(x, y) for x, y in possible if 0 <= x < config.size and 0 <= y < config.size]
+
+
+@dataclass
+class CellIndex:
+    """
+    Spatial index from grid cell to its plants, built once after the plants are created.
 
+    Plants of one cell must be contiguous in the plant list and numbered 0, 1, ... in
+    order (as created in the main loop), so each cell maps to a range of list positions.
+    Besides the per-cell running infectivity sum and healthy-plant count, the index keeps
+    the infected plants, infected cells, healthy plants and the frontier (infected cells
+    with at least one healthy plant in a neighbouring coffee cell) alive across days.
+    Everything is updated through infect() and update_infectivity() on every state
+    transition, so none of it has to be rebuilt by scanning the plants.
 
-def get_gridscore(gridsquare: Tuple[int, int], myplants: List[Plant]) -> float:
+    Attributes
+    ----------
+    plants : List[Plant]
+        List of all Plant instances in the simulation.
+    config : SimulationConfig
+        Simulation parameters.
+    start, stop : dict
+        Plants of a cell are plants[start[cell]:stop[cell]].
+    neighbors : dict
+        Coffee cells among the 8 neighbours of each cell, in plant-list order.
+    score : dict
+        Running sum of plant infectivity per cell.
+    total_score : float
+        Running sum of plant infectivity over all cells.
+    healthy : dict
+        Number of healthy plants per cell.
+    neighbor_healthy : dict
+        Number of healthy plants in the neighbouring coffee cells of each cell.
+    cursor : dict
+        List position before which no plant of the cell is healthy.
+    infected : List[Plant]
+        Infected plants, in order of infection.
+    infected_cells : set
+        Cells with at least one infected plant.
+    healthy_plants : HealthySet
+        List positions of the healthy plants, indexable in plant-list order.
+    frontier : set
+        Infected cells with at least one healthy neighbouring plant.
+    """
+    plants: List[Plant]
+    config: SimulationConfig = DEFAULT_CONFIG
+    start: Dict[Tuple[int, int], int] = field(default_factory=dict)
+    stop: Dict[Tuple[int, int], int] = field(default_factory=dict)
+    neighbors: Dict[Tuple[int, int], List[Tuple[int, int]]] = field(default_factory=dict)
+    score: Dict[Tuple[int, int], float] = field(default_factory=dict)
+    total_score: float = 0.0
+    healthy: Dict[Tuple[int, int], int] = field(default_factory=dict)
+    neighbor_healthy: Dict[Tuple[int, int], int] = field(default_factory=dict)
+    cursor: Dict[Tuple[int, int], int] = field(default_factory=dict)
+    infected: List[Plant] = field(default_factory=list)
+    infected_cells: Set[Tuple[int, int]] = field(default_factory=set)
+    healthy_plants: HealthySet = field(default_factory=lambda: HealthySet(0))
+    frontier: Set[Tuple[int, int]] = field(default_factory=set)
+
+    @classmethod
+    def build(cls, myplants: List[Plant], config: SimulationConfig = DEFAULT_CONFIG) -> "CellIndex":
+        """
+        Build the index for a plant list whose cells occupy contiguous ranges.
+
+        Parameters
+        ----------
+        myplants : List[Plant]
+            List of all Plant instances in the simulation.
+        config : SimulationConfig
+            Simulation parameters.
+
+        Returns
+        -------
+        CellIndex
+            Index reflecting the current state of the plants.
+        """
+        index = cls(myplants, config)
+        healthy = np.zeros(len(myplants), dtype=bool)
+        for position, plant in enumerate(myplants):
+            if plant.grid not in index.start:
+                index.start[plant.grid] = position
+                index.score[plant.grid] = 0.0
+                index.healthy[plant.grid] = 0
+            elif index.stop[plant.grid] != position:
+                raise ValueError(f"plants of cell {plant.grid} are not contiguous")
+            if position - index.start[plant.grid] != plant.plant:
+                raise ValueError(f"plants of cell {plant.grid} are not numbered in order")
+            index.stop[plant.grid] = position + 1
+            index.score[plant.grid] += plant.infectivity
+            if plant.infection < 0.001:
+                index.healthy[plant.grid] += 1
+                healthy[position] = True
+            else:
+                index.infected.append(plant)
+                index.infected_cells.add(plant.grid)
+        index.total_score = sum(index.score.values())
+        index.healthy_plants = HealthySet.from_mask(healthy)
+        index.cursor = dict(index.start)
+        # coffee neighbours of every cell, computed once for the landscape
+        cells = list(index.start)
+        rows, cols = np.asarray(cells, dtype=np.int64).reshape(-1, 2).T
+        table = SparseLandscape.from_coordinates((config.size, config.size), rows, cols,
+                                                 wrap=config.boundary == "toroidal")
+        ids = table.lookup(rows, cols)
+        coordinates = list(zip(table.rows.tolist(), table.cols.tolist()))
+        for gridsquare, cell in zip(cells, ids.tolist()):
+            index.neighbors[gridsquare] = sorted((coordinates[x] for x in table.neighbors(cell).tolist()),
+                                                 key=index.start.get)
+            index.neighbor_healthy[gridsquare] = sum(index.healthy[x] for x in index.neighbors[gridsquare])
+        index.frontier = {x for x in index.infected_cells if index.neighbor_healthy[x] > 0}
+        return index
+
+    def position(self, plant: Plant) -> int:
+        """Return the position of a plant in the plant list."""
+        return self.start[plant.grid] + plant.plant
+
+    def first_healthy(self, gridsquare: Tuple[int, int]) -> Optional[Plant]:
+        """
+        Return the first healthy plant of a cell, or None if all are infected.
+        The cursor only moves forward, since plants never recover.
+        """
+        if self.healthy.get(gridsquare, 0) == 0:
+            return None
+        position = self.cursor[gridsquare]
+        while self.plants[position].infection >= 0.001:
+            position += 1
+        self.cursor[gridsquare] = position
+        return self.plants[position]
+
+    def healthy_neighbors(self, gridsquare: Tuple[int, int]) -> List[Plant]:
+        """Return the healthy plants of the neighbouring coffee cells, in plant-list order."""
+        return [x for cell in self.neighbors[gridsquare] if self.healthy[cell] > 0
+                for x in self.plants[self.start[cell]:self.stop[cell]] if x.infection < 0.0001]
+
+    def healthy_neighbor(self, gridsquare: Tuple[int, int], k: int) -> Plant:
+        """
+        Return healthy_neighbors(gridsquare)[k] without listing them: the cell is found
+        from the healthy counts of the neighbouring cells and the plant with
+        healthy_plants.select, in O(neighbours + log plants).
+        """
+        for cell in self.neighbors[gridsquare]:
+            if k < self.healthy[cell]:
+                return self.plants[self.healthy_plants.select(self.healthy_plants.rank(self.start[cell]) + k)]
+            k -= self.healthy[cell]
+        raise IndexError(f"healthy neighbour {k} of cell {gridsquare}")
+
+    def infect(self, plant: Plant) -> None:
+        """Infect a plant and update the cell counts and the plant and cell sets."""
+        if plant.infection < 0.001:
+            gridsquare = plant.grid
+            self.healthy[gridsquare] -= 1
+            self.healthy_plants.discard(self.position(plant))
+            self.infected.append(plant)
+            for cell in self.neighbors[gridsquare]:
+                self.neighbor_healthy[cell] -= 1
+                if self.neighbor_healthy[cell] == 0:
+                    self.frontier.discard(cell)
+            if gridsquare not in self.infected_cells:
+                self.infected_cells.add(gridsquare)
+                if self.neighbor_healthy[gridsquare] > 0:
+                    self.frontier.add(gridsquare)
+        plant.infection = self.config.days
+
+    def update_infectivity(self, plant: Plant) -> float:
+        """Recompute a plant's infectivity and update the running scores."""
+        old = plant.infectivity
+        new = plant.define_infectivity(self.config)
+        self.score[plant.grid] += new - old
+        self.total_score += new - old
+        return new
+
+
+def infect(plant: Plant, index: Optional[CellIndex] = None, config: SimulationConfig = DEFAULT_CONFIG) -> None:
+    """
+    Infect a plant, keeping the cell index (if any) up to date.
+
+    Parameters
+    ----------
+    plant : Plant
+        Plant to infect.
+    index : CellIndex, optional
+        Cell index of the simulation.
+    config : SimulationConfig
+        Simulation parameters.
+    """
+    if index is None:
+        plant.infection = config.days
+    else:
+        index.infect(plant)
+
+
+def get_gridscore(gridsquare: Tuple[int, int], myplants: List[Plant], index: Optional[CellIndex] = None) -> float:
     """
     Calculate the total infectivity score of a given grid cell.
 
@@ -236,16 +566,22 @@ def get_gridscore(gridsquare: Tuple[int, int], myplants: List[Plant]) -> float:
         Grid cell coordinates (row, column).
     myplants : List[Plant]
         List of all Plant instances in the simulation.
+    index : CellIndex, optional
+        Cell index; if given the running score is returned instead of scanning the plants.
 
     Returns
     -------
     float
         Sum of infectivity values for all infected plants in the grid cell.
     """
+    if index is not None:
+        return index.score[gridsquare]
     return sum(x.infectivity for x in myplants if x.grid == gridsquare)
 
 
-def within_cell_infection(gridsquare: Tuple[int, int], myplants: List[Plant]) -> Tuple[Tuple[int, int], float]:
+def within_cell_infection(gridsquare: Tuple[int, int], myplants: List[Plant],
+                          index: Optional[CellIndex] = None,
+                          config: SimulationConfig = DEFAULT_CONFIG) -> Tuple[Tuple[int, int], float]:
     """
     Determine if a healthy plant within the same cell gets infected based on infection score.
 
@@ -255,24 +591,36 @@ def within_cell_infection(gridsquare: Tuple[int, int], myplants: List[Plant]) ->
         Grid cell coordinates.
     myplants : List[Plant]
         List of all Plant instances in the simulation.
+    index : CellIndex, optional
+        Cell index; if given the score and first healthy plant are looked up in O(1).
+    config : SimulationConfig
+        Simulation parameters.
 
     Returns
     -------
     Tuple[Tuple[int, int], float]
         (Grid cell coordinates, infection score).
     """
-    infection_score: float = get_gridscore(gridsquare, myplants)
+    infection_score: float = get_gridscore(gridsquare, myplants, index)
+    if index is not None:
+        target = index.first_healthy(gridsquare)
+        if target is not None and infection_score >= 0.4:
+            index.infect(target)
+        return (gridsquare, infection_score)
     plants_in_cell_healthy: List[Plant] = [x for x in myplants if (x.infection < 0.001) and (x.grid == gridsquare)]
     if len(plants_in_cell_healthy) > 0:
         if infection_score < 0.4:
             pass
         else:
-            plants_in_cell_healthy[0].infection = days
+            plants_in_cell_healthy[0].infection = config.days
             pass
     return (gridsquare, infection_score)
 
 
-def neighbor_cell_infection(gridscore: Tuple[Tuple[int, int], float], myplants: List[Plant]) -> None:
+def neighbor_cell_infection(gridscore: Tuple[Tuple[int, int], float], myplants: List[Plant],
+                            index: Optional[CellIndex] = None,
+                            config: SimulationConfig = DEFAULT_CONFIG,
+                            rng: Optional[np.random.Generator] = None) -> None:
     """
     Infect one additional plant in an adjacent grid cell based on infection score.
 
@@ -282,16 +630,35 @@ def neighbor_cell_infection(gridscore: Tuple[Tuple[int, int], float], myplants:
         (Grid cell coordinates, infection score).
     myplants : List[Plant]
         List of all Plant instances in the simulation.
+    index : CellIndex, optional
+        Cell index, updated on infection.
+    config : SimulationConfig
+        Simulation parameters.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
     """
-    neighbors  = get_neighbors(gridscore[0])
+    rng = rng or default_rng
+    if index is not None:
+        # only the drawn plant is looked up
+        n_healthy = index.neighbor_healthy[gridscore[0]]
+        a = max(1,rng.integers(0, n_healthy + 1))
+        if gridscore[1] < 0.6 or n_healthy<1:
+            pass
+        elif rng.random()< 0.8:
+            infect(index.healthy_neighbor(gridscore[0], int(a)-1), index, config)
+        return
+    neighbors  = get_neighbors(gridscore[0], config)
     healthy_neighbors = [x for x in myplants if (x.grid in neighbors) and (x.infection < 0.0001)]
-    a = max(1,random.randint(0, len(healthy_neighbors)))
+    a = max(1,rng.integers(0, len(healthy_neighbors) + 1))
     if gridscore[1] < 0.6 or len(healthy_neighbors)<1:
         pass
-    elif random.uniform(0,1)< 0.8:
-        healthy_neighbors[a-1].infection = days
+    elif rng.random()< 0.8:
+        infect(healthy_neighbors[a-1], index, config)
 
-def global_infection(grid_scores: List[Tuple[Tuple[int, int], float]], myplants: List[Plant]) -> None:
+def global_infection(grid_scores: List[Tuple[Tuple[int, int], float]], myplants: List[Plant],
+                     index: Optional[CellIndex] = None,
+                     config: SimulationConfig = DEFAULT_CONFIG,
+                     rng: Optional[np.random.Generator] = None) -> None:
     """
     Spread infection globally across the landscape under extreme weather conditions.
 
@@ -301,22 +668,41 @@ def global_infection(grid_scores: List[Tuple[Tuple[int, int], float]], myplants:
         List of (grid cell, infection score).
     myplants : List[Plant]
         List of all Plant instances in the simulation.
+    index : CellIndex, optional
+        Cell index, updated on infection.
+    config : SimulationConfig
+        Simulation parameters.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
     """
+    rng = rng or default_rng
     total_score = sum(x[1] for x in grid_scores)
+    if index is not None:
+        # draws index the healthy plants in plant-list order, resolved by the index without a scan
+        n_healthy = len(index.healthy_plants)
+        if n_healthy > 100 and total_score >= 0.5:
+            draws = [int(rng.integers(0, n_healthy)) for _ in range(3)]
+            for plant in [myplants[index.healthy_plants.select(x)] for x in draws]:
+                infect(plant, index, config)
+        return
     healthy = [x for x in myplants if x.infection < 0.0001]
     if len(healthy) > 100:
         if total_score < 0.5:
             pass
         else:
-            a = random.randint(0,len(healthy)-1)
-            b = random.randint(0,len(healthy)-1)
-            c = random.randint(0,len(healthy)-1)
-            healthy[a].infection = days
-            healthy[b].infection = days
-            healthy[c].infection = days
+            a = rng.integers(0,len(healthy))
+            b = rng.integers(0,len(healthy))
+            c = rng.integers(0,len(healthy))
+            infect(healthy[a], index, config)
+            infect(healthy[b], index, config)
+            infect(healthy[c], index, config)
         
 
-def each_day(myplants: List[Plant], day: int) -> List[float]:
+def each_day(myplants: List[Plant], day: int, index: Optional[CellIndex] = None,
+             config: SimulationConfig = DEFAULT_CONFIG,
+             rng: Optional[np.random.Generator] = None,
+             weather: Optional[np.ndarray] = None,
+             timer: Union[PhaseTimer, NullTimer] = NULL_TIMER) -> List[float]:
     """
     Control the simulation for a single day: progress infections, spread based on weather.
 
@@ -326,35 +712,116 @@ def each_day(myplants: List[Plant], day: int) -> List[float]:
         List of all Plant instances in the simulation.
     day : int
         Current day number.
+    index : CellIndex, optional
+        Cell index of the plants; if given, the infected plants and cells, healthy plants,
+        cell scores and daily statistics are taken from the index instead of scanning all
+        plants, and neighbour spread only visits frontier cells.
+    config : SimulationConfig
+        Simulation parameters.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
+    weather : np.ndarray, optional
+        The day's [within_cell, adjacent, global] row of a weather_schedule; drawn with
+        weather_effects if not given.
+    timer : PhaseTimer, optional
+        Records the wall time of every phase of the day (see phase_timer.py).
 
     Returns
     -------
     List[float]
         [infectivity_score, infected_cells, infected_plants, day_number]
     """
-    weather = weather_effects(day)
-    inf_plants = [x for x in myplants if x.infection > 0.0001]
-    [x.progression() for x in inf_plants]
-    [x.define_infectivity() for x in inf_plants]
+    rng = rng or default_rng
+    if weather is None:
+        weather = weather_effects(day, config, rng)
+    if index is None:
+        with timer.phase(day, "progression", len(myplants)):
+            inf_plants = [x for x in myplants if x.infection > 0.0001]
+            [x.progression(config) for x in inf_plants]
+            [x.define_infectivity(config) for x in inf_plants]
+        inf_grid = set([x.grid for x in inf_plants]) if weather[0] else set()
+    else:
+        with timer.phase(day, "progression", len(index.infected)):
+            inf_plants = index.infected[:]
+            [x.progression(config) for x in inf_plants]
+            [index.update_infectivity(x) for x in inf_plants]
+        # in plant-list order, which does not depend on the history of the set
+        inf_grid = sorted(index.infected_cells, key=index.start.get) if weather[0] else []
     if weather[0]:
-        inf_grid = set([x.grid for x in inf_plants])
         grid_scores = []
-        for i in inf_grid:
-            grid_infection_score = within_cell_infection(i, myplants)
-            grid_scores.append(grid_infection_score)
+        with timer.phase(day, "within_cell", len(inf_grid)):
+            for i in inf_grid:
+                grid_infection_score = within_cell_infection(i, myplants, index, config)
+                grid_scores.append(grid_infection_score)
         if weather[1]:
-            for i in grid_scores:
-                neighbor_cell_infection(i, myplants)
+            with timer.phase(day, "neighbor", len(grid_scores)):
+                for i in grid_scores:
+                    # cells off the frontier have no healthy neighbour left to infect
+                    if index is None or i[0] in index.frontier:
+                        neighbor_cell_infection(i, myplants, index, config, rng)
             if weather[2]:
-                global_infection(grid_scores, myplants)
-    infectivity_score = sum([x.infectivity for x in myplants])
-    infected_grid_cells = len(set(x.grid for x in myplants if x.infection > 0.001))
-    infected_plants = len([x for x in myplants if x.infection > 0.001])
+                with timer.phase(day, "global", len(grid_scores)):
+                    global_infection(grid_scores, myplants, index, config, rng)
+    with timer.phase(day, "summary", len(myplants)):
+        if index is None:
+            infectivity_score = sum([x.infectivity for x in myplants])
+            infected_grid_cells = len(set(x.grid for x in myplants if x.infection > 0.001))
+            infected_plants = len([x for x in myplants if x.infection > 0.001])
+        else:
+            infectivity_score = index.total_score
+            infected_grid_cells = len(index.infected_cells)
+            infected_plants = len(index.infected)
     results = [infectivity_score,infected_grid_cells,infected_plants,day]
     return results
 
 
-def initial_infection(myplants: List[Plant]) -> None:
+def fast_forward(myplants: List[Plant], day: int, n_days: int, index: Optional[CellIndex] = None,
+                 config: SimulationConfig = DEFAULT_CONFIG) -> Optional[List[List[float]]]:
+    """
+    Run days ``day`` .. ``day + n_days - 1`` without any spread (no within-cell weather)
+    in one jump: the infected plants follow their deterministic progression, so they are
+    advanced with array_engine.advance_infections instead of day by day.
+
+    Parameters
+    ----------
+    myplants : List[Plant]
+        List of all Plant instances in the simulation.
+    day : int
+        First skipped day.
+    n_days : int
+        Number of skipped days.
+    index : CellIndex, optional
+        Cell index of the plants; required, as it lists the infected plants.
+    config : SimulationConfig
+        Simulation parameters.
+
+    Returns
+    -------
+    List[List[float]] or None
+        The daily results of the skipped days, or None (nothing changed) if the plants
+        have to be stepped day by day.
+    """
+    import array_engine
+
+    if index is None or not index.infected:
+        return None
+    inf_plants = index.infected[:]
+    jump = array_engine.advance_infections(np.array([x.infection for x in inf_plants]),
+                                           np.array([x.resistance for x in inf_plants]), n_days, config)
+    if jump is None:
+        return None
+    advanced, scores = jump
+    for plant, infection in zip(inf_plants, advanced.tolist()):
+        plant.infection = infection
+        index.update_infectivity(plant)
+    infected_grid_cells = len(index.infected_cells)
+    infected_plants = len(index.infected)
+    return [[float(score), infected_grid_cells, infected_plants, day + k] for k, score in enumerate(scores)]
+
+
+def initial_infection(myplants: List[Plant], index: Optional[CellIndex] = None,
+                      config: SimulationConfig = DEFAULT_CONFIG,
+                      rng: Optional[np.random.Generator] = None) -> None:
     """
     Randomly select one plant and one plant in an adjacent cell to become infected.
 
@@ -362,18 +829,117 @@ def initial_infection(myplants: List[Plant]) -> None:
     ----------
     myplants : List[Plant]
         List of all Plant instances in the simulation.
+    index : CellIndex, optional
+        Cell index, updated on infection.
+    config : SimulationConfig
+        Simulation parameters.
+    rng : np.random.Generator, optional
+        Random generator of the replicate.
     """
-    a = random.randint(0,len(myplants))
+    rng = rng or default_rng
+    a = rng.integers(0,len(myplants))
     inf_plants_seed = myplants[a]
-    inf_plants_seed.infection = days
-    b = get_neighbors(inf_plants_seed.grid)
-    c = random.randint(0,len(b)-1)
-    neighbors = [x for x in myplants if x.grid in b]
-    neighbors[c].infection = days
+    infect(inf_plants_seed, index, config)
+    if index is not None:
+        neighbors = [myplants[i] for x in index.neighbors[inf_plants_seed.grid]
+                     for i in range(index.start[x], index.stop[x])]
+    else:
+        b = get_neighbors(inf_plants_seed.grid, config)
+        neighbors = [x for x in myplants if x.grid in b]
+    # a seed without coffee neighbours infects only itself
+    if neighbors:
+        c = rng.integers(0, min(8, len(neighbors)))
+        infect(neighbors[c], index, config)
+
+def infection_map(myplants: List[Plant], landscape: pd.DataFrame,
+                  index: Optional[CellIndex] = None) -> np.ndarray:
+    """
+    Return the infection map of the landscape: 0 non-coffee, 1 coffee, 2 coffee with infected plants.
+
+    The map is built with a single scatter of the infected cells into the coffee mask.
+
+    Parameters
+    ----------
+    myplants : List[Plant]
+        List of all Plant instances in the simulation.
+    landscape : pd.DataFrame
+        DataFrame representing the landscape grid.
+    index : CellIndex, optional
+        Cell index; if given its infected cells are used instead of scanning the plants.
+
+    Returns
+    -------
+    np.ndarray
+        (size, size) uint8 map.
+    """
+    if index is not None:
+        infected = list(index.infected_cells)
+    else:
+        infected = [x.grid for x in myplants if x.infection > 0.0001]
+    landscaped = np.asarray(landscape, dtype=np.uint8)
+    if infected:
+        rows, cols = np.asarray(infected).T
+        landscaped[rows, cols] = 2
+    return landscaped
 
-def save_intermediate_infected(myplants: List[Plant], landscape: pd.DataFrame, day: int, z: int) -> None:
+def composition(myplants: List[Plant], landscape: pd.DataFrame, index: Optional[CellIndex] = None) -> np.ndarray:
     """
-    Save intermediate infection maps to CSV at specified days (0, 120, 240, 360).
+    Return the cell counts [non-coffee, healthy coffee, coffee with infected plants] of
+    the landscape, the counts of the 0/1/2 values of infection_map, without building the map.
+
+    Parameters
+    ----------
+    myplants : List[Plant]
+        List of all Plant instances in the simulation.
+    landscape : pd.DataFrame
+        DataFrame representing the landscape grid.
+    index : CellIndex, optional
+        Cell index; if given its cells and infected cells are counted instead of scanning the plants.
+
+    Returns
+    -------
+    np.ndarray
+        Three int64 counts, summing to the number of cells of the landscape.
+    """
+    if index is not None:
+        coffee = len(index.start)
+        infected = len(index.infected_cells)
+    else:
+        coffee = len({x.grid for x in myplants})
+        infected = len({x.grid for x in myplants if x.infection > 0.0001})
+    return np.array([landscape.size - coffee, coffee - infected, infected], dtype=np.int64)
+
+# A map writer stores one infection map: writer(infection_map, day, z, config)
+MapWriter = Callable[[np.ndarray, int, int, SimulationConfig], None]
+
+def write_map_csv(landscaped: np.ndarray, day: int, z: int, config: SimulationConfig = DEFAULT_CONFIG,
+                  datadir: Path = datadir) -> None:
+    """Map writer for map-{day}-{z}-{label}.csv, the format read by plot_results-final.py."""
+    pd.DataFrame(landscaped).to_csv(F"{datadir}/map-{day}-{z}-{config.label}.csv")
+
+def write_map_npy(landscaped: np.ndarray, day: int, z: int, config: SimulationConfig = DEFAULT_CONFIG,
+                  datadir: Path = datadir) -> None:
+    """Map writer for map-{day}-{z}-{label}.npy, a binary alternative to write_map_csv."""
+    np.save(F"{datadir}/map-{day}-{z}-{config.label}.npy", landscaped)
+
+def map_files(z: int, label: str, datadir: Path = datadir) -> Dict[int, Path]:
+    """
+    Return the map files of run z of the configuration ``label`` written by the map
+    writers, by snapshot day, in day order; the .npy file if a day has both.
+    """
+    suffix = f"-{z}-{label}"
+    files = {}
+    for path in Path(datadir).glob(f"map-*{glob.escape(suffix)}.*"):
+        day = path.stem[len("map-"):-len(suffix)] if path.stem.endswith(suffix) else ""
+        if day.isdigit() and path.suffix in (".csv", ".npy") and (int(day) not in files or path.suffix == ".npy"):
+            files[int(day)] = path
+    return dict(sorted(files.items()))
+
+def save_intermediate_infected(myplants: List[Plant], landscape: pd.DataFrame, day: int, z: int,
+                               config: SimulationConfig = DEFAULT_CONFIG, index: Optional[CellIndex] = None,
+                               writer: Optional[MapWriter] = None) -> None:
+    """
+    Save intermediate infection maps at specified days (0, 120, 240, 360).
 
     Parameters
     ----------
@@ -385,75 +951,357 @@ def save_intermediate_infected(myplants: List[Plant], landscape: pd.DataFrame, d
         Current day number.
     z : int
         Simulation run identifier.
+    config : SimulationConfig
+        Simulation parameters, used in the file name.
+    index : CellIndex, optional
+        Cell index of the simulation.
+    writer : MapWriter, optional
+        Map writer (default: write_map_csv to the data directory).
+    """
+    writer = writer or write_map_csv
+    writer(infection_map(myplants, landscape, index), day, z, config)
+
+def calculate_returns(myplants: List[Plant], config: SimulationConfig = DEFAULT_CONFIG) -> float:
     """
-    infected = set([x.grid for x in myplants if x.infection > 0.0001])
-    landscaped = landscape*1
-    for index,row in landscaped.iterrows():
-        column = 0
-        while column < size:
-            if (index,column) in infected:
-                row[column] = 2
-            column+=1
-    landscaped.to_csv(F"{datadir}/map-{day}-{z}-{proportions}-{cluster}.csv")
+    Update the production of every plant from its infection and return the total.
+
+    Parameters
+    ----------
+    myplants : List[Plant]
+        List of all Plant instances in the simulation.
+    config : SimulationConfig
+        Simulation parameters.
+
+    Returns
+    -------
+    float
+        Total production of all plants.
+    """
+    [x.get_production(config) for x in myplants]
+    return sum([x.production for x in myplants])
+
+
+@dataclass
+class SimulationResult:
+    """
+    Outcome of one simulated replicate.
+
+    Attributes
+    ----------
+    config : SimulationConfig
+        Parameters the replicate was run with.
+    daily_results : pd.DataFrame
+        One row per day: infection_score, infected_cells, infected_plants, day.
+    maps : dict
+        Infection maps (see infection_map) keyed by the day they were taken.
+    coffee_cherries : float
+        Harvested coffee cherries (floored total production).
+    phases : pd.DataFrame, optional
+        Wall time, calls and counts per day and phase (PhaseTimer.per_day), if the
+        replicate was run with a PhaseTimer.
+    composition : pd.DataFrame, optional
+        One row per snapshot day: day, non_coffee, healthy, infected (cell counts of
+        the map, see composition).
+    """
+    config: SimulationConfig
+    daily_results: pd.DataFrame
+    maps: Dict[int, np.ndarray]
+    coffee_cherries: float
+    phases: Optional[pd.DataFrame] = None
+    composition: Optional[pd.DataFrame] = None
+
+
+def simulate_days(config: SimulationConfig = DEFAULT_CONFIG,
+                  seed: Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None,
+                  landscape: Optional[pd.DataFrame] = None,
+                  weather: Optional[np.ndarray] = None,
+                  timer: Optional[Union[PhaseTimer, NullTimer]] = None,
+                  checkpoint: Optional["checkpoint.Checkpoint"] = None
+                  ) -> Generator[Tuple[List[float], Optional[np.ndarray], Optional[np.ndarray]], None, float]:
+    """
+    Run one replicate as a stream: build a landscape and its plants, seed the infection
+    and simulate config.n_days days with the selected simulation_engine, yielding every
+    day as soon as it is done. Nothing is kept once yielded, so memory does not grow
+    with the number of days; see sinks.py for consumers.
+
+    Parameters
+    ----------
+    config : SimulationConfig
+        Simulation parameters.
+    seed : int, np.random.SeedSequence or np.random.Generator, optional
+        Seed of the replicate's Generator (or the Generator itself); if None the
+        replicate is seeded from fresh entropy.
+    landscape : pd.DataFrame, optional
+        Landscape to use (e.g. from a LandscapeCache); generated with a seed drawn from
+        the replicate's Generator if not given.
+    weather : np.ndarray, optional
+        (n_days, 3) weather_schedule to use, e.g. one shared with other configurations;
+        drawn from the replicate's Generator if not given.
+    timer : PhaseTimer, optional
+        Records the wall time of every day ("day"), fast-forward jump ("fast_forward",
+        counting the skipped days) and snapshot, and, with the plants and arrays
+        engines, of the phases of each_day.
+    checkpoint : checkpoint.Checkpoint, optional
+        Saves the state of the run every checkpoint.every days. If it holds a saved
+        state, the run resumes from it: the sinks attached to the checkpoint are set
+        back to the saved day, only the days after it are yielded, and they are
+        bit-identical to those of an uninterrupted run.
+
+    Yields
+    ------
+    tuple
+        ([infectivity_score, infected_cells, infected_plants, day], infection map of
+        the day, composition of the day) where the map and the composition (cell
+        counts [non-coffee, healthy coffee, infected coffee], see composition) are
+        None if it is not a snapshot day.
+
+    Returns
+    -------
+    float
+        Harvested coffee cherries (floored total production), as the value of the
+        generator (StopIteration.value).
+    """
+    import array_engine
+
+    if config.simulation_engine not in ("plants", "arrays", "numba", "tiled"):
+        raise ValueError(f"unknown simulation engine: {config.simulation_engine}")
+    if config.neighbor_spread not in ("cell", "convolution"):
+        raise ValueError(f"unknown neighbour spread rule: {config.neighbor_spread}")
+    if config.neighbor_spread == "convolution" and config.simulation_engine not in ("arrays", "tiled"):
+        raise ValueError(f"the {config.simulation_engine} engine only implements the \"cell\" neighbour spread rule")
+    if config.boundary not in ("bounded", "toroidal"):
+        raise ValueError(f"unknown grid boundary: {config.boundary}")
+    if checkpoint is not None and config.simulation_engine == "tiled":
+        raise ValueError("the tiled engine does not support checkpoints")
+    rng = np.random.default_rng(seed)
+    timer = timer or NULL_TIMER
+
+    # continue from the checkpoint; its sinks already hold the days before it
+    resume = None if checkpoint is None else checkpoint.load(config)
+    if resume is not None:
+        if resume["coffee_cherries"] is not None:
+            return resume["coffee_cherries"]
+        landscape = resume["landscape"]
+        weather = resume["weather"]
+
+    # make the landscape and identify the coffee / not-coffee cells
+    if landscape is None:
+        landscape = make_landscape(config.size, config.cluster, config.proportions, int(rng.integers(2**32)))
+    if weather is None:
+        weather = weather_schedule(config, rng)
+
+    index = None
+    if config.simulation_engine in ("arrays", "numba"):
+        # Plant state lives in NumPy arrays, one contiguous block of plants per coffee cell
+        plants = array_engine.PlantArrays.from_landscape(landscape, config.plants_per_cell,
+                                                         config.resistance, config)
+        array_engine.initial_infection(plants, rng)
+        if config.simulation_engine == "numba":
+            import kernels
+            step = partial(kernels.each_day, rng=rng)
+        else:
+            step = partial(array_engine.each_day, rng=rng, timer=timer)
+        jump = array_engine.fast_forward
+        snapshot = partial(array_engine.infection_map, plants)
+        compose = partial(array_engine.composition, plants)
+        harvest = partial(array_engine.calculate_returns, plants)
+    elif config.simulation_engine == "tiled":
+        # Plants are split over one worker process per tile
+        import tiled
+        plants = tiled.TiledPlants.from_landscape(landscape, config, rng)
+        tiled.initial_infection(plants, rng)
+        step = partial(tiled.each_day, rng=rng)
+        jump = tiled.fast_forward
+        snapshot = partial(tiled.infection_map, plants)
+        compose = partial(tiled.composition, plants)
+        harvest = partial(tiled.calculate_returns, plants)
+    else:
+        cafe = []
+        not_cafe = []
+        for index,row in landscape.iterrows():
+            c = []
+            nc = []
+            column = 0
+            while column < config.size:
+                if row[column]:
+                    c.append((index,column))
+                else:
+                    nc.append((index,column))
+                column+=1
+            cafe.extend(c)
+            not_cafe.extend(nc)
+
+        # Create a user-specified number of instances of the Plant class for each cell with coffee in it
+
+        plants =[]
+        for i in cafe:
+            for j in range(config.plants_per_cell):
+                plants.append(Plant(grid = i, plant = j, resistance = config.resistance,
+                                    production = config.production))
+
+        # index the plants of each cell and initialize infection
+
+        index = CellIndex.build(plants, config)
+        initial_infection(plants, index, config, rng)
+        step = partial(each_day, index=index, config=config, rng=rng, timer=timer)
+        jump = partial(fast_forward, index=index, config=config)
+        snapshot = partial(infection_map, plants, landscape, index)
+        compose = partial(composition, plants, landscape, index)
+        harvest = partial(calculate_returns, plants, config)
+
+    if resume is not None:
+        checkpoint.restore(resume, rng, plants, index)
+
+    # days with within-cell weather, where fast-forward jumps end
+    spread_days = np.append(np.flatnonzero(weather[:config.n_days, 0]), config.n_days)
+
+    # Run code for each day
+    day = 0 if resume is None else resume["day"]
+    try:
+        while day < config.n_days:
+            if checkpoint is not None and checkpoint.due(day):
+                with timer.phase(day, "checkpoint"):
+                    checkpoint.save(day, config, rng, landscape, weather, plants, index)
+            # days without within-cell weather only progress infections and can be skipped in one jump
+            skipped = None
+            if config.fast_forward and not weather[day][0]:
+                n_days = int(spread_days[np.searchsorted(spread_days, day)]) - day
+                with timer.phase(day, "fast_forward", n_days):
+                    skipped = jump(plants, day, n_days)
+            if skipped is None:
+                with timer.phase(day, "day"):
+                    skipped = [step(plants, day, weather=weather[day])]
+            # the infected cells, and so the maps, do not change within a jump
+            for row in skipped:
+                day = row[3]
+                landscaped = None
+                counts = None
+                if day%config.snapshot_every==0:
+                    with timer.phase(day, "snapshot"):
+                        landscaped = snapshot()
+                        counts = compose()
+                yield row, landscaped, counts
+            day+=1
+
+        # harvest berries
+        coffee_cherries = float(np.floor(harvest()))
+        if checkpoint is not None:
+            checkpoint.finish(config, coffee_cherries)
+        return coffee_cherries
+    finally:
+        if config.simulation_engine == "tiled":
+            plants.close()
+
+
+def simulate(config: SimulationConfig = DEFAULT_CONFIG,
+             seed: Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None,
+             landscape: Optional[pd.DataFrame] = None,
+             weather: Optional[np.ndarray] = None,
+             timer: Optional[Union[PhaseTimer, NullTimer]] = None,
+             checkpoint: Optional["checkpoint.Checkpoint"] = None) -> SimulationResult:
+    """
+    Run one replicate with simulate_days and collect all its days, maps and compositions. Nothing is
+    written to disk (see write_result), except with a checkpoint: the days are then spooled to
+    checkpoint.spool, removed with the checkpoint.
+
+    Parameters
+    ----------
+    config, seed, landscape, weather, checkpoint
+        As for simulate_days.
+    timer : PhaseTimer, optional
+        As for simulate_days; the per-day table is returned as SimulationResult.phases.
+
+    Returns
+    -------
+    SimulationResult
+        Daily results, infection maps and harvest of the replicate.
+    """
+    import sinks
+
+    days = simulate_days(config, seed, landscape, weather, timer, checkpoint)
+    if checkpoint is None:
+        collector = sinks.Collector()
+        coffee_cherries = sinks.run_pipeline(days, [collector])
+        daily, maps, composition = collector.frame(), collector.maps, collector.composition_frame()
+    else:
+        # the days are spooled next to the checkpoint, so a resumed run still has those before it
+        spool = sinks.CSVSink(0, config, checkpoint.spool, partial(write_map_npy, datadir=checkpoint.spool))
+        checkpoint.attach([spool])
+        coffee_cherries = sinks.run_pipeline(days, [spool])
+        daily, maps, composition = sinks.read_csv_result(0, config, checkpoint.spool)
+    phases = timer.per_day() if timer is not None and timer.enabled else None
+    return SimulationResult(config, daily, maps, coffee_cherries, phases, composition)
+
+
+def write_result(result: SimulationResult, z: int, datadir: Path = datadir,
+                 map_writer: Optional[MapWriter] = None) -> None:
+    """
+    Write the infection maps, daily results and snapshot compositions of a replicate as
+    map-{day}-{z}-{label}.csv, results-{z}-{label}.csv and composition-{z}-{label}.csv,
+    and its phase timings (if any) as phases-{z}-{label}.csv.
+
+    Parameters
+    ----------
+    result : SimulationResult
+        Result from simulate.
+    z : int
+        Simulation run identifier.
+    datadir : Path
+        Output directory, created if needed.
+    map_writer : MapWriter, optional
+        Writer of the infection maps (default: write_map_csv to ``datadir``).
+    """
+    datadir.mkdir(parents=True, exist_ok=True)
+    label = result.config.label
+    map_writer = map_writer or partial(write_map_csv, datadir=datadir)
+    for day, landscaped in result.maps.items():
+        map_writer(landscaped, day, z, result.config)
+    result.daily_results.to_csv(F"{datadir}/results-{z}-{label}.csv")
+    if result.composition is not None:
+        result.composition.to_csv(F"{datadir}/composition-{z}-{label}.csv", index=False)
+    if result.phases is not None:
+        result.phases.to_csv(F"{datadir}/phases-{z}-{label}.csv", index=False)
+
+
+def run_simulation(z: int, config: SimulationConfig = DEFAULT_CONFIG,
+                   seed: Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None,
+                   landscape: Optional[pd.DataFrame] = None,
+                   weather: Optional[np.ndarray] = None,
+                   checkpoint: Optional["checkpoint.Checkpoint"] = None) -> float:
+    """
+    Run one replicate with simulate_days, streaming its maps and daily results to the
+    data directory as they are produced (sinks.CSVSink), and return its harvest.
+
+    Parameters
+    ----------
+    z : int
+        Simulation run identifier.
+    config : SimulationConfig
+        Simulation parameters.
+    seed : int, np.random.SeedSequence or np.random.Generator, optional
+        Seed of the replicate.
+    landscape : pd.DataFrame, optional
+        Landscape to use instead of a newly generated one.
+    weather : np.ndarray, optional
+        Weather schedule to use instead of a newly drawn one.
+    checkpoint : checkpoint.Checkpoint, optional
+        Checkpoint to save to and resume from (see simulate_days).
+
+    Returns
+    -------
+    float
+        Harvested coffee cherries (floored total production).
+    """
+    import sinks
+
+    csv = sinks.CSVSink(z, config)
+    if checkpoint is not None:
+        checkpoint.attach([csv])
+    days = simulate_days(config, seed, landscape, weather, checkpoint=checkpoint)
+    return sinks.run_pipeline(days, [csv])
 
 # Put it all together
 
-# make the landscape and identify the coffee / not-coffee cells
-returns = []
-runs = 10
-for z in range(0,runs):
-    print(f"Starting run {z}")
-    landscape = make_landscape(size,cluster)
-    cafe = []
-    not_cafe = []
-    for index,row in landscape.iterrows():
-        c = []
-        nc = []
-        column = 0
-        while column < size:
-            if row[column]:
-                c.append((index,column))
-            else:
-                nc.append((index,column))
-            column+=1
-        cafe.extend(c)
-        not_cafe.extend(nc)
-    
-    # Create a user-specified number of instances of the Plant class for each cell with coffee in it
-    
-    plants =[]
-    for i in cafe:
-        for j in range(plants_per_cell):
-            plants.append(Plant(grid = i, plant = j))
-    
-    # initialize infection
-        
-    initial_infection(plants)
-    
-    # Run code for each day       
-    day = 0
-    returns = []
-    daily_results = []
-    while day < 365:
-        daily_results.append(each_day(plants, day))
-        if day%120==0:
-            save_intermediate_infected(plants, landscape, day, z)
-            print(f"reached day {day}")
-        day+=1
-    
-    # organize data
-    # harvest berries
-    day = 0
-    
-    def calculate_returns(myplants):
-        [x.get_production() for x in myplants]
-        return sum([x.production for x in myplants])
-    
-    coffee_cherries = np.floor(calculate_returns(plants))
-    returns.append((coffee_cherries,runs))
-    results = pd.DataFrame(daily_results)
-    results.columns = ["infection_score", "infected_cells", 'infected_plants', 'day']
-    results.to_csv(F"{datadir}/results-{z}-{proportions}-{cluster}.csv")
-
-b = pd.DataFrame(returns)
-b.to_csv(F"{datadir}/returns-{proportions}-{cluster}.csv")
+if __name__ == "__main__":
+    import clr_landscape
+    clr_landscape.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-phase timing of the day step.
+
+each_day (model.py and array_engine.py) wraps its phases (progression, within_cell,
+neighbor, global, summary), and simulate each day, fast-forward jump and snapshot,
+in ``with timer.phase(day, name, count):`` blocks. A PhaseTimer records the wall time
+of every block with the day, the phase and a count of the work it covered (plants
+scanned for progression and summary, infected cells for the spread phases, skipped
+days for fast_forward). The default NULL_TIMER returns one shared no-op context
+manager and records nothing, so instrumented code runs at full speed unless a
+PhaseTimer is passed in.
+
+Records are exported as a per-day table (to_frame / per_day, written next to the
+daily results by model.write_result) or as a Chrome trace (write_chrome_trace),
+which chrome://tracing and Perfetto show as a timeline.
+"""
+
+import json
+import os
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List, Tuple
+
+import pandas as pd
+
+
+class _Phase:
+    __slots__ = ("_timer", "_day", "_name", "_count", "_start")
+
+    def __init__(self, timer: "PhaseTimer", day: int, name: str, count: int) -> None:
+        self._timer = timer
+        self._day = day
+        self._name = name
+        self._count = count
+
+    def __enter__(self) -> "_Phase":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter()
+        self._timer.records.append((self._day, self._name, self._start, end - self._start, self._count))
+
+
+class PhaseTimer:
+    """
+    Recorder of (day, phase, start, seconds, count) for every timed block.
+
+    Attributes
+    ----------
+    records : list
+        One (day, phase, start, seconds, count) tuple per block, start in
+        time.perf_counter seconds.
+    """
+    enabled = True
+
+    def __init__(self) -> None:
+        self.records: List[Tuple[int, str, float, float, int]] = []
+
+    def phase(self, day: int, name: str, count: int = 0) -> _Phase:
+        """Context manager timing one phase of day ``day``."""
+        return _Phase(self, day, name, count)
+
+    def to_frame(self) -> pd.DataFrame:
+        """All records, with columns day, phase, start, seconds, count."""
+        return pd.DataFrame(self.records, columns=["day", "phase", "start", "seconds", "count"])
+
+    def per_day(self) -> pd.DataFrame:
+        """Wall time, calls and counts per day and phase."""
+        return (self.to_frame().groupby(["day", "phase"], sort=False)
+                .agg(seconds=("seconds", "sum"), calls=("seconds", "size"), count=("count", "sum"))
+                .reset_index())
+
+    def chrome_trace(self) -> dict:
+        """The records as Chrome trace-event "complete" events, in microseconds from the first record."""
+        origin = min((r[2] for r in self.records), default=0.0)
+        pid = os.getpid()
+        return {"displayTimeUnit": "ms", "traceEvents": [
+            {"name": name, "cat": "day", "ph": "X", "pid": pid, "tid": 0,
+             "ts": (start - origin) * 1e6, "dur": seconds * 1e6, "args": {"day": day, "count": count}}
+            for day, name, start, seconds, count in self.records]}
+
+    def write_chrome_trace(self, path: Path) -> None:
+        """Write the Chrome trace JSON to ``path``."""
+        Path(path).write_text(json.dumps(self.chrome_trace()))
+
+
+class NullTimer:
+    """Timer that records nothing; phase returns one shared no-op context manager."""
+    enabled = False
+    _null = nullcontext()
+
+    def phase(self, day: int, name: str, count: int = 0) -> nullcontext:
+        return self._null
+
+
+# Default timer of the instrumented functions
+NULL_TIMER = NullTimer()
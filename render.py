@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless, parallel rendering of the result figures.
+
+A figure is described by a FigureJob: its file name, a drawing function (a key of
+DRAW), a loader returning its input arrays, the styling options and, for inputs read
+from files, a fingerprint function returning a cheap identity of those files (their
+size and modification time). render fans the jobs out to a process pool whose
+workers use the non-interactive Agg backend; each worker hashes the fingerprint (or,
+without one, the inputs) of its job together with the drawing function, the options
+and RENDER_VERSION, and only loads the inputs and draws the figure if that hash
+differs from the one recorded for the file in the figure directory's manifest
+(render-manifest.json). After adding runs to a sweep, only the figures whose inputs
+changed are redrawn, and the files of the unchanged ones are not read.
+
+Bump RENDER_VERSION when a drawing function changes, so that all figures are redrawn.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.colors as mcolors  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import model  # noqa: E402
+
+RENDER_VERSION = 2
+
+MANIFEST = "render-manifest.json"
+
+# Classified colour map of the infection maps: non-coffee, healthy coffee, infected coffee
+MAP_COLORS = ("#8dd3c7", "#ffffb3", "#bebada")
+MAP_BOUNDS = (-1, 0.9, 1.9, 2.9)
+
+
+@dataclass(frozen=True)
+class FigureJob:
+    """
+    One figure to render.
+
+    Attributes
+    ----------
+    name : str
+        File name in the figure directory.
+    draw : str
+        Drawing function, a key of DRAW.
+    load : callable
+        Module-level function returning the input arrays of the figure as a dict.
+    args : tuple
+        Arguments of ``load``.
+    options : dict
+        Styling passed to the drawing function (title, labels, ...).
+    fingerprint : callable, optional
+        Module-level function of ``args`` returning a JSON-serialisable identity of the
+        inputs that changes whenever they do (e.g. file sizes and modification times);
+        if None, the loaded inputs are hashed.
+    """
+    name: str
+    draw: str
+    load: Callable[..., Dict[str, np.ndarray]]
+    args: Tuple = ()
+    options: Dict[str, Any] = field(default_factory=dict)
+    fingerprint: Optional[Callable[..., Any]] = None
+
+
+# -------------------------------------------------------------------------------------
+# Loaders (run in the workers)
+# -------------------------------------------------------------------------------------
+
+def given(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Loader of inputs that are already in memory."""
+    return arrays
+
+
+@lru_cache(maxsize=None)
+def _store(path: Path):
+    from result_store import ResultStore
+    return ResultStore(path)
+
+
+@lru_cache(maxsize=None)
+def _run_parts(path: Path, stamp: int) -> Dict[Tuple[str, float, int], str]:
+    # stamp: modification time of the returns directory, which changes when parts are added
+    return _store(path).run_parts()
+
+
+def progression_maps(datadir: Path, store: Optional[Path], z: int, proportions: List[float],
+                     cluster: float) -> Dict[str, np.ndarray]:
+    """Loader of the maps of every snapshot day of run z of a configuration."""
+    if store is not None:
+        maps = _store(Path(store)).read("maps", proportions, cluster, z).sort_values("day")
+        return {f"day{row.day}": np.frombuffer(row.map, dtype=np.uint8).reshape(row.rows, row.cols)
+                for row in maps.itertuples(index=False)}
+    files = model.map_files(z, f"{list(proportions)}-{cluster}", datadir)
+    return {f"day{day}": np.load(path) if path.suffix == ".npy" else pd.read_csv(path, index_col=0).to_numpy()
+            for day, path in files.items()}
+
+
+def progression_sources(datadir: Path, store: Optional[Path], z: int, proportions: List[float],
+                        cluster: float) -> List[Tuple[str, int, int]]:
+    """
+    Fingerprint of progression_maps: (name, size, modification time) of the map files
+    of the run, or of the store part holding it (parts are never rewritten).
+    """
+    if store is not None:
+        store = Path(store)
+        part = _run_parts(store, os.stat(store / "returns").st_mtime_ns).get((str(list(proportions)), cluster, z))
+        files = [] if part is None else [store / "maps" / part]
+    else:
+        files = list(model.map_files(z, f"{list(proportions)}-{cluster}", datadir).values())
+    stats = [(path.name, path.stat()) for path in files]
+    return [(name, stat.st_size, stat.st_mtime_ns) for name, stat in stats]
+
+
+# -------------------------------------------------------------------------------------
+# Drawing functions (Agg)
+# -------------------------------------------------------------------------------------
+
+def draw_progression(path: Path, inputs: Dict[str, np.ndarray], title: str = "") -> None:
+    """Infection maps stacked vertically, in the classified colour map."""
+    cmap = mcolors.ListedColormap(MAP_COLORS)
+    norm = mcolors.BoundaryNorm(MAP_BOUNDS, cmap.N)
+    fig, axs = plt.subplots(len(inputs), 1, squeeze=False)
+    for ax, landscaped in zip(axs[:, 0], inputs.values()):
+        ax.imshow(landscaped, interpolation="none", aspect=1, cmap=cmap, norm=norm)
+        ax.set_yticklabels([])
+        ax.set_xticklabels([])
+    axs[0, 0].set_title(title)
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def draw_band(path: Path, inputs: Dict[str, np.ndarray], title: str = "", ylabel: str = "") -> None:
+    """Median of a daily metric over runs with its 25-75% and 5-95% bands."""
+    fig, ax = plt.subplots()
+    day = inputs["day"]
+    ax.fill_between(day, inputs["q05"], inputs["q95"], alpha=0.2, label="5-95%")
+    ax.fill_between(day, inputs["q25"], inputs["q75"], alpha=0.4, label="25-75%")
+    ax.plot(day, inputs["q50"], label="median")
+    ax.set_xlabel("day")
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    ax.set_title(title)
+    fig.savefig(path)
+    plt.close(fig)
+
+
+DRAW: Dict[str, Callable[..., None]] = {"progression": draw_progression, "band": draw_band}
+
+
+# -------------------------------------------------------------------------------------
+# Rendering
+# -------------------------------------------------------------------------------------
+
+def digest(job: FigureJob, inputs: Optional[Dict[str, np.ndarray]] = None) -> str:
+    """
+    Hash of everything a figure depends on: the fingerprint of its inputs (or the
+    inputs, if the job has no fingerprint), drawing function and options.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([RENDER_VERSION, job.draw, sorted(job.options.items())], default=str).encode())
+    if job.fingerprint is not None:
+        h.update(json.dumps(job.fingerprint(*job.args), default=str).encode())
+        return h.hexdigest()
+    for name in sorted(inputs):
+        array = np.ascontiguousarray(inputs[name])
+        h.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+def render_job(job: FigureJob, figdir: Path, previous: Optional[str]) -> Tuple[str, str, bool]:
+    """
+    Hash and (if the hash changed or the file is missing) draw one figure. Inputs
+    are only loaded to be hashed if the job has no fingerprint.
+
+    Returns
+    -------
+    name, hash, drawn : str, str, bool
+    """
+    inputs = None if job.fingerprint is not None else job.load(*job.args)
+    key = digest(job, inputs)
+    path = Path(figdir) / job.name
+    if key == previous and path.exists():
+        return job.name, key, False
+    if inputs is None:
+        inputs = job.load(*job.args)
+    DRAW[job.draw](path, inputs, **job.options)
+    return job.name, key, True
+
+
+def read_manifest(figdir: Path) -> Dict[str, str]:
+    path = Path(figdir) / MANIFEST
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_manifest(figdir: Path, manifest: Dict[str, str]) -> None:
+    path = Path(figdir) / MANIFEST
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=0, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def render(jobs: List[FigureJob], figdir: Path, workers: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Render the figures that changed since the last call, on a process pool.
+
+    Parameters
+    ----------
+    jobs : List[FigureJob]
+        Figures to render.
+    figdir : Path
+        Output directory, created if needed; holds the manifest of figure hashes.
+    workers : int, optional
+        Number of worker processes (default: one per CPU; 1 renders in this process).
+
+    Returns
+    -------
+    drawn, skipped : int
+        Number of figures drawn and of unchanged figures skipped.
+    """
+    figdir = Path(figdir)
+    figdir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(figdir)
+    previous = [manifest.get(job.name) for job in jobs]
+    drawn = 0
+    try:
+        if workers == 1:
+            results = map(render_job, jobs, repeat(figdir), previous)
+            for name, key, new in results:
+                manifest[name] = key
+                drawn += new
+        else:
+            workers = workers or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, min(32, len(jobs) // (4 * workers)))
+                for name, key, new in pool.map(render_job, jobs, repeat(figdir), previous, chunksize=chunksize):
+                    manifest[name] = key
+                    drawn += new
+    finally:
+        # keep the hashes of the figures done so far if a job fails
+        write_manifest(figdir, manifest)
+    return drawn, len(jobs) - drawn
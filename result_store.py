@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar result store for CLR-Landscape runs.
+
+Replaces the per-run map-*, results-*, composition-* and returns-* CSV files with one
+store per sweep: a directory holding four Parquet tables (daily, maps, composition,
+returns), each made of zstd-compressed part files of up to ``flush_every`` runs. Every row carries the
+typed partition columns proportions (the "[0.4, 0.6]" label used in the CSV names), cluster and run,
+so a configuration or run is read back with a filter instead of a directory listing.
+Maps are stored as raw uint8 bytes with their shape.
+
+Results are buffered and every flush writes one part per table, all with the same
+part number, each to a temporary file renamed into place, the returns part last: a
+batch of runs is committed (readable, and listed by completed) once its returns part
+exists, so a writer killed mid-sweep only loses the runs it had not flushed yet. A
+store is written by a single process (the sweep parent): a store opened with
+``write=True`` holds an exclusive lock on the directory until it is closed, and
+removes the parts and temporary files of batches an interrupted writer did not
+commit. Stores opened for reading (the default) never modify the directory and skip
+uncommitted parts.
+"""
+
+import fcntl
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from model import SimulationResult, datadir
+
+KEY = [("proportions", pa.string()), ("cluster", pa.float64()), ("run", pa.int32())]
+
+SCHEMAS = {
+    "daily": pa.schema(KEY + [("day", pa.int16()), ("infection_score", pa.float64()),
+                              ("infected_cells", pa.int32()), ("infected_plants", pa.int32())]),
+    "maps": pa.schema(KEY + [("day", pa.int16()), ("rows", pa.int32()), ("cols", pa.int32()),
+                             ("map", pa.binary())]),
+    "composition": pa.schema(KEY + [("day", pa.int16()), ("non_coffee", pa.int32()), ("healthy", pa.int32()),
+                                    ("infected", pa.int32())]),
+    # config: digest of the run's parameters (e.g. sweep.SweepJob.digest), null if not given
+    "returns": pa.schema(KEY + [("coffee_cherries", pa.float64()), ("config", pa.string())]),
+}
+
+# Lock file of the writer of a store
+LOCK = "write.lock"
+
+
+class ResultStore:
+    """
+    Append-only Parquet store of simulation results.
+
+    Parameters
+    ----------
+    path : Path
+        Store directory, created if needed.
+    flush_every : int
+        Number of runs buffered before a row group is written.
+    write : bool
+        Open the store for writing: create the directory, take the writer lock (an
+        error if another process holds it) and remove incomplete parts.
+    """
+
+    def __init__(self, path: Path = datadir / "store", flush_every: int = 32, write: bool = False) -> None:
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self._buffer: Dict[str, List[pa.Table]] = {name: [] for name in SCHEMAS}
+        self._buffered_runs = 0
+        self._lock = None
+        if not write:
+            return
+        for name in SCHEMAS:
+            (self.path / name).mkdir(parents=True, exist_ok=True)
+        self._lock = open(self.path / LOCK, "w")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.close()
+            raise RuntimeError(f"result store {self.path} is open for writing by another process") from None
+        # no other writer is alive, so uncommitted parts were left by an interrupted one
+        for name in SCHEMAS:
+            for part in set((self.path / name).glob("part-*.parquet")) - set(self._parts(name)):
+                part.unlink()
+            for tmp in (self.path / name).glob("part-*.tmp"):
+                tmp.unlink()
+        self._part = 1 + max([int(p.stem.split("-")[1]) for p in self.path.glob("*/part-*.parquet")], default=-1)
+
+    def _parts(self, name: str) -> List[Path]:
+        """Part files of a table whose batch is committed (has a readable returns part)."""
+        parts = []
+        for part in sorted((self.path / name).glob("part-*.parquet")):
+            try:
+                pq.read_metadata(part)
+            except (pa.ArrowInvalid, OSError):
+                continue
+            parts.append(part)
+        if name == "returns":
+            return parts
+        committed = {part.name for part in self._parts("returns")}
+        return [part for part in parts if part.name in committed]
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, result: SimulationResult, z: int, digest: Optional[str] = None) -> None:
+        """
+        Buffer the daily results, maps, compositions and harvest of run ``z``, with the
+        digest of its parameters if given.
+        """
+        if self._lock is None:
+            raise ValueError(f"result store {self.path} is not open for writing")
+        config = result.config
+        key = {"proportions": str(list(config.proportions)), "cluster": float(config.cluster), "run": z}
+
+        daily = result.daily_results.assign(**key)
+        self._buffer["daily"].append(pa.Table.from_pandas(daily, schema=SCHEMAS["daily"], preserve_index=False))
+
+        days = sorted(result.maps)
+        maps = [np.asarray(result.maps[day], dtype=np.uint8) for day in days]
+        self._buffer["maps"].append(pa.Table.from_pydict({
+            **{k: [v] * len(days) for k, v in key.items()},
+            "day": days,
+            "rows": [m.shape[0] for m in maps],
+            "cols": [m.shape[1] for m in maps],
+            "map": [m.tobytes() for m in maps],
+        }, schema=SCHEMAS["maps"]))
+
+        if result.composition is not None:
+            composition = result.composition.assign(**key)
+            self._buffer["composition"].append(pa.Table.from_pandas(composition, schema=SCHEMAS["composition"],
+                                                                     preserve_index=False))
+
+        self._buffer["returns"].append(pa.Table.from_pydict(
+            {**{k: [v] for k, v in key.items()}, "coffee_cherries": [float(result.coffee_cherries)],
+             "config": [digest]},
+            schema=SCHEMAS["returns"]))
+
+        self._buffered_runs += 1
+        if self._buffered_runs >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered runs as a new part per table, committed by its returns part."""
+        if not self._buffered_runs:
+            return
+        for name in sorted(self._buffer, key=lambda name: name == "returns"):
+            tables = self._buffer[name]
+            if not tables:
+                continue
+            part = self.path / name / f"part-{self._part:05d}.parquet"
+            tmp = part.with_suffix(".tmp")
+            pq.write_table(pa.concat_tables(tables), tmp, compression="zstd")
+            os.replace(tmp, part)
+            tables.clear()
+        self._part += 1
+        self._buffered_runs = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of runs written but not flushed yet."""
+        return self._buffered_runs
+
+    def close(self) -> None:
+        """Flush the buffered runs and release the writer lock."""
+        if self._lock is None:
+            return
+        self.flush()
+        self._lock.close()
+        self._lock = None
+
+    # ---------------------------------------------------------------------------------
+    # Reading
+    # ---------------------------------------------------------------------------------
+
+    def read(self, name: str, proportions: Optional[List[float]] = None, cluster: Optional[float] = None,
+             run: Optional[int] = None, day: Optional[int] = None, part: Optional[str] = None) -> pd.DataFrame:
+        """
+        Read one table ("daily", "maps", "composition" or "returns"), optionally filtered on its key columns
+        and on the name of the part file holding the rows (see run_parts).
+        """
+        filters = [(column, "=", value) for column, value in
+                   [("proportions", None if proportions is None else str(list(proportions))),
+                    ("cluster", cluster), ("run", run), ("day", day)] if value is not None]
+        parts = [p for p in self._parts(name) if part is None or p.name == part]
+        if not parts:
+            return SCHEMAS[name].empty_table().to_pandas()
+        return pq.read_table([str(p) for p in parts], schema=SCHEMAS[name], filters=filters or None).to_pandas()
+
+    def read_map(self, proportions: List[float], cluster: float, run: int, day: int) -> np.ndarray:
+        """Return the 0/1/2 infection map of one run on one day."""
+        row = self.read("maps", proportions, cluster, run, day).iloc[0]
+        return np.frombuffer(row["map"], dtype=np.uint8).reshape(row["rows"], row["cols"])
+
+    def run_parts(self) -> Dict[Tuple[str, float, int], str]:
+        """
+        Name of the part file holding each run, e.g. "part-00003.parquet", by key
+        (proportions, cluster, run). All tables of a run are in parts of that name; a run
+        written more than once maps to the last part holding it.
+        """
+        parts = {}
+        for part in self._parts("returns"):
+            returns = pq.read_table(part, columns=["proportions", "cluster", "run"]).to_pydict()
+            for key in zip(returns["proportions"], returns["cluster"], returns["run"]):
+                parts[key] = part.name
+        return parts
+
+    def digests(self) -> Dict[Tuple[str, float, int], Optional[str]]:
+        """Parameter digest of every run in the returns table (None if written without one), by key."""
+        returns = self.read("returns")
+        return {key: None if pd.isna(config) else config
+                for key, config in zip(zip(returns["proportions"], returns["cluster"], returns["run"]),
+                                       returns["config"])}
+
+    def completed(self) -> Set[Tuple[str, float, int]]:
+        """Keys (proportions, cluster, run) of the runs in the returns table."""
+        returns = self.read("returns")
+        return set(zip(returns["proportions"], returns["cluster"], returns["run"]))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consumers of the day stream of model.simulate_days.
+
+simulate_days yields every day of a replicate (its daily results row and, on snapshot
+days, its infection map and composition) as soon as it is done. run_pipeline pushes each day to a list
+of sinks and hands them the harvest at the end. Sinks keep as much of the stream as
+they need:
+
+- Collector keeps everything, for a SimulationResult (used by model.simulate).
+- CSVSink appends each row to results-{z}-{label}.csv and each composition to
+  composition-{z}-{label}.csv, and writes each map as it arrives, so a run of any
+  length is written with constant memory.
+- Aggregator keeps running statistics only (peak, mean, final state and composition).
+- Progress prints a line every few simulated days.
+
+Sinks attached to a checkpoint.Checkpoint report their state with every checkpoint
+(state) and are set back to it when the run resumes (restore), so the checkpoint does
+not keep the days itself: CSVSink's state is the offsets of its files, which it
+truncates to on restore, and Aggregator's state is its statistics. Collector only
+keeps the days in memory and cannot be resumed; model.simulate spools a checkpointed
+run to CSV files instead (read_csv_result reads them back).
+"""
+
+import os
+import sys
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Generator, List, Optional, TextIO, Tuple
+
+import numpy as np
+import pandas as pd
+
+from model import MapWriter, SimulationConfig, datadir, map_files, write_map_csv
+
+COLUMNS = ["infection_score", "infected_cells", "infected_plants", "day"]
+COMPOSITION_COLUMNS = ["day", "non_coffee", "healthy", "infected"]
+
+
+class Sink:
+    """Receiver of the days of one replicate; every method does nothing by default."""
+
+    def day(self, row: List[float]) -> None:
+        """Receive [infection_score, infected_cells, infected_plants, day] of one day."""
+
+    def snapshot(self, day: int, landscaped: np.ndarray) -> None:
+        """Receive the infection map of a snapshot day (after that day's row)."""
+
+    def composition(self, day: int, counts: np.ndarray) -> None:
+        """Receive the cell counts [non-coffee, healthy, infected] of a snapshot day (after its map)."""
+
+    def close(self, coffee_cherries: float) -> None:
+        """Receive the harvest once all days are done."""
+
+    def state(self) -> Dict[str, Any]:
+        """
+        Return what restore needs to continue after the days received so far, as
+        JSON-serializable values, once they are safe (e.g. flushed to disk).
+        """
+        return {}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Go back to a state returned by state, before any day of the resumed run is received."""
+
+
+def run_pipeline(days: Generator[Tuple[List[float], Optional[np.ndarray], Optional[np.ndarray]], None, float],
+                 sinks: List[Sink]) -> float:
+    """
+    Push every day of a simulate_days stream to the sinks, in order.
+
+    Returns
+    -------
+    float
+        Harvested coffee cherries, the value of the stream.
+    """
+    while True:
+        try:
+            row, landscaped, counts = next(days)
+        except StopIteration as stop:
+            for sink in sinks:
+                sink.close(stop.value)
+            return stop.value
+        for sink in sinks:
+            sink.day(row)
+            if landscaped is not None:
+                sink.snapshot(int(row[3]), landscaped)
+            if counts is not None:
+                sink.composition(int(row[3]), counts)
+
+
+class Collector(Sink):
+    """Keeps every row, map and composition of the stream."""
+
+    def __init__(self) -> None:
+        self.rows: List[List[float]] = []
+        self.maps: Dict[int, np.ndarray] = {}
+        self.compositions: List[List[int]] = []
+        self.coffee_cherries: Optional[float] = None
+
+    def day(self, row: List[float]) -> None:
+        self.rows.append(row)
+
+    def snapshot(self, day: int, landscaped: np.ndarray) -> None:
+        self.maps[day] = landscaped
+
+    def composition(self, day: int, counts: np.ndarray) -> None:
+        self.compositions.append([day, *counts.tolist()])
+
+    def close(self, coffee_cherries: float) -> None:
+        self.coffee_cherries = coffee_cherries
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        raise ValueError("a Collector keeps its days in memory only and cannot resume from a checkpoint")
+
+    def frame(self) -> pd.DataFrame:
+        """The daily results as a DataFrame with the columns of SimulationResult.daily_results."""
+        return pd.DataFrame(self.rows, columns=COLUMNS)
+
+    def composition_frame(self) -> pd.DataFrame:
+        """The compositions as a DataFrame with the columns of SimulationResult.composition."""
+        return pd.DataFrame(self.compositions, columns=COMPOSITION_COLUMNS, dtype=np.int64)
+
+
+class CSVSink(Sink):
+    """
+    Streams a replicate to the files of model.write_result: each row is appended to
+    results-{z}-{label}.csv and each composition to composition-{z}-{label}.csv (in
+    the layout of DataFrame.to_csv), and each map is written with ``map_writer`` as it
+    arrives. The files are created when the first day arrives, or reopened and
+    truncated to the saved offsets by restore.
+
+    Parameters
+    ----------
+    z : int
+        Simulation run identifier.
+    config : SimulationConfig
+        Simulation parameters, used in the file names.
+    datadir : Path
+        Output directory, created if needed.
+    map_writer : MapWriter, optional
+        Writer of the infection maps (default: write_map_csv to ``datadir``).
+    """
+
+    def __init__(self, z: int, config: SimulationConfig, datadir: Path = datadir,
+                 map_writer: Optional[MapWriter] = None) -> None:
+        self.z = z
+        self.config = config
+        self.map_writer = map_writer or partial(write_map_csv, datadir=datadir)
+        Path(datadir).mkdir(parents=True, exist_ok=True)
+        self.results_path = Path(datadir) / f"results-{z}-{config.label}.csv"
+        self.composition_path = Path(datadir) / f"composition-{z}-{config.label}.csv"
+        self._file: Optional[TextIO] = None
+        self._composition: Optional[TextIO] = None
+        self._n = 0
+
+    def _open(self) -> None:
+        if self._file is None:
+            self._file = open(self.results_path, "w")
+            self._file.write("," + ",".join(COLUMNS) + "\n")
+            self._composition = open(self.composition_path, "w")
+            self._composition.write(",".join(COMPOSITION_COLUMNS) + "\n")
+
+    def day(self, row: List[float]) -> None:
+        self._open()
+        score, cells, plants, day = row
+        self._file.write(f"{self._n},{float(score)!r},{int(cells)},{int(plants)},{int(day)}\n")
+        self._n += 1
+
+    def snapshot(self, day: int, landscaped: np.ndarray) -> None:
+        self.map_writer(landscaped, day, self.z, self.config)
+
+    def composition(self, day: int, counts: np.ndarray) -> None:
+        self._composition.write(",".join(str(int(x)) for x in [day, *counts]) + "\n")
+
+    def close(self, coffee_cherries: float) -> None:
+        self._open()
+        self._file.close()
+        self._composition.close()
+
+    def state(self) -> Dict[str, Any]:
+        self._open()
+        self._file.flush()
+        self._composition.flush()
+        return {"rows": self._n, "results": self._file.tell(), "composition": self._composition.tell()}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        # the maps of later days are written again as the run continues
+        os.truncate(self.results_path, state["results"])
+        os.truncate(self.composition_path, state["composition"])
+        self._file = open(self.results_path, "a")
+        self._composition = open(self.composition_path, "a")
+        self._n = state["rows"]
+
+
+def read_csv_result(z: int, config: SimulationConfig, datadir: Path = datadir
+                    ) -> Tuple[pd.DataFrame, Dict[int, np.ndarray], pd.DataFrame]:
+    """
+    Read back the daily results, maps and compositions a CSVSink wrote, exactly as a
+    Collector would have kept them (the maps must be .npy files, see model.write_map_npy).
+    """
+    daily = pd.read_csv(Path(datadir) / f"results-{z}-{config.label}.csv", usecols=COLUMNS,
+                        float_precision="round_trip")
+    maps = {day: np.load(path) for day, path in map_files(z, config.label, datadir).items()}
+    composition = pd.read_csv(Path(datadir) / f"composition-{z}-{config.label}.csv", dtype=np.int64)
+    return daily, maps, composition
+
+
+class Aggregator(Sink):
+    """
+    Running statistics of a replicate, in constant memory.
+
+    Attributes
+    ----------
+    days : int
+        Number of days received.
+    peak_infected_plants, peak_day : int
+        Largest number of infected plants and the first day it was reached.
+    mean_infection_score : float
+        Mean of the daily infection score.
+    last : list
+        Row of the last day.
+    composition_counts : np.ndarray
+        Cell counts [non-coffee, healthy, infected] of the last snapshot day.
+    coffee_cherries : float
+        Harvest, once the stream is done.
+    """
+
+    def __init__(self) -> None:
+        self.days = 0
+        self.peak_infected_plants = 0
+        self.peak_day = 0
+        self._score_sum = 0.0
+        self.last: Optional[List[float]] = None
+        self.composition_counts: Optional[np.ndarray] = None
+        self.coffee_cherries: Optional[float] = None
+
+    def day(self, row: List[float]) -> None:
+        self.days += 1
+        self._score_sum += row[0]
+        if row[2] > self.peak_infected_plants:
+            self.peak_infected_plants = int(row[2])
+            self.peak_day = int(row[3])
+        self.last = row
+
+    def composition(self, day: int, counts: np.ndarray) -> None:
+        self.composition_counts = counts
+
+    @property
+    def mean_infection_score(self) -> float:
+        return self._score_sum / self.days if self.days else 0.0
+
+    def close(self, coffee_cherries: float) -> None:
+        self.coffee_cherries = coffee_cherries
+
+    def state(self) -> Dict[str, Any]:
+        last = None if self.last is None else [float(self.last[0]), *(int(x) for x in self.last[1:])]
+        counts = None if self.composition_counts is None else self.composition_counts.tolist()
+        return {"days": self.days, "peak_infected_plants": self.peak_infected_plants, "peak_day": self.peak_day,
+                "score_sum": self._score_sum, "last": last, "composition_counts": counts}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        self.days = state["days"]
+        self.peak_infected_plants = state["peak_infected_plants"]
+        self.peak_day = state["peak_day"]
+        self._score_sum = state["score_sum"]
+        self.last = state["last"]
+        counts = state["composition_counts"]
+        self.composition_counts = None if counts is None else np.array(counts, dtype=np.int64)
+
+    def summary(self) -> Dict[str, float]:
+        """All statistics as a flat dictionary."""
+        final = dict(zip(COLUMNS, self.last)) if self.last is not None else {}
+        if self.composition_counts is not None:
+            final.update(zip(COMPOSITION_COLUMNS[1:], self.composition_counts.tolist()))
+        return {"days": self.days, "peak_infected_plants": self.peak_infected_plants, "peak_day": self.peak_day,
+                "mean_infection_score": self.mean_infection_score,
+                **{f"final_{k}": v for k, v in final.items() if k != "day"},
+                "coffee_cherries": self.coffee_cherries}
+
+
+class Progress(Sink):
+    """Prints the day, infected plants and simulation speed every ``every`` days."""
+
+    def __init__(self, every: int = 30, stream: TextIO = sys.stdout) -> None:
+        self.every = every
+        self.stream = stream
+        self._start = time.perf_counter()
+        self._next = 0
+
+    def day(self, row: List[float]) -> None:
+        day = int(row[3])
+        if day >= self._next:
+            rate = (day + 1) / max(time.perf_counter() - self._start, 1e-9)
+            print(f"day {day}: {int(row[2])} infected plants in {int(row[1])} cells ({rate:.0f} days/s)",
+                  file=self.stream, flush=True)
+            self._next = day - day % self.every + self.every
+
+    def close(self, coffee_cherries: float) -> None:
+        print(f"harvest: {coffee_cherries:.0f} coffee cherries", file=self.stream, flush=True)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sparse, coffee-only landscape representation.
+
+Stores only the coffee cells of a landscape, in row-major order, together with a CSR
+adjacency list of their coffee neighbours in the 8-neighbourhood. Grid bounds and
+non-coffee cells are handled once, at construction, so callers never filter
+neighbour coordinates again. The grid is either bounded (cells on the edge have fewer
+neighbours) or, with ``wrap``, toroidal (opposite edges are adjacent). Memory is proportional to the number of
+coffee cells; positions are looked up by binary search on the row-major cell keys
+rather than in a dense (rows, cols) table, so the full grid is never materialised
+unless asked for with to_dense.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Row and column offsets of the 8-neighbourhood
+OFFSETS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+
+
+@dataclass
+class SparseLandscape:
+    """
+    Coffee cells of a landscape and their coffee neighbours.
+
+    Attributes
+    ----------
+    shape : tuple
+        (rows, cols) of the full grid.
+    rows, cols : np.ndarray
+        Position of every coffee cell, in row-major order.
+    indptr, indices : np.ndarray
+        CSR adjacency: the coffee neighbours of cell ``c`` are
+        ``indices[indptr[c]:indptr[c + 1]]``, in ascending order.
+    wrap : bool
+        Whether neighbourhoods wrap around the edges of the grid (toroidal).
+    """
+    shape: Tuple[int, int]
+    rows: np.ndarray
+    cols: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    wrap: bool = False
+    _adjacency: Optional[sparse.csr_matrix] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_mask(cls, landscape: pd.DataFrame, wrap: bool = False) -> "SparseLandscape":
+        """Build from a dense boolean landscape (True = coffee), e.g. from make_landscape."""
+        mask = np.asarray(landscape, dtype=bool)
+        rows, cols = np.nonzero(mask)
+        return cls.from_coordinates(mask.shape, rows, cols, wrap)
+
+    @classmethod
+    def from_coordinates(cls, shape: Tuple[int, int], rows: np.ndarray, cols: np.ndarray,
+                         wrap: bool = False) -> "SparseLandscape":
+        """
+        Build from the positions of the coffee cells, without a dense mask. Positions
+        are sorted into row-major order; duplicates are dropped. With ``wrap`` the
+        neighbourhoods wrap around the edges of the grid.
+        """
+        n_cols = shape[1]
+        keys = np.unique(np.asarray(rows, dtype=np.int64) * n_cols + np.asarray(cols, dtype=np.int64))
+        rows, cols = np.divmod(keys, n_cols)
+        n_cells = keys.size
+        sources = []
+        targets = []
+        for dr, dc in OFFSETS:
+            r = rows + dr
+            c = cols + dc
+            if wrap:
+                r %= shape[0]
+                c %= n_cols
+            inside = np.flatnonzero((r >= 0) & (r < shape[0]) & (c >= 0) & (c < n_cols))
+            neighbor = _find(keys, r[inside] * n_cols + c[inside])
+            coffee = neighbor >= 0
+            sources.append(inside[coffee])
+            targets.append(neighbor[coffee])
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+        if wrap:
+            # on grids narrower than 3 cells wrapped offsets can reach the cell itself, or a neighbour twice
+            pairs = np.unique(sources * n_cells + targets)
+            sources, targets = np.divmod(pairs[pairs // n_cells != pairs % n_cells], n_cells)
+        order = np.lexsort((targets, sources))
+        indptr = np.zeros(n_cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n_cells), out=indptr[1:])
+        return cls(tuple(shape), rows, cols, indptr, targets[order], wrap)
+
+    @property
+    def n_cells(self) -> int:
+        return self.rows.size
+
+    def lookup(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Coffee cell index of the given positions; -1 for non-coffee or outside the grid."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        cells = np.full(rows.shape, -1, dtype=np.int64)
+        keys = self.rows * self.shape[1] + self.cols
+        cells[inside] = _find(keys, rows[inside] * self.shape[1] + cols[inside])
+        return cells
+
+    def neighbors(self, cell: int) -> np.ndarray:
+        """Coffee neighbours of a coffee cell, in ascending order."""
+        return self.indices[self.indptr[cell]:self.indptr[cell + 1]]
+
+    @property
+    def adjacency(self) -> sparse.csr_matrix:
+        """(n_cells, n_cells) 0/1 adjacency matrix, for neighbour sums of per-cell values."""
+        if self._adjacency is None:
+            data = np.ones(self.indices.size)
+            self._adjacency = sparse.csr_matrix((data, self.indices, self.indptr), shape=(self.n_cells,) * 2)
+        return self._adjacency
+
+    def to_dense(self) -> np.ndarray:
+        """Dense boolean coffee mask of the full grid."""
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[self.rows, self.cols] = True
+        return mask
+
+
+def _find(keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Index of every value in the sorted keys, -1 where it is missing."""
+    found = np.searchsorted(keys, values)
+    found[found == keys.size] = 0
+    return np.where(keys[found] == values, found, -1) if keys.size else np.full(values.shape, -1)
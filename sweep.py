@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameter sweep runner for the CLR-Landscape model.
+
+Runs every (proportions, cluster) configuration of a parameter grid for a number of
+replicates, distributing the (configuration, replicate) jobs over a process pool.
+Each job gets its own random streams, derived from the sweep seed and the job's
+position in the grid, so results do not depend on scheduling or worker count.
+Outputs either use the CSV naming scheme of model.py (map-*, results-*, returns-*)
+or go to a single columnar store (result_store.py) written by the parent process.
+Landscapes and weather schedules are seeded per replicate only, so all configurations
+with the same size, cluster and proportions run on the same landscapes (which can be
+shared through an on-disk LandscapeCache), and all configurations see the same
+weather. Finished jobs are recorded in a journal (the CSV journal in the data
+directory, or the store's returns table once their batch is flushed) with a digest
+of their parameters, and an interrupted sweep resumes by skipping the jobs recorded
+with the same parameters. A failing job does not stop the others; the failures are
+reported at the end. With a checkpoint directory, every job also saves its state
+(checkpoint.py) every few simulated days, so the jobs that were running (or not yet
+flushed to the store) when the sweep was interrupted continue from their latest
+checkpoint.
+"""
+
+import argparse
+import dataclasses
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import model
+from model import DEFAULT_CONFIG, SimulationConfig, SimulationResult
+from checkpoint import Checkpoint
+from landscape_cache import LandscapeCache
+from result_store import ResultStore
+
+# Parameter grid used in plot_results-final.py
+proportions_used: List[List[float]] = [[0.1, 0.9], [0.25, 0.75], [0.4, 0.6]]
+cluster_used: List[float] = [0.2, 0.3, 0.4]
+
+JOURNAL_COLUMNS = ["proportions", "cluster", "run", "coffee_cherries", "config"]
+
+
+@dataclass(frozen=True)
+class SweepJob:
+    """
+    One replicate of one configuration.
+
+    Attributes
+    ----------
+    config : SimulationConfig
+        Parameters of the configuration.
+    run : int
+        Replicate number within the configuration.
+    config_index : int
+        Position of the configuration in the parameter grid.
+    seed : int
+        Sweep seed; the job's streams are spawned from (seed, config_index, run).
+    """
+    config: SimulationConfig
+    run: int
+    config_index: int
+    seed: int
+
+    @property
+    def key(self) -> Tuple[str, float, int]:
+        return (str(list(self.config.proportions)), self.config.cluster, self.run)
+
+    @property
+    def digest(self) -> str:
+        """Digest of everything the job's results depend on: its full config and the sweep seed."""
+        return hashlib.blake2b(repr((self.config, self.seed)).encode(), digest_size=8).hexdigest()
+
+    @property
+    def seed_sequence(self) -> np.random.SeedSequence:
+        return np.random.SeedSequence(self.seed, spawn_key=(self.config_index, self.run))
+
+    @property
+    def landscape_seed(self) -> int:
+        return model.landscape_seed(self.seed, self.run)
+
+
+def make_jobs(proportions: Sequence[Sequence[float]], clusters: Sequence[float], runs: int,
+              seed: int = 0, base: SimulationConfig = DEFAULT_CONFIG) -> List[SweepJob]:
+    """Return the jobs of the full proportions x cluster x replicates grid, varying ``base``."""
+    jobs = []
+    for config_index, (p, c) in enumerate((p, c) for p in proportions for c in clusters):
+        config = dataclasses.replace(base, proportions=tuple(p), cluster=c)
+        for z in range(runs):
+            jobs.append(SweepJob(config, z, config_index, seed))
+    return jobs
+
+
+def job_landscape(job: SweepJob, cache: Optional[LandscapeCache] = None) -> pd.DataFrame:
+    """Return the job's landscape, from the cache if one is given."""
+    if cache is not None:
+        return cache.for_config(job.config, job.landscape_seed)
+    config = job.config
+    return model.make_landscape(config.size, config.cluster, config.proportions, job.landscape_seed)
+
+
+def job_weather(job: SweepJob) -> np.ndarray:
+    """Return the job's weather schedule, drawn from the replicate's weather stream."""
+    return model.weather_schedule(job.config, model.weather_rng(job.seed, job.run))
+
+
+def job_checkpoint(job: SweepJob, checkpoints: Optional[Path], every: int = 30) -> Optional[Checkpoint]:
+    """Return the job's checkpoint in the ``checkpoints`` directory, if one is given."""
+    if checkpoints is None:
+        return None
+    return Checkpoint(Path(checkpoints) / f"checkpoint-{job.run}-{job.config.label}.npz", every)
+
+
+def remove_checkpoints(jobs: List[SweepJob], checkpoints: Optional[Path]) -> None:
+    """Remove the checkpoints of recorded jobs, if checkpoints are kept."""
+    if checkpoints is not None:
+        for job in jobs:
+            job_checkpoint(job, checkpoints).remove()
+
+
+def run_job(job: SweepJob, cache: Optional[LandscapeCache] = None, checkpoints: Optional[Path] = None,
+            every: int = 30) -> Tuple[SweepJob, float]:
+    """Run one job in the current process, write its outputs and return it with its harvest."""
+    return job, model.run_simulation(job.run, job.config, job.seed_sequence, job_landscape(job, cache),
+                                     job_weather(job), job_checkpoint(job, checkpoints, every))
+
+
+def simulate_job(job: SweepJob, cache: Optional[LandscapeCache] = None, checkpoints: Optional[Path] = None,
+                 every: int = 30) -> Tuple[SweepJob, SimulationResult]:
+    """Run one job in the current process and return it with its result, for the parent to store."""
+    return job, model.simulate(job.config, job.seed_sequence, job_landscape(job, cache), job_weather(job),
+                               checkpoint=job_checkpoint(job, checkpoints, every))
+
+
+def journal_path() -> str:
+    return f"{model.datadir}/sweep-journal.csv"
+
+
+def read_journal() -> pd.DataFrame:
+    """
+    Return the finished jobs recorded in the journal. Jobs recorded before digests
+    were journaled have an empty "config".
+    """
+    if not os.path.exists(journal_path()):
+        return pd.DataFrame(columns=JOURNAL_COLUMNS)
+    journal = pd.read_csv(journal_path())
+    if "config" not in journal:
+        journal["config"] = None
+    return journal
+
+
+def append_journal(job: SweepJob, coffee_cherries: float) -> None:
+    """Record a finished job; the journal is only written by the parent process."""
+    if os.path.exists(journal_path()) and "config" not in pd.read_csv(journal_path(), nrows=0):
+        # journal written before the digest column: rewrite it with the column
+        read_journal().to_csv(journal_path(), index=False)
+    row = pd.DataFrame([[*job.key, coffee_cherries, job.digest]], columns=JOURNAL_COLUMNS)
+    row.to_csv(journal_path(), mode="a", header=not os.path.exists(journal_path()), index=False)
+
+
+def finished(journal: pd.DataFrame, jobs: List[SweepJob]) -> pd.DataFrame:
+    """
+    The journal rows of the given jobs recorded with their current parameters (or
+    without a digest), the latest one per job.
+    """
+    digests: Dict[Tuple[str, float, int], str] = {job.key: job.digest for job in jobs}
+    keys = list(zip(journal["proportions"], journal["cluster"], journal["run"]))
+    current = np.array([key in digests and (pd.isna(config) or config == digests[key])
+                        for key, config in zip(keys, journal["config"])], dtype=bool)
+    return journal[current].drop_duplicates(["proportions", "cluster", "run"], keep="last")
+
+
+def write_returns(journal: pd.DataFrame, runs: int) -> None:
+    """Write returns-{proportions}-{cluster}.csv for every configuration with all runs finished."""
+    for (p, c), group in journal.groupby(["proportions", "cluster"]):
+        if group["run"].nunique() == runs:
+            returns = pd.DataFrame([(x, runs) for x in group.sort_values("run")["coffee_cherries"]])
+            returns.to_csv(F"{model.datadir}/returns-{p}-{c}.csv")
+
+
+def run_sweep(jobs: List[SweepJob], runs: int, workers: int = None,
+              store: Optional[Union[str, Path]] = None, cache: Optional[LandscapeCache] = None,
+              checkpoints: Optional[Path] = None, checkpoint_every: int = 30) -> None:
+    """
+    Run all jobs not yet finished on a process pool and write their outputs.
+
+    Parameters
+    ----------
+    jobs : List[SweepJob]
+        Jobs of the sweep, e.g. from make_jobs.
+    runs : int
+        Number of replicates per configuration.
+    workers : int, optional
+        Number of worker processes (default: all cores).
+    store : str or Path, optional
+        Result store directory. If given, results are appended to the store instead of
+        being written as CSV files, and the store's returns table is the journal.
+    cache : LandscapeCache, optional
+        Landscape cache shared by the workers.
+    checkpoints : Path, optional
+        Directory of the job checkpoints. A job's checkpoint is removed once the job
+        is recorded in the journal (or flushed to the store).
+    checkpoint_every : int
+        Simulated days between checkpoints.
+
+    Raises
+    ------
+    RuntimeError
+        If jobs failed; all other jobs are run and journaled first.
+    ValueError
+        If the store holds runs of the sweep's configurations with other parameters.
+    """
+    model.datadir.mkdir(exist_ok=True)
+    if store is None:
+        journal = finished(read_journal(), jobs)
+        done: Set[Tuple[str, float, int]] = set(zip(journal["proportions"], journal["cluster"], journal["run"]))
+    else:
+        results = ResultStore(store, write=True)
+        stored = results.digests()
+        other = [job.key for job in jobs if stored.get(job.key, job.digest) not in (None, job.digest)]
+        if other:
+            results.close()
+            raise ValueError(f"{store} holds {len(other)} runs of this sweep with other parameters, "
+                             f"e.g. {other[0]}; use another store")
+        done = set(stored)
+    todo = [job for job in jobs if job.key not in done]
+    print(f"{len(jobs) - len(todo)} of {len(jobs)} jobs already done")
+    failed: List[Tuple[SweepJob, BaseException]] = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        if store is None:
+            futures = {pool.submit(run_job, job, cache, checkpoints, checkpoint_every): job for job in todo}
+            for n, future in enumerate(as_completed(futures), 1):
+                if future.exception() is not None:
+                    failed.append((futures[future], future.exception()))
+                    print(f"failed {futures[future].key} ({n}/{len(todo)}): {future.exception()!r}")
+                    continue
+                job, coffee_cherries = future.result()
+                append_journal(job, coffee_cherries)
+                remove_checkpoints([job], checkpoints)
+                print(f"finished {job.key} ({n}/{len(todo)})")
+        else:
+            unflushed: List[SweepJob] = []
+            with results:
+                futures = {pool.submit(simulate_job, job, cache, checkpoints, checkpoint_every): job
+                           for job in todo}
+                for n, future in enumerate(as_completed(futures), 1):
+                    if future.exception() is not None:
+                        failed.append((futures[future], future.exception()))
+                        print(f"failed {futures[future].key} ({n}/{len(todo)}): {future.exception()!r}")
+                        continue
+                    job, result = future.result()
+                    results.write(result, job.run, job.digest)
+                    unflushed.append(job)
+                    if not results.pending:
+                        # the batch is flushed, so its jobs are recorded in the store
+                        remove_checkpoints(unflushed, checkpoints)
+                        unflushed.clear()
+                    print(f"finished {job.key} ({n}/{len(todo)})")
+            remove_checkpoints(unflushed, checkpoints)
+    if store is None:
+        write_returns(finished(read_journal(), jobs), runs)
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(todo)} jobs failed, rerun the sweep to retry them: "
+                           + ", ".join(f"{job.key}: {error!r}" for job, error in failed))
+
+
+def parse_proportions(value: str) -> List[float]:
+    return [float(x) for x in value.split(",")]
+
+
+def parse_tiles(value: str) -> Tuple[int, ...]:
+    return tuple(int(x) for x in value.split(","))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a CLR-Landscape parameter sweep.")
+    parser.add_argument("--proportions", type=parse_proportions, nargs="+", default=proportions_used,
+                        help="coffee,non-coffee proportions, e.g. 0.1,0.9 0.4,0.6")
+    parser.add_argument("--cluster", type=float, nargs="+", default=cluster_used)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=["plants", "arrays", "numba", "tiled"],
+                        default=DEFAULT_CONFIG.simulation_engine,
+                        help="simulation engine; every job of the tiled engine starts one process per tile")
+    parser.add_argument("--tiles", type=parse_tiles, default=DEFAULT_CONFIG.tiles,
+                        help="rows,columns of tiles of the tiled engine, e.g. 2,2")
+    parser.add_argument("--store", type=Path, nargs="?", const=model.datadir / "store", default=None,
+                        help="write to a columnar result store (default directory: data/store) instead of CSV files")
+    parser.add_argument("--landscape-cache", type=Path, nargs="?", const=model.datadir / "landscapes", default=None,
+                        help="cache landscapes on disk (default directory: data/landscapes)")
+    parser.add_argument("--cache-mb", type=int, default=256, help="disk budget of the landscape cache in MB")
+    parser.add_argument("--checkpoints", type=Path, nargs="?", const=model.datadir / "checkpoints", default=None,
+                        help="checkpoint running jobs (default directory: data/checkpoints)")
+    parser.add_argument("--checkpoint-every", type=int, default=30, help="simulated days between checkpoints")
+    args = parser.parse_args()
+    base = dataclasses.replace(DEFAULT_CONFIG, simulation_engine=args.engine, tiles=args.tiles)
+    cache = None if args.landscape_cache is None else LandscapeCache(args.landscape_cache, args.cache_mb * 2**20)
+    run_sweep(make_jobs(args.proportions, args.cluster, args.runs, args.seed, base), args.runs, args.workers,
+              args.store, cache, args.checkpoints, args.checkpoint_every)
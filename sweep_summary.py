@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One-pass aggregation of a sweep for plot_results-final.py.
+
+aggregate reads every run of a sweep once, configuration by configuration, from the
+CSV files in the data directory (results-{z}-{label}.csv and composition-{z}-{label}.csv)
+or from a ResultStore, and reduces it to two small tables:
+
+- runs: one row per run with the day of its last snapshot and the composition of
+  that snapshot (non-coffee, healthy and infected coffee cells, as counted by the
+  engine) and their shares, the table behind grouped_mean, grouped_min, grouped_max,
+  top and bottom. Runs written before compositions were recorded are counted from
+  their last map instead.
+- bands: per configuration, day and metric (infection_score, infected_cells,
+  infected_plants), the mean and the QUANTILES of the metric over the runs, for the
+  line plots.
+
+Only one configuration's daily results are held in memory at a time. The tables are
+written to summary-runs.csv and summary-bands.csv in the data directory, with a stamp
+of the runs they summarise in summary-stamp.txt: the size and modification time of
+every run's CSV files, or the store part holding every run (parts are never
+rewritten). load_summary reads the tables back and rebuilds them only when that stamp
+changed, i.e. when runs were added, removed or rewritten, so re-plotting never touches
+the per-run files. A run written to a store more than once is read from its last part.
+
+    python sweep_summary.py            # (re)build data/summary-*.csv
+"""
+
+import argparse
+import hashlib
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+import model
+
+METRICS = ["infection_score", "infected_cells", "infected_plants"]
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+KEY = ["proportions", "clustering", "run"]
+RUN_COLUMNS = KEY + ["final_day", "trees", "uninfected", "infected", "total_cafe", "infected_percent", "uninfected_percent",
+                     "tree_percent", "total_cafe_percent"]
+BAND_COLUMNS = ["proportions", "clustering", "day", "metric", "mean"] + [f"q{round(q * 100):02d}" for q in QUANTILES]
+
+# results-{z}-{proportions}-{cluster}.csv, e.g. results-3-[0.4, 0.6]-0.2.csv
+RESULTS_NAME = re.compile(r"results-(\d+)-(\[[^\]]*\])-([^-]+)\.csv")
+
+# A run: (proportions label, e.g. "[0.4, 0.6]", cluster, run)
+RunKey = Tuple[str, float, int]
+
+
+def coffee_share(label: str) -> float:
+    """Coffee proportion of a proportions label, the "proportions" column of the tables."""
+    return float(label.strip("[]").split(",")[0])
+
+
+def map_composition(landscaped: np.ndarray) -> np.ndarray:
+    """Cell counts [non-coffee, healthy, infected] of a 0/1/2 infection map."""
+    return np.bincount(np.asarray(landscaped, dtype=np.int64).ravel(), minlength=3)[:3]
+
+
+def composition_shares(counts: np.ndarray) -> List[float]:
+    """
+    Cell counts [non-coffee, healthy, infected] and their shares, in the order of
+    RUN_COLUMNS after the key.
+    """
+    trees, uninfected, infected = (int(x) for x in counts)
+    total_cafe = uninfected + infected
+    cells = trees + total_cafe
+    return [trees, uninfected, infected, total_cafe, infected / total_cafe, uninfected / total_cafe,
+            trees / cells, total_cafe / cells]
+
+
+class CSVRuns:
+    """Runs of a sweep written as CSV (or .npy map) files in ``datadir``."""
+
+    def __init__(self, datadir: Path = model.datadir) -> None:
+        self.datadir = Path(datadir)
+
+    def keys(self) -> Set[RunKey]:
+        keys = set()
+        for path in self.datadir.glob("results-*.csv"):
+            match = RESULTS_NAME.fullmatch(path.name)
+            if match:
+                keys.add((match.group(2), float(match.group(3)), int(match.group(1))))
+        return keys
+
+    def stamps(self) -> Dict[RunKey, list]:
+        """Size and modification time of the results and composition files of every run."""
+        stamps = {}
+        for label, cluster, z in self.keys():
+            files = [self.datadir / f"{kind}-{z}-{label}-{cluster}.csv" for kind in ("results", "composition")]
+            stats = [(path.name, path.stat()) for path in files if path.exists()]
+            stamps[(label, cluster, z)] = [(name, stat.st_size, stat.st_mtime_ns) for name, stat in stats]
+        return stamps
+
+    def configuration(self, label: str, cluster: float, runs: List[int]) -> Iterator[Tuple[int, pd.DataFrame, int,
+                                                                                           np.ndarray]]:
+        """
+        (run, daily results, last snapshot day, composition on that day) of the given
+        runs of one configuration.
+        """
+        config = f"{label}-{cluster}"
+        for z in runs:
+            daily = pd.read_csv(self.datadir / f"results-{z}-{config}.csv", usecols=["day"] + METRICS)
+            composition = self.datadir / f"composition-{z}-{config}.csv"
+            if composition.exists():
+                final = pd.read_csv(composition).sort_values("day").iloc[-1]
+                yield z, daily, int(final["day"]), final[["non_coffee", "healthy", "infected"]].to_numpy()
+                continue
+            maps = model.map_files(z, config, self.datadir)
+            if not maps:
+                raise FileNotFoundError(f"no composition or map files of run {z} of {config} in {self.datadir}")
+            day, path = list(maps.items())[-1]
+            if path.suffix == ".npy":
+                final = np.load(path)
+            else:
+                final = pd.read_csv(path, index_col=0).to_numpy()
+            yield z, daily, day, map_composition(final)
+
+
+class StoreRuns:
+    """Runs of a sweep in a ResultStore; each configuration is read with filtered scans."""
+
+    def __init__(self, store) -> None:
+        self.store = store
+        self._parts: Optional[Dict[RunKey, str]] = None
+
+    def stamps(self) -> Dict[RunKey, str]:
+        """Name of the last part holding every run (see ResultStore.run_parts), read once."""
+        if self._parts is None:
+            self._parts = self.store.run_parts()
+        return self._parts
+
+    def keys(self) -> Set[RunKey]:
+        return set(self.stamps())
+
+    def latest(self, name: str, label: str, cluster: float, runs: List[int]) -> pd.DataFrame:
+        """Rows of a table of the given runs of one configuration, each read from the last part holding it."""
+        proportions = [float(x) for x in label.strip("[]").split(",")]
+        parts: Dict[str, List[int]] = defaultdict(list)
+        for z in runs:
+            parts[self.stamps()[(label, cluster, z)]].append(z)
+        tables = [self.store.read(name, proportions, cluster, part=part) for part in sorted(parts)]
+        return pd.concat([table[table["run"].isin(parts[part])] for part, table in zip(sorted(parts), tables)],
+                         ignore_index=True)
+
+    def configuration(self, label: str, cluster: float, runs: List[int]) -> Iterator[Tuple[int, pd.DataFrame, int,
+                                                                                           np.ndarray]]:
+        daily = dict(tuple(self.latest("daily", label, cluster, runs).groupby("run")))
+        composition = last_snapshots(self.latest("composition", label, cluster, runs))
+        maps = None
+        for z in runs:
+            if z in composition.index:
+                row = composition.loc[z]
+                yield z, daily[z], int(row["day"]), row[["non_coffee", "healthy", "infected"]].to_numpy()
+                continue
+            if maps is None:
+                maps = last_snapshots(self.latest("maps", label, cluster, runs))
+            row = maps.loc[z]
+            yield z, daily[z], int(row["day"]), map_composition(
+                np.frombuffer(row["map"], dtype=np.uint8).reshape(row["rows"], row["cols"]))
+
+
+def last_snapshots(snapshots: pd.DataFrame) -> pd.DataFrame:
+    """The row of the last snapshot day of every run of a table, indexed by run."""
+    return snapshots.sort_values("day").groupby("run").last()
+
+
+def source(datadir: Path = model.datadir, store=None):
+    """The runs of the sweep: the store if one is given, else the CSV files of ``datadir``."""
+    return CSVRuns(datadir) if store is None else StoreRuns(store)
+
+
+def configuration_bands(label: str, cluster: float, daily: List[pd.DataFrame]) -> pd.DataFrame:
+    """Mean and quantiles over the runs of one configuration, per day and metric."""
+    n_days = 1 + max(int(d["day"].max()) for d in daily)
+    values = np.full((len(METRICS), len(daily), n_days), np.nan)
+    for r, d in enumerate(daily):
+        values[:, r, d["day"].to_numpy()] = d[METRICS].to_numpy().T
+    frames = []
+    for m, metric in enumerate(METRICS):
+        quantiles = np.nanquantile(values[m], QUANTILES, axis=0)
+        frames.append(pd.DataFrame({"proportions": coffee_share(label), "clustering": cluster,
+                                    "day": np.arange(n_days), "metric": metric,
+                                    "mean": np.nanmean(values[m], axis=0),
+                                    **dict(zip(BAND_COLUMNS[5:], quantiles))}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def aggregate(runs) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reduce all runs of a sweep in one pass.
+
+    Parameters
+    ----------
+    runs : CSVRuns or StoreRuns
+        Runs of the sweep (see source).
+
+    Returns
+    -------
+    runs : pd.DataFrame
+        One row per run, with the columns RUN_COLUMNS.
+    bands : pd.DataFrame
+        One row per configuration, day and metric, with the columns BAND_COLUMNS.
+    """
+    configurations: Dict[Tuple[str, float], List[int]] = defaultdict(list)
+    for label, cluster, z in runs.keys():
+        configurations[(label, cluster)].append(z)
+    rows = []
+    bands = []
+    for (label, cluster), zs in sorted(configurations.items(), key=lambda x: (coffee_share(x[0][0]), x[0][1])):
+        daily = []
+        for z, results, day, counts in runs.configuration(label, cluster, sorted(zs)):
+            daily.append(results)
+            rows.append([coffee_share(label), cluster, z, day] + composition_shares(counts))
+        bands.append(configuration_bands(label, cluster, daily))
+    bands = pd.concat(bands, ignore_index=True) if bands else pd.DataFrame(columns=BAND_COLUMNS)
+    return pd.DataFrame(rows, columns=RUN_COLUMNS), bands
+
+
+def summary_paths(datadir: Path = model.datadir) -> Tuple[Path, Path]:
+    return Path(datadir) / "summary-runs.csv", Path(datadir) / "summary-bands.csv"
+
+
+def stamp_path(datadir: Path = model.datadir) -> Path:
+    return Path(datadir) / "summary-stamp.txt"
+
+
+def sweep_stamp(runs) -> str:
+    """Hash of the stamps of all runs of a sweep (CSVRuns or StoreRuns), which changes with any run."""
+    stamps = sorted(runs.stamps().items())
+    return hashlib.blake2b(json.dumps(stamps, default=str).encode(), digest_size=16).hexdigest()
+
+
+def write_summary(datadir: Path = model.datadir, store=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Aggregate the sweep in ``datadir`` (or ``store``) and write the summary tables and their stamp."""
+    runs_source = source(datadir, store)
+    # stamped before reading, so runs written meanwhile make the next load_summary rebuild
+    stamp = sweep_stamp(runs_source)
+    runs, bands = aggregate(runs_source)
+    runs_path, bands_path = summary_paths(datadir)
+    runs.to_csv(runs_path, index=False)
+    bands.to_csv(bands_path, index=False)
+    stamp_path(datadir).write_text(stamp)
+    return runs, bands
+
+
+def load_summary(datadir: Path = model.datadir, store=None,
+                 rebuild: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read the summary tables, (re)building them first if they are missing or have other
+    columns than RUN_COLUMNS, if the stamp of the sweep's runs changed since they were
+    written (see sweep_stamp), or if ``rebuild`` is set.
+
+    Returns
+    -------
+    runs, bands : pd.DataFrame
+        The tables of aggregate.
+    """
+    runs_path, bands_path = summary_paths(datadir)
+    stamp = stamp_path(datadir)
+    if (not rebuild and runs_path.exists() and bands_path.exists() and stamp.exists()
+            and stamp.read_text() == sweep_stamp(source(datadir, store))):
+        runs = pd.read_csv(runs_path, float_precision="round_trip")
+        if list(runs.columns) == RUN_COLUMNS:
+            return runs, pd.read_csv(bands_path, float_precision="round_trip")
+    return write_summary(datadir, store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate a sweep into the summary tables of the plots.")
+    parser.add_argument("--datadir", type=Path, default=model.datadir)
+    parser.add_argument("--store", type=Path, nargs="?", const=model.datadir / "store", default=None,
+                        help="read the runs from a result store (default directory: data/store)")
+    args = parser.parse_args()
+    store = None
+    if args.store is not None:
+        from result_store import ResultStore
+        store = ResultStore(args.store)
+    runs, bands = write_summary(args.datadir, store)
+    print(f"summarised {len(runs)} runs of {len(bands.groupby(['proportions', 'clustering']))} configurations "
+          f"in {', '.join(str(p) for p in summary_paths(args.datadir))}")
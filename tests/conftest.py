@@ -0,0 +1,5 @@
+# The modules are top-level scripts in the repository root
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,61 @@
+"""A batch of one replicate follows the arrays engine with the convolution rule."""
+
+import dataclasses
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import array_engine
+import batched
+import model
+
+
+@pytest.mark.parametrize("boundary", ["bounded", "toroidal"])
+def test_single_replicate_matches_arrays(boundary):
+    config = dataclasses.replace(batched.BATCH_CONFIG, size=20, n_days=200, boundary=boundary)
+    landscape = model.make_landscape(config.size, config.cluster, config.proportions, 7)
+    weather = model.weather_schedule(config, np.random.default_rng(1))
+    # global spread picks among the healthy plants in another order in a batch
+    weather[:, 2] = False
+
+    plants = array_engine.PlantArrays.from_landscape(landscape, config.plants_per_cell, config.resistance, config)
+    batch = batched.Batch.from_landscapes([landscape], config, [np.random.default_rng(2)])
+    # the same seed plants: plant 1 of the first coffee cell and plant 0 of the next one
+    plants.infection[[plants.cell_start[0] + 1, plants.cell_start[1]]] = config.days
+    cells = plants.landscape
+    batched.infect(batch, batched.plant_index(batch, np.array([0, 0]), np.array([1, 0]), cells.rows[:2],
+                                              cells.cols[:2]))
+
+    # both engines draw the Poisson infections of the coffee cells in row-major order,
+    # and cells without pressure draw nothing, so the same generator gives the same draws
+    rng = np.random.default_rng(2)
+    for day in range(config.n_days):
+        expected = array_engine.each_day(plants, day, rng=rng, weather=weather[day])
+        result = batched.each_day(batch, day, weather[np.newaxis, day])[0]
+        np.testing.assert_allclose(result[0], expected[0], rtol=1e-9, atol=1e-9)
+        assert list(result[1:]) == expected[1:]
+    np.testing.assert_array_equal(batched.infection_map(batch)[0], array_engine.infection_map(plants))
+    assert expected[2] > 2
+
+
+BLOCK_PYARROW = """
+import sys
+
+class Block:
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] == "pyarrow":
+            raise ImportError("no pyarrow")
+
+sys.meta_path.insert(0, Block())
+"""
+
+
+def test_batched_does_not_need_pyarrow():
+    code = BLOCK_PYARROW + "import batched; batched.main(['--help'])"
+    done = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1],
+                          capture_output=True, text=True)
+    assert done.returncode == 0, done.stderr
+    assert "--batch-size" in done.stdout
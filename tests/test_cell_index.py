@@ -0,0 +1,47 @@
+"""The sets CellIndex keeps alive across days equal the ones built from scratch."""
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+import model
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=240)
+
+
+def make_plants(config, seed):
+    landscape = model.make_landscape(config.size, config.cluster, config.proportions, seed)
+    rows, cols = np.nonzero(landscape.to_numpy())
+    # cells in row-major order, as in simulate_days
+    return [model.Plant(grid=(r, c), plant=j, resistance=config.resistance, production=config.production)
+            for r, c in zip(rows.tolist(), cols.tolist()) for j in range(config.plants_per_cell)]
+
+
+@pytest.mark.parametrize("boundary", ["bounded", "toroidal"])
+def test_maintained_sets_match_rebuilt(boundary):
+    config = dataclasses.replace(SMALL, boundary=boundary)
+    rng = np.random.default_rng(4)
+    plants = make_plants(config, 4)
+    index = model.CellIndex.build(plants, config)
+    model.initial_infection(plants, index, config, rng)
+    # spread on about half of the days, so that the sets change often
+    weather = rng.random((config.n_days, 3)) < 0.5
+    infected = []
+    for day in range(config.n_days):
+        model.each_day(plants, day, index, config, rng, weather[day])
+        if day % 20:
+            continue
+        rebuilt = model.CellIndex.build(plants, config)
+        infected.append(len(index.infected))
+        assert {id(x) for x in index.infected} == {id(x) for x in rebuilt.infected}
+        assert len(index.infected) == len(rebuilt.infected)
+        assert index.infected_cells == rebuilt.infected_cells
+        assert list(index.healthy_plants) == list(rebuilt.healthy_plants)
+        assert index.frontier == rebuilt.frontier
+        assert index.healthy == rebuilt.healthy
+        assert index.neighbor_healthy == rebuilt.neighbor_healthy
+        assert index.total_score == pytest.approx(rebuilt.total_score)
+        assert index.score == pytest.approx(rebuilt.score)
+    # the sets were compared at several stages of the epidemic
+    assert len(set(infected)) > 5
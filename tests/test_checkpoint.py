@@ -0,0 +1,101 @@
+"""A run resumed from a checkpoint is bit-identical to an uninterrupted run."""
+
+import dataclasses
+import filecmp
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model
+import sinks
+from checkpoint import Checkpoint
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=120, snapshot_every=20)
+ENGINES = ["plants", "arrays", "numba"]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class Interrupt(sinks.Sink):
+    """Stops the run after ``day``, as a crash would."""
+
+    def __init__(self, day: int) -> None:
+        self.stop = day
+
+    def day(self, row):
+        if row[3] == self.stop:
+            raise Interrupted
+
+
+def config_of(engine: str) -> model.SimulationConfig:
+    if engine == "numba":
+        pytest.importorskip("numba")
+    return dataclasses.replace(SMALL, simulation_engine=engine)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_csv_resume(engine, tmp_path):
+    config = config_of(engine)
+    expected = sinks.run_pipeline(model.simulate_days(config, 5), [sinks.CSVSink(0, config, tmp_path / "expected")])
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.npz", every=25)
+    csv = sinks.CSVSink(0, config, tmp_path / "resumed")
+    checkpoint.attach([csv])
+    with pytest.raises(Interrupted):
+        sinks.run_pipeline(model.simulate_days(config, 5, checkpoint=checkpoint), [csv, Interrupt(63)])
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.npz", every=25)
+    csv = sinks.CSVSink(0, config, tmp_path / "resumed")
+    checkpoint.attach([csv])
+    assert sinks.run_pipeline(model.simulate_days(config, 5, checkpoint=checkpoint), [csv]) == expected
+    files = filecmp.dircmp(tmp_path / "expected", tmp_path / "resumed")
+    assert files.left_only == files.right_only == files.diff_files == []
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_simulate_resume(engine, tmp_path):
+    config = config_of(engine)
+    expected = model.simulate(config, 5)
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.npz", every=25)
+    spool = sinks.CSVSink(0, config, checkpoint.spool, partial(model.write_map_npy, datadir=checkpoint.spool))
+    checkpoint.attach([spool])
+    with pytest.raises(Interrupted):
+        sinks.run_pipeline(model.simulate_days(config, 5, checkpoint=checkpoint), [spool, Interrupt(90)])
+
+    for _ in range(2):  # the second time from the final checkpoint, without simulating
+        result = model.simulate(config, 5, checkpoint=Checkpoint(tmp_path / "checkpoint.npz", every=25))
+        pd.testing.assert_frame_equal(result.daily_results, expected.daily_results)
+        pd.testing.assert_frame_equal(result.composition, expected.composition)
+        assert result.maps.keys() == expected.maps.keys()
+        for day in expected.maps:
+            np.testing.assert_array_equal(result.maps[day], expected.maps[day])
+        assert result.coffee_cherries == expected.coffee_cherries
+
+
+def test_aggregator_resume(tmp_path):
+    expected = sinks.Aggregator()
+    sinks.run_pipeline(model.simulate_days(SMALL, 7), [expected])
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.npz", every=25)
+    checkpoint.attach([sinks.Aggregator()])
+    with pytest.raises(Interrupted):
+        sinks.run_pipeline(model.simulate_days(SMALL, 7, checkpoint=checkpoint), [*checkpoint.sinks, Interrupt(70)])
+    resumed = sinks.Aggregator()
+    checkpoint = Checkpoint(tmp_path / "checkpoint.npz", every=25)
+    checkpoint.attach([resumed])
+    sinks.run_pipeline(model.simulate_days(SMALL, 7, checkpoint=checkpoint), [resumed])
+    assert resumed.summary() == expected.summary()
+
+
+def test_checkpoint_of_other_config(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.npz", every=25)
+    model.simulate(SMALL, 5, checkpoint=checkpoint)
+    with pytest.raises(ValueError):
+        model.simulate(dataclasses.replace(SMALL, resistance=0.2), 5, checkpoint=checkpoint)
+    checkpoint.remove()
+    assert not checkpoint.path.exists() and not checkpoint.spool.exists()
@@ -0,0 +1,25 @@
+"""The composition counts of every engine are the counts of the values of its snapshot maps."""
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+import model
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=200, snapshot_every=20)
+
+
+@pytest.mark.parametrize("engine", ["plants", "arrays", "numba", "tiled"])
+@pytest.mark.parametrize("boundary", ["bounded", "toroidal"])
+def test_composition_counts_map_values(engine, boundary):
+    if engine == "numba":
+        pytest.importorskip("numba")
+    result = model.simulate(dataclasses.replace(SMALL, simulation_engine=engine, boundary=boundary), seed=6)
+    composition = result.composition.set_index("day")
+    assert sorted(composition.index) == sorted(result.maps)
+    for day, landscaped in result.maps.items():
+        counts = np.bincount(np.asarray(landscaped, dtype=np.int64).ravel(), minlength=3)
+        assert counts.tolist() == composition.loc[day, ["non_coffee", "healthy", "infected"]].tolist()
+    # the epidemic spread between the first and the last snapshot
+    assert composition["infected"].iloc[-1] > composition["infected"].iloc[0]
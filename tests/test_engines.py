@@ -0,0 +1,34 @@
+"""The arrays and numba engines reproduce the plants engine for the same seed."""
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=150, snapshot_every=30)
+
+
+def run(engine: str, **changes) -> model.SimulationResult:
+    if engine == "numba":
+        pytest.importorskip("numba")
+    return model.simulate(dataclasses.replace(SMALL, simulation_engine=engine, **changes), seed=3)
+
+
+@pytest.mark.parametrize("engine", ["arrays", "numba"])
+@pytest.mark.parametrize("changes", [{}, {"fast_forward": False}, {"boundary": "toroidal"}, {"cluster": 0.1}])
+def test_engine_matches_plants(engine, changes):
+    expected = run("plants", **changes)
+    result = run(engine, **changes)
+    # the infection score sums the same infectivities in another order
+    np.testing.assert_allclose(result.daily_results["infection_score"], expected.daily_results["infection_score"],
+                               rtol=1e-12)
+    counts = ["infected_cells", "infected_plants", "day"]
+    pd.testing.assert_frame_equal(result.daily_results[counts], expected.daily_results[counts])
+    pd.testing.assert_frame_equal(result.composition, expected.composition)
+    assert result.maps.keys() == expected.maps.keys()
+    for day in expected.maps:
+        np.testing.assert_array_equal(result.maps[day], expected.maps[day])
+    assert result.coffee_cherries == expected.coffee_cherries
@@ -0,0 +1,29 @@
+"""A run that fast-forwards over days without spread equals the run stepped one day at a time."""
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=300, snapshot_every=30)
+
+
+@pytest.mark.parametrize("engine", ["plants", "arrays", "numba", "tiled"])
+@pytest.mark.parametrize("changes", [{}, {"neighbor_spread": "convolution"}, {"weather_within_cell_dry": 0.05}])
+def test_fast_forward_matches_stepping(engine, changes):
+    if engine == "numba":
+        pytest.importorskip("numba")
+    if engine in ("plants", "numba") and changes.get("neighbor_spread") == "convolution":
+        pytest.skip("the convolution rule is implemented by the arrays and tiled engines")
+    config = dataclasses.replace(SMALL, simulation_engine=engine, **changes)
+    expected = model.simulate(dataclasses.replace(config, fast_forward=False), seed=2)
+    result = model.simulate(config, seed=2)
+    pd.testing.assert_frame_equal(result.daily_results, expected.daily_results, check_exact=False, rtol=1e-12)
+    pd.testing.assert_frame_equal(result.composition, expected.composition)
+    assert result.maps.keys() == expected.maps.keys()
+    for day in expected.maps:
+        np.testing.assert_array_equal(result.maps[day], expected.maps[day])
+    assert result.coffee_cherries == pytest.approx(expected.coffee_cherries, rel=1e-12)
@@ -0,0 +1,47 @@
+"""HealthySet answers select and rank like a sorted list of its members."""
+
+import numpy as np
+import pytest
+
+from healthy_set import HealthySet
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 100])
+def test_select_rank_against_sorted_list(size):
+    rng = np.random.default_rng(size)
+    mask = rng.random(size) < 0.6
+    healthy = HealthySet.from_mask(mask)
+    members = np.flatnonzero(mask).tolist()
+    for position in rng.permutation(size).tolist() + [None]:
+        assert len(healthy) == len(members)
+        assert list(healthy) == members
+        assert [healthy.select(k) for k in range(len(members))] == members
+        assert [healthy.rank(i) for i in range(size + 1)] == [sum(m < i for m in members) for i in range(size + 1)]
+        assert all((i in healthy) == (i in members) for i in range(size))
+        if position is not None:
+            healthy.discard(position)
+            if position in members:
+                members.remove(position)
+
+
+def test_from_mask_matches_discards():
+    mask = np.random.default_rng(1).random(50) < 0.5
+    built = HealthySet.from_mask(np.ones(50, dtype=bool))
+    for position in np.flatnonzero(~mask).tolist():
+        built.discard(position)
+    healthy = HealthySet.from_mask(mask)
+    assert list(built) == list(healthy)
+    assert [built.rank(i) for i in range(51)] == [healthy.rank(i) for i in range(51)]
+
+
+def test_select_out_of_range():
+    healthy = HealthySet.from_mask(np.array([False, True, True]))
+    healthy.discard(1)
+    healthy.discard(1)
+    assert healthy.select(0) == 2
+    with pytest.raises(IndexError):
+        healthy.select(1)
+    with pytest.raises(IndexError):
+        healthy.select(-1)
+    with pytest.raises(IndexError):
+        HealthySet(0).select(0)
@@ -0,0 +1,53 @@
+"""LandscapeCache returns make_landscape's landscapes and stays within its disk budget."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import model
+from landscape_cache import LandscapeCache
+
+PARAMETERS = (21, 0.3, (0.4, 0.6))
+
+
+def test_hit_equals_make_landscape(tmp_path):
+    cache = LandscapeCache(tmp_path)
+    expected = model.make_landscape(*PARAMETERS, 5)
+    # 21 x 21 cells do not fill the last byte of the packed file
+    miss = cache.get(*PARAMETERS, 5)
+    assert cache.file(*PARAMETERS, 5).exists()
+    hit = cache.get(*PARAMETERS, 5)
+    for landscape in (miss, hit):
+        np.testing.assert_array_equal(np.asarray(landscape, dtype=bool), np.asarray(expected, dtype=bool))
+    assert isinstance(hit, pd.DataFrame) and hit.shape == expected.shape
+    other = cache.get(*PARAMETERS, 6)
+    np.testing.assert_array_equal(np.asarray(other, dtype=bool),
+                                  np.asarray(model.make_landscape(*PARAMETERS, 6), dtype=bool))
+
+
+def test_evict_keeps_the_most_recently_used(tmp_path):
+    cache = LandscapeCache(tmp_path)
+    for seed in range(5):
+        cache.get(*PARAMETERS, seed)
+    files = [cache.file(*PARAMETERS, seed) for seed in range(5)]
+    size = files[0].stat().st_size
+    assert all(file.stat().st_size == size for file in files)
+    # used in the order 3, 1, 4, 0, 2
+    for age, seed in enumerate([3, 1, 4, 0, 2]):
+        os.utime(files[seed], (1_000_000 + age, 1_000_000 + age))
+
+    cache.max_bytes = 2 * size + size // 2
+    cache.evict()
+    assert sorted(file.name for file in tmp_path.glob("landscape-*.npy")) == sorted([files[0].name, files[2].name])
+    assert sum(file.stat().st_size for file in tmp_path.glob("landscape-*.npy")) <= cache.max_bytes
+
+    # a hit refreshes the file, so the next eviction drops the other one
+    cache.get(*PARAMETERS, 0)
+    cache.max_bytes = size
+    cache.evict()
+    assert [file.name for file in tmp_path.glob("landscape-*.npy")] == [files[0].name]
+
+    # storing a new landscape evicts down to the budget as well
+    cache.get(*PARAMETERS, 7)
+    assert [file.name for file in tmp_path.glob("landscape-*.npy")] == [cache.file(*PARAMETERS, 7).name]
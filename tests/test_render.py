@@ -0,0 +1,82 @@
+"""render draws every figure once and then only the figures whose inputs changed."""
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+import model
+import render
+import sinks
+from render import FigureJob
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=60, snapshot_every=20)
+PROPORTIONS = list(SMALL.proportions)
+
+loads = []
+
+
+def counted_maps(*args):
+    loads.append(args[2])
+    return render.progression_maps(*args)
+
+
+def write_run(datadir, z, seed):
+    sinks.run_pipeline(model.simulate_days(SMALL, seed), [sinks.CSVSink(z, SMALL, datadir)])
+
+
+def make_jobs(datadir, scale=1.0, load=render.progression_maps):
+    day = np.arange(10)
+    jobs = [FigureJob(f"band-{k}.png", "band", render.given,
+                      ({"day": day, **{q: (k + 1) * scale * day for q in ["q05", "q25", "q50", "q75", "q95"]}},),
+                      {"title": f"band {k}"}) for k in range(2)]
+    jobs += [FigureJob(f"progression-{z}.png", "progression", load, (datadir, None, z, PROPORTIONS, SMALL.cluster),
+                       {"title": f"run {z}"}, render.progression_sources) for z in range(2)]
+    return jobs
+
+
+def modified(figdir):
+    return {path.name: path.stat().st_mtime_ns for path in figdir.glob("*.png")}
+
+
+@pytest.fixture
+def runs(tmp_path):
+    for z in range(2):
+        write_run(tmp_path / "data", z, z)
+    return tmp_path / "data"
+
+
+def test_render_only_changed_figures(runs, tmp_path):
+    figdir = tmp_path / "figures"
+    assert render.render(make_jobs(runs), figdir, workers=2) == (4, 0)
+    drawn = modified(figdir)
+    assert len(drawn) == 4
+
+    # nothing changed: nothing is drawn, and the map files are not read
+    loads.clear()
+    assert render.render(make_jobs(runs, load=counted_maps), figdir, workers=1) == (0, 4)
+    assert loads == []
+    assert modified(figdir) == drawn
+
+    # other inputs of one band figure
+    jobs = make_jobs(runs)
+    jobs[1] = make_jobs(runs, scale=2.0)[1]
+    assert render.render(jobs, figdir, workers=1) == (1, 3)
+    now = modified(figdir)
+    assert [name for name in now if now[name] != drawn[name]] == ["band-1.png"]
+
+    # a rewritten run: only its progression figure is redrawn, from the new maps
+    drawn = now
+    write_run(runs, 1, 7)
+    assert render.render(make_jobs(runs, scale=2.0, load=counted_maps)[2:], figdir, workers=1) == (1, 1)
+    assert loads == [1]
+    now = modified(figdir)
+    assert [name for name in now if now[name] != drawn[name]] == ["progression-1.png"]
+
+
+def test_missing_figure_is_redrawn(runs, tmp_path):
+    figdir = tmp_path / "figures"
+    render.render(make_jobs(runs), figdir, workers=1)
+    (figdir / "band-0.png").unlink()
+    assert render.render(make_jobs(runs), figdir, workers=1) == (1, 3)
+    assert (figdir / "band-0.png").exists()
@@ -0,0 +1,103 @@
+"""ResultStore round trip and its single-writer / many-readers behaviour."""
+
+import dataclasses
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import model
+from result_store import ResultStore
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=60, snapshot_every=20)
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def results():
+    return [model.simulate(SMALL, seed) for seed in range(3)]
+
+
+def test_round_trip(results, tmp_path):
+    with ResultStore(tmp_path / "store", write=True) as store:
+        for z, result in enumerate(results):
+            store.write(result, z, digest=f"digest{z}")
+    store = ResultStore(tmp_path / "store")
+    proportions, cluster = list(SMALL.proportions), SMALL.cluster
+    for z, result in enumerate(results):
+        daily = store.read("daily", proportions, cluster, z)
+        columns = list(result.daily_results.columns)
+        pd.testing.assert_frame_equal(daily[columns], result.daily_results, check_dtype=False)
+        composition = store.read("composition", proportions, cluster, z)
+        pd.testing.assert_frame_equal(composition[list(result.composition.columns)], result.composition,
+                                      check_dtype=False)
+        for day, landscaped in result.maps.items():
+            np.testing.assert_array_equal(store.read_map(proportions, cluster, z, day), landscaped)
+    key = (str(proportions), cluster)
+    assert store.digests() == {(*key, z): f"digest{z}" for z in range(3)}
+    returns = store.read("returns").sort_values("run")
+    assert returns["coffee_cherries"].tolist() == [r.coffee_cherries for r in results]
+
+
+def test_reader_during_write(results, tmp_path):
+    path = tmp_path / "store"
+    with ResultStore(path, write=True) as store:
+        store.write(results[0], 0)
+    writer = ResultStore(path, write=True)
+    writer.write(results[1], 1)  # buffered, not flushed yet
+
+    reader = ResultStore(path)
+    assert reader.completed() == {(str(list(SMALL.proportions)), SMALL.cluster, 0)}
+    assert set(reader.read("daily")["run"]) == {0}
+    with pytest.raises(RuntimeError):
+        ResultStore(path, write=True)
+    with pytest.raises(ValueError):
+        reader.write(results[2], 2)
+
+    writer.flush()  # each flush is readable at once
+    assert {key[2] for key in reader.completed()} == {0, 1}
+    writer.write(results[2], 2)
+    writer.close()
+    assert {key[2] for key in reader.completed()} == {0, 1, 2}
+    assert sorted(set(reader.read("daily")["run"])) == [0, 1, 2]
+
+
+def test_interrupted_writer_keeps_flushed_runs(results, tmp_path):
+    path = tmp_path / "store"
+    script = ("import dataclasses, os, model\n"
+              "from result_store import ResultStore\n"
+              "config = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=20, snapshot_every=10)\n"
+              f"store = ResultStore({str(path)!r}, flush_every=1, write=True)\n"
+              "store.write(model.simulate(config, 0), 0)\n"
+              "store.write(model.simulate(config, 1), 1)\n"
+              "open(store.path / 'daily' / 'part-00002.tmp', 'w').close()  # killed during the next flush\n"
+              "os._exit(0)\n")
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True,
+                   env={**os.environ, "PYTHONPATH": str(ROOT)})
+    key = (str(list(SMALL.proportions)), SMALL.cluster)
+    assert ResultStore(path).completed() == {(*key, 0), (*key, 1)}
+    with ResultStore(path, write=True) as store:
+        assert not list(path.glob("*/part-*.tmp"))
+        store.write(results[0], 2)
+    store = ResultStore(path)
+    assert store.completed() == {(*key, 0), (*key, 1), (*key, 2)}
+    assert sorted(set(store.read("daily")["run"])) == [0, 1, 2]
+
+
+def test_uncommitted_parts_skipped(results, tmp_path):
+    path = tmp_path / "store"
+    with ResultStore(path, write=True) as store:
+        store.write(results[0], 0)
+    # a writer killed between its daily and its returns part
+    with ResultStore(tmp_path / "other", write=True) as other:
+        other.write(results[1], 1)
+    (tmp_path / "other" / "daily" / "part-00000.parquet").rename(path / "daily" / "part-00001.parquet")
+    assert set(ResultStore(path).read("daily")["run"]) == {0}
+    with ResultStore(path, write=True):
+        assert not (path / "daily" / "part-00001.parquet").exists()
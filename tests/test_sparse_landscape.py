@@ -0,0 +1,72 @@
+"""SparseLandscape's CSR neighbour lists match a brute-force scan of the dense grid."""
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+import model
+from sparse_landscape import OFFSETS, SparseLandscape
+
+
+def brute_force_neighbors(mask, wrap):
+    """Coffee neighbours of every coffee cell, as sorted lists of row-major cell numbers."""
+    n_rows, n_cols = mask.shape
+    cells = {(r, c): i for i, (r, c) in enumerate(zip(*np.nonzero(mask)))}
+    neighbors = []
+    for r, c in cells:
+        around = set()
+        for dr, dc in OFFSETS:
+            nr, nc = r + dr, c + dc
+            if wrap:
+                nr, nc = nr % n_rows, nc % n_cols
+            if (nr, nc) in cells and (nr, nc) != (r, c):
+                around.add(cells[(nr, nc)])
+        neighbors.append(sorted(around))
+    return neighbors
+
+
+def masks(shapes, seed=0):
+    rng = np.random.default_rng(seed)
+    for shape in shapes:
+        for density in (0.3, 0.7, 1.0):
+            yield rng.random(shape) < density
+
+
+@pytest.mark.parametrize("wrap", [False, True])
+# grids of 1 and 2 cells across wrap offsets onto the cell itself, or onto one neighbour twice
+@pytest.mark.parametrize("shape", [(12, 12), (7, 10), (3, 3), (1, 6), (1, 1), (1, 2), (2, 2), (2, 5), (5, 2)])
+def test_neighbors_match_brute_force(shape, wrap):
+    for mask in masks([shape]):
+        landscape = SparseLandscape.from_mask(mask, wrap)
+        neighbors = [landscape.neighbors(c).tolist() for c in range(landscape.n_cells)]
+        assert neighbors == brute_force_neighbors(mask, wrap)
+        np.testing.assert_array_equal(landscape.to_dense(), mask)
+        adjacency = landscape.adjacency.toarray()
+        np.testing.assert_array_equal(adjacency, adjacency.T)
+        assert set(np.unique(adjacency)) <= {0, 1}
+
+
+def test_lookup_and_coordinates():
+    mask = next(masks([(9, 11)], seed=1))
+    landscape = SparseLandscape.from_mask(mask)
+    rows, cols = np.nonzero(mask)
+    np.testing.assert_array_equal(landscape.lookup(rows, cols), np.arange(rows.size))
+    # unsorted and duplicated positions
+    other = SparseLandscape.from_coordinates(mask.shape, np.r_[rows[::-1], rows], np.r_[cols[::-1], cols])
+    np.testing.assert_array_equal(other.indptr, landscape.indptr)
+    np.testing.assert_array_equal(other.indices, landscape.indices)
+    empty_rows, empty_cols = np.nonzero(~mask)
+    assert (landscape.lookup(empty_rows, empty_cols) == -1).all()
+    assert landscape.lookup(np.array([-1, 0, 9]), np.array([0, 11, 0])).tolist() == [-1, -1, -1]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5])
+def test_get_neighbors_wraps_without_duplicates(size):
+    config = dataclasses.replace(model.DEFAULT_CONFIG, size=size, boundary="toroidal")
+    mask = np.ones((size, size), dtype=bool)
+    expected = brute_force_neighbors(mask, wrap=True)
+    for cell, (r, c) in enumerate(zip(*np.nonzero(mask))):
+        neighbors = model.get_neighbors((r, c), config)
+        assert len(neighbors) == len(set(neighbors))
+        assert sorted(x * size + y for x, y in neighbors) == expected[cell]
@@ -0,0 +1,94 @@
+"""Sweeps resume from their journal or store, and rerun jobs whose parameters changed."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+PRELUDE = """
+import dataclasses, os, sys
+import model, sweep
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+base = dataclasses.replace(model.DEFAULT_CONFIG, size=size, n_days=40, snapshot_every=20)
+jobs = sweep.make_jobs([[0.4, 0.6]], [0.3], 4, 0, base)
+"""
+
+
+def run(code: str, cwd: Path, *args: str) -> subprocess.CompletedProcess:
+    """Run a sweep script in ``cwd``, where the sweep keeps its data directory."""
+    return subprocess.run([sys.executable, "-c", PRELUDE + code, *args], cwd=cwd, capture_output=True, text=True,
+                          env={**os.environ, "PYTHONPATH": str(ROOT)}, timeout=300)
+
+
+def test_csv_resume(tmp_path):
+    code = "sweep.run_sweep(jobs, 4, 2)"
+    assert "0 of 4 jobs already done" in run(code, tmp_path).stdout
+    assert "4 of 4 jobs already done" in run(code, tmp_path).stdout
+    journal = pd.read_csv(tmp_path / "data" / "sweep-journal.csv")
+    assert len(journal) == 4 and journal["config"].nunique() == 1
+
+    # other parameters give other digests: every job runs again
+    assert "0 of 4 jobs already done" in run(code, tmp_path, "32").stdout
+    journal = pd.read_csv(tmp_path / "data" / "sweep-journal.csv")
+    assert len(journal) == 8 and journal["config"].nunique() == 2
+    returns = pd.read_csv(tmp_path / "data" / "returns-[0.4, 0.6]-0.3.csv", index_col=0)
+    assert returns["0"].tolist() == journal.tail(4).sort_values("run")["coffee_cherries"].tolist()
+
+    # a job journaled before digests were recorded still counts as done
+    journal.drop(columns="config").iloc[:2].to_csv(tmp_path / "data" / "sweep-journal.csv", index=False)
+    assert "2 of 4 jobs already done" in run(code, tmp_path).stdout
+
+
+@pytest.mark.parametrize("store", [False, True])
+def test_failed_jobs_reported_after_the_others(tmp_path, store):
+    code = f"""
+original = sweep.simulate_job if {store} else sweep.run_job
+def job(job, *args):
+    if job.run == 1:
+        raise RuntimeError("boom")
+    return original(job, *args)
+sweep.run_job = sweep.simulate_job = job
+sweep.run_sweep(jobs, 4, 2, store={"'store'" if store else None})
+"""
+    out = run(code, tmp_path)
+    assert out.returncode != 0 and "1 of 4 jobs failed" in out.stderr
+    resumed = run("sweep.run_sweep(jobs, 4, 2, store=" + ("'store'" if store else "None") + ")", tmp_path)
+    assert resumed.returncode == 0 and "3 of 4 jobs already done" in resumed.stdout
+
+
+def test_store_sweep_killed_and_resumed(tmp_path):
+    pytest.importorskip("pyarrow")
+    from result_store import ResultStore
+
+    killed = """
+import multiprocessing, result_store
+class Killed(result_store.ResultStore):
+    writes = 0
+    def __init__(self, path, write=False):
+        super().__init__(path, flush_every=1, write=write)
+    def write(self, *args):
+        super().write(*args)
+        Killed.writes += 1
+        if Killed.writes == 2:  # the sweep and its workers are killed
+            for worker in multiprocessing.active_children():
+                worker.kill()
+            os._exit(1)
+sweep.ResultStore = Killed
+sweep.run_sweep(jobs, 4, 1, store="store")
+"""
+    assert run(killed, tmp_path).returncode == 1
+    assert len(ResultStore(tmp_path / "store").completed()) == 2
+    resumed = run("sweep.run_sweep(jobs, 4, 2, store='store')", tmp_path)
+    assert "2 of 4 jobs already done" in resumed.stdout
+
+    run("sweep.run_sweep(jobs, 4, 2, store='fresh')", tmp_path)
+    returns = ResultStore(tmp_path / "store").read("returns").sort_values("run").reset_index(drop=True)
+    expected = ResultStore(tmp_path / "fresh").read("returns").sort_values("run").reset_index(drop=True)
+    pd.testing.assert_frame_equal(returns, expected)
+    daily = ResultStore(tmp_path / "store").read("daily")
+    assert len(daily) == 4 * 40
@@ -0,0 +1,121 @@
+"""sweep_summary aggregates a sweep like a direct groupby and rebuilds its tables when runs change."""
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model
+import sinks
+import sweep_summary
+from sweep_summary import CSVRuns, aggregate, load_summary
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=16, n_days=60, snapshot_every=20)
+CLUSTERS = (0.2, 0.5)
+
+
+def write_run(datadir, config, z, seed):
+    sinks.run_pipeline(model.simulate_days(config, seed), [sinks.CSVSink(z, config, datadir)])
+
+
+@pytest.fixture
+def sweep(tmp_path):
+    for c, cluster in enumerate(CLUSTERS):
+        for z in range(3):
+            write_run(tmp_path, dataclasses.replace(SMALL, cluster=cluster), z, 10 * c + z)
+    return tmp_path
+
+
+@pytest.fixture
+def count_aggregates(monkeypatch):
+    calls = []
+
+    def counted(runs):
+        calls.append(runs)
+        return aggregate(runs)
+
+    monkeypatch.setattr(sweep_summary, "aggregate", counted)
+    return calls
+
+
+def test_aggregate_matches_groupby(sweep):
+    runs, bands = aggregate(CSVRuns(sweep))
+
+    daily, final = [], []
+    for cluster in CLUSTERS:
+        label = dataclasses.replace(SMALL, cluster=cluster).label
+        for z in range(3):
+            results = pd.read_csv(sweep / f"results-{z}-{label}.csv", index_col=0)
+            daily.append(results.assign(proportions=SMALL.proportions[0], clustering=cluster))
+            composition = pd.read_csv(sweep / f"composition-{z}-{label}.csv")
+            final.append(composition.iloc[-1].to_dict() | {"clustering": cluster, "run": z})
+    daily = pd.concat(daily).melt(id_vars=["proportions", "clustering", "day"], value_vars=sweep_summary.METRICS,
+                                  var_name="metric")
+    groups = daily.groupby(["proportions", "clustering", "day", "metric"])["value"]
+    expected = groups.mean().rename("mean").to_frame()
+    for q, column in zip(sweep_summary.QUANTILES, sweep_summary.BAND_COLUMNS[5:]):
+        expected[column] = groups.quantile(q)
+    result = bands.set_index(["proportions", "clustering", "day", "metric"]).sort_index()
+    pd.testing.assert_frame_equal(result, expected.sort_index(), check_dtype=False)
+
+    final = pd.DataFrame(final)
+    assert runs["final_day"].tolist() == final["day"].tolist()
+    assert runs["trees"].tolist() == final["non_coffee"].tolist()
+    assert runs["uninfected"].tolist() == final["healthy"].tolist()
+    assert runs["infected"].tolist() == final["infected"].tolist()
+    np.testing.assert_allclose(runs["infected_percent"], final["infected"] / (final["healthy"] + final["infected"]))
+
+
+def test_load_summary_rebuilds_when_runs_change(sweep, count_aggregates):
+    runs, _ = load_summary(sweep)
+    assert len(runs) == 6 and len(count_aggregates) == 1
+    load_summary(sweep)
+    assert len(count_aggregates) == 1
+
+    # an added run
+    config = dataclasses.replace(SMALL, cluster=CLUSTERS[0])
+    write_run(sweep, config, 3, 99)
+    runs, _ = load_summary(sweep)
+    assert len(runs) == 7 and len(count_aggregates) == 2
+
+    # a rewritten run with the same keys
+    write_run(sweep, config, 0, 98)
+    runs, _ = load_summary(sweep)
+    assert len(runs) == 7 and len(count_aggregates) == 3
+    expected = pd.read_csv(sweep / f"composition-0-{config.label}.csv").iloc[-1]
+    row = runs[(runs["clustering"] == config.cluster) & (runs["run"] == 0)].iloc[0]
+    assert row["infected"] == expected["infected"]
+    load_summary(sweep)
+    assert len(count_aggregates) == 3
+
+
+def test_store_reads_the_last_write_of_a_run(tmp_path, count_aggregates):
+    pytest.importorskip("pyarrow")
+    from result_store import ResultStore
+
+    # the first write of run 0 is a longer run, with more days and a later last snapshot
+    first = model.simulate(dataclasses.replace(SMALL, n_days=90), 1)
+    second, third = (model.simulate(SMALL, seed) for seed in (2, 3))
+    with ResultStore(tmp_path / "store", write=True) as store:
+        store.write(first, 0)
+    with ResultStore(tmp_path / "store", write=True) as store:
+        store.write(second, 0)
+        store.write(third, 1)
+
+    store = ResultStore(tmp_path / "store")
+    runs, bands = load_summary(tmp_path, store)
+    assert len(count_aggregates) == 1
+    assert runs["run"].tolist() == [0, 1] and runs["final_day"].tolist() == [40, 40]
+    assert runs["infected"].tolist() == [second.composition.iloc[-1]["infected"],
+                                         third.composition.iloc[-1]["infected"]]
+    score = bands[(bands["metric"] == "infection_score")].set_index("day")["mean"]
+    expected = (second.daily_results["infection_score"] + third.daily_results["infection_score"]) / 2
+    np.testing.assert_allclose(score.to_numpy(), expected.to_numpy())
+
+    load_summary(tmp_path, store)
+    assert len(count_aggregates) == 1
+    with ResultStore(tmp_path / "store", write=True) as writer:
+        writer.write(first, 2)
+    runs, _ = load_summary(tmp_path, store)
+    assert len(count_aggregates) == 2 and runs["run"].tolist() == [0, 1, 2]
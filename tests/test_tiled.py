@@ -0,0 +1,95 @@
+"""The tiled engine: reproducibility, its single-tile case and its halo tables."""
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model
+import tiled
+from sparse_landscape import SparseLandscape
+
+SMALL = dataclasses.replace(model.DEFAULT_CONFIG, size=24, n_days=150, snapshot_every=50,
+                            simulation_engine="tiled")
+
+
+@pytest.mark.parametrize("rule", ["cell", "convolution"])
+def test_reproducible(rule):
+    config = dataclasses.replace(SMALL, neighbor_spread=rule, tiles=(2, 3))
+    first, second = model.simulate(config, 4), model.simulate(config, 4)
+    pd.testing.assert_frame_equal(first.daily_results, second.daily_results)
+    assert first.coffee_cherries == second.coffee_cherries
+
+
+@pytest.mark.parametrize("rule", ["cell", "convolution"])
+@pytest.mark.parametrize("boundary", ["bounded", "toroidal"])
+def test_single_tile_matches_arrays(rule, boundary):
+    config = dataclasses.replace(SMALL, neighbor_spread=rule, boundary=boundary, tiles=(1, 1))
+    expected = model.simulate(dataclasses.replace(config, simulation_engine="arrays"), 4)
+    result = model.simulate(config, 4)
+    pd.testing.assert_frame_equal(result.daily_results, expected.daily_results)
+    pd.testing.assert_frame_equal(result.composition, expected.composition)
+    for day in expected.maps:
+        np.testing.assert_array_equal(result.maps[day], expected.maps[day])
+    assert result.coffee_cherries == expected.coffee_cherries
+
+
+def specs_of(tiles, wrap, seed=1):
+    mask = np.random.default_rng(seed).random((13, 11)) < 0.6
+    landscape = SparseLandscape.from_mask(pd.DataFrame(mask), wrap)
+    config = dataclasses.replace(model.DEFAULT_CONFIG, tiles=tiles, boundary="toroidal" if wrap else "bounded")
+    specs, owner, local = tiled.tile_specs(landscape, config, [np.random.default_rng(0)] * int(np.prod(tiles)))
+    return landscape, specs, owner
+
+
+@pytest.mark.parametrize("tiles", [(2, 2), (3, 2), (1, 4)])
+@pytest.mark.parametrize("wrap", [False, True])
+def test_halo_tables_match_csr(tiles, wrap):
+    landscape, specs, owner = specs_of(tiles, wrap)
+    for t, spec in enumerate(specs):
+        cells = landscape.lookup(spec.rows, spec.cols)
+        own = cells[spec.owned]
+        np.testing.assert_array_equal(own, np.flatnonzero(owner == t))
+        # the halo is every neighbour of an own cell owned by another tile
+        around = np.unique(np.concatenate([landscape.neighbors(c) for c in own] + [np.empty(0, dtype=np.int64)]))
+        np.testing.assert_array_equal(np.sort(cells[~spec.owned]), around[owner[around] != t])
+        # the tile's own CSR lists equal the global ones
+        local = SparseLandscape.from_coordinates(landscape.shape, spec.rows, spec.cols, wrap=wrap)
+        for i in np.flatnonzero(spec.owned):
+            np.testing.assert_array_equal(np.sort(cells[local.neighbors(i)]),
+                                          np.sort(landscape.neighbors(cells[i])))
+        # send (in the owner) and recv (in the halo holder) list the same cells in the same order
+        for other, sent in spec.send.items():
+            received = specs[other].recv[t]
+            np.testing.assert_array_equal(
+                cells[sent], landscape.lookup(specs[other].rows[received], specs[other].cols[received]))
+            assert set(cells[sent]) == set(cells[spec.owned]) & set(landscape.lookup(specs[other].rows,
+                                                                                      specs[other].cols))
+
+
+def test_rejected_infection_redrawn():
+    """An infection of a halo plant its owner infected meanwhile goes to another healthy neighbour."""
+    config = dataclasses.replace(model.DEFAULT_CONFIG, size=6, plants_per_cell=2, tiles=(1, 2))
+    landscape = SparseLandscape.from_mask(pd.DataFrame(np.ones((6, 6), dtype=bool)))
+    specs, owner, _ = tiled.tile_specs(landscape, config, [np.random.default_rng(t) for t in range(2)])
+    sender, receiver = tiled.Tile(specs[0]), tiled.Tile(specs[1])
+    # a halo plant of the sender, and an own cell of the sender next to it
+    plant = int(sender.recv[1][0])
+    cell = sender.plants.cell[plant]
+    source = next(int(c) for c in sender.plants.landscape.neighbors(cell) if sender.owned_cell[c])
+    # the owner infects the plant itself, the sender picks it from its stale halo
+    receiver.infect(receiver.send[0][sender.halo_position[plant]])
+    sender.infect(np.array([plant]))
+    rejected, halos = receiver.receive_infections({0: sender.route([(plant, source)])[1]})
+    np.testing.assert_array_equal(rejected[0], [source])
+    neighbours = tiled.array_engine.plants_in_cells(sender.plants, sender.plants.landscape.neighbors(source))
+    before = np.count_nonzero(sender.plants.infection[neighbours] > 0.0001)
+    sender.receive_halo({1: halos[0]})
+    outgoing = sender.redraw({1: rejected[0]})
+    assert np.count_nonzero(sender.plants.infection[neighbours] > 0.0001) == before + 1
+    # a redrawn infection of a halo plant goes to its owner, which accepts it
+    if outgoing:
+        rejected, _ = receiver.receive_infections({0: outgoing[1]})
+        assert not rejected
+        assert np.count_nonzero(receiver.plants.infection > 0.0001) == 2
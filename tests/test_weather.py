@@ -0,0 +1,40 @@
+"""A pre-drawn weather schedule makes the day-by-day decisions of weather_effects."""
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+import model
+
+
+class Draws:
+    """Stand-in generator whose random() returns the given uniforms in turn."""
+
+    def __init__(self, uniforms):
+        self.uniforms = iter(uniforms.tolist())
+
+    def random(self):
+        return next(self.uniforms)
+
+
+@pytest.mark.parametrize("changes", [{}, {"weather_adj": 0.9, "weather_cluster": 0.5},
+                                     {"weather_within_cell_dry": 0.7, "weather_within_cell_wet": 0.2}])
+def test_schedule_matches_weather_effects(changes):
+    # more than two years, so both seasons come round twice
+    config = dataclasses.replace(model.DEFAULT_CONFIG, n_days=800, **changes)
+    schedule = model.weather_schedule(config, np.random.default_rng(3))
+    # the schedule draws three uniforms a day; weather_effects only the ones it needs
+    uniforms = np.random.default_rng(3).random((config.n_days, 3))
+    for day in range(config.n_days):
+        assert schedule[day].tolist() == model.weather_effects(day, config, Draws(uniforms[day]))
+    assert schedule[:, 2].any() and not schedule.all(axis=0).any()
+
+
+def test_replicate_schedules_continue_the_stream():
+    config = dataclasses.replace(model.DEFAULT_CONFIG, n_days=100)
+    rng = np.random.default_rng(5)
+    schedules = model.weather_schedule(config, np.random.default_rng(5), replicates=3)
+    assert schedules.shape == (3, config.n_days, 3)
+    for schedule in schedules:
+        np.testing.assert_array_equal(schedule, model.weather_schedule(config, rng))
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tiled, multi-process CLR simulation engine.
+
+Partitions the coffee cells of a landscape into config.tiles rectangular tiles and
+runs each tile in its own worker process, so the plants of a region are spread over
+the processes of a node instead of being held by one. A worker keeps the plants of
+the cells it owns and of a one-cell halo of coffee cells owned by its neighbouring
+tiles, in an array_engine.PlantArrays store.
+
+Each day the coordinator (the calling process) steps all tiles in lockstep:
+
+1. Every worker progresses its own plants and runs the within-cell rule on them.
+2. Owners send the plant states of their edge cells to the tiles holding them as
+   halo (the halo exchange).
+3. Every worker runs the neighbour rule for its own source cells. With the "cell"
+   rule, infections landing in halo plants are sent to their owners, which reject
+   those whose plant was infected meanwhile (by the owner or another tile); the
+   sender draws the rejected infections again among the neighbour plants still
+   healthy after a fresh halo exchange, until none is rejected, so every infection
+   lands on a healthy plant as in the single-process engine. With the "convolution"
+   rule, the source weights of edge cells are exchanged and every worker draws the
+   infections of its own cells. Both rules thus lose no infection at tile edges.
+4. The coordinator runs global_infection: it collects the number of healthy plants
+   of every tile, has tile 0 draw the targets among all of them and sends each tile
+   its own.
+
+Messages only carry edge cells and counts, so the work per worker falls with the
+number of tiles. Workers draw from Generators spawned from the replicate's, and the
+coordinator draws the initial infection from the replicate's own, so a run is
+reproducible for a given seed and tiling; with more than one tile the neighbour
+draws, and therefore the outcome, differ from the single-process engines. A single
+tile takes over the replicate's Generator after the initial infection and makes every
+later draw itself, so a run with tiles (1, 1) reproduces the arrays engine.
+"""
+
+import multiprocessing as mp
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import array_engine
+from array_engine import PlantArrays
+from model import SimulationConfig, default_rng, weather_effects
+from sparse_landscape import SparseLandscape
+
+
+@dataclass
+class TileSpec:
+    """
+    Everything a worker needs to build its tile.
+
+    Attributes
+    ----------
+    shape : tuple
+        (rows, cols) of the full grid.
+    rows, cols : np.ndarray
+        Positions of the tile's coffee cells (own and halo), in row-major order.
+    owned : np.ndarray
+        Whether each of those cells belongs to the tile (False for halo cells).
+    send : dict
+        Tile -> own cells (local indices) in that tile's halo.
+    recv : dict
+        Tile -> halo cells (local indices) owned by that tile, in the same order as
+        the owner's ``send`` entry for this tile.
+    config : SimulationConfig
+        Simulation parameters.
+    rng : np.random.Generator
+        Random generator of the tile.
+    """
+    shape: Tuple[int, int]
+    rows: np.ndarray
+    cols: np.ndarray
+    owned: np.ndarray
+    send: Dict[int, np.ndarray]
+    recv: Dict[int, np.ndarray]
+    config: SimulationConfig
+    rng: np.random.Generator
+
+
+class Tile:
+    """Worker side of a tile: the plants of its own and halo cells, and one method per phase of a day."""
+
+    def __init__(self, spec: TileSpec) -> None:
+        config = spec.config
+        landscape = SparseLandscape.from_coordinates(spec.shape, spec.rows, spec.cols,
+                                                     wrap=config.boundary == "toroidal")
+        self.plants = PlantArrays.from_sparse(landscape, config.plants_per_cell, config.resistance, config)
+        self.owned_cell = spec.owned
+        self.owned = spec.owned[self.plants.cell]
+        self.send = {t: array_engine.plants_in_cells(self.plants, cells) for t, cells in spec.send.items()}
+        self.recv = {t: array_engine.plants_in_cells(self.plants, cells) for t, cells in spec.recv.items()}
+        self.send_cells = spec.send
+        self.recv_cells = spec.recv
+        # owning tile and position in that owner's send order of every halo plant
+        self.halo_owner = np.full(len(self.plants), -1)
+        self.halo_position = np.zeros(len(self.plants), dtype=np.int64)
+        for t, p in self.recv.items():
+            self.halo_owner[p] = t
+            self.halo_position[p] = np.arange(p.size)
+        self.rng = spec.rng
+        self._cells = np.empty(0, dtype=np.int64)
+        self._scores = np.empty(0)
+        self._weight = None
+        self._healthy = None
+        self._jump = None
+
+    def progress(self, weather: np.ndarray) -> Tuple[Dict[int, np.ndarray], float]:
+        """
+        Progress own infections and, with within-cell weather, run the within-cell rule.
+
+        Returns
+        -------
+        tuple
+            (tile -> plant states of the edge cells in its halo, summed infection score
+            of the own infected cells).
+        """
+        plants = self.plants
+        inf_plants = self.owned & (plants.infection > 0.0001)
+        array_engine.progression(plants, inf_plants)
+        array_engine.define_infectivity(plants, inf_plants)
+        if not weather[0]:
+            return {}, 0.0
+        self._cells = np.unique(plants.cell[inf_plants])
+        self._scores = array_engine.get_gridscores(plants)[self._cells]
+        array_engine.within_cell_infection(plants, self._cells, self._scores)
+        return ({t: plants.infection[p] for t, p in self.send.items()}, float(self._scores.sum()))
+
+    def receive_halo(self, states: Dict[int, np.ndarray]) -> None:
+        """Overwrite the halo plants with the states sent by their owners."""
+        for t, infection in states.items():
+            self.plants.infection[self.recv[t]] = infection
+
+    def spread(self, neighbor_mode: str) -> Dict[int, Any]:
+        """
+        Run the neighbour rule for the own infected cells.
+
+        Returns
+        -------
+        dict
+            "cell" rule: owner -> infections of its plants made here (see route).
+            "convolution" rule: tile -> source weights of the edge cells in its halo.
+        """
+        plants = self.plants
+        if neighbor_mode == "convolution":
+            # the plants do not change until receive_weights, which reuses the counts
+            self._healthy = array_engine.healthy_counts(plants)
+            self._weight = array_engine.source_weights(plants, self._cells, self._scores, self._healthy[1])
+            return {t: self._weight[cells] for t, cells in self.send_cells.items()}
+        if neighbor_mode != "cell":
+            raise ValueError(f"unknown neighbour spread rule: {neighbor_mode}")
+        targets = [array_engine.neighbor_cell_infection(plants, cell, score, self.rng)
+                   for cell, score in zip(self._cells, self._scores)]
+        return self.route([(target, cell) for target, cell in zip(targets, self._cells) if target is not None])
+
+    def route(self, infections: List[Tuple[int, int]]) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Group the (plant, source cell) infections landing in halo plants by owner, as
+        owner -> (positions in the owner's send order, source cells).
+        """
+        routed: Dict[int, Tuple[List[int], List[int]]] = {}
+        for plant, source in infections:
+            t = self.halo_owner[plant]
+            if t >= 0:
+                positions, sources = routed.setdefault(int(t), ([], []))
+                positions.append(self.halo_position[plant])
+                sources.append(source)
+        return {t: (np.array(positions, dtype=np.int64), np.array(sources, dtype=np.int64))
+                for t, (positions, sources) in routed.items()}
+
+    def receive_weights(self, incoming: Dict[int, np.ndarray]) -> None:
+        """"convolution" rule: take the source weights of the halo cells and infect the own cells."""
+        plants = self.plants
+        for t, weight in incoming.items():
+            self._weight[self.recv_cells[t]] = weight
+        pressure = plants.landscape.adjacency @ self._weight
+        pressure[~self.owned_cell] = 0
+        array_engine.infect_under_pressure(plants, pressure, self.rng, self._healthy)
+
+    def receive_infections(self, incoming: Dict[int, Tuple[np.ndarray, np.ndarray]]
+                           ) -> Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]:
+        """
+        "cell" rule: apply the infections of own plants made by other tiles, in tile
+        order; an infection whose plant is no longer healthy is rejected.
+
+        Returns
+        -------
+        tuple
+            (sender -> source cells of its rejected infections, tile -> plant states of
+            the edge cells in its halo).
+        """
+        plants = self.plants
+        rejected = {}
+        for t, (positions, sources) in incoming.items():
+            targets = self.send[t][positions]
+            healthy = plants.infection[targets] < 0.0001
+            plants.infection[targets[healthy]] = plants.config.days
+            if not healthy.all():
+                rejected[t] = sources[~healthy]
+        return rejected, {t: plants.infection[p] for t, p in self.send.items()}
+
+    def redraw(self, rejected: Dict[int, np.ndarray]) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        "cell" rule: infect again, for every rejected infection, one of the neighbour
+        plants of its source cell that are still healthy (none if there are none left),
+        and route those landing in halo plants as spread does.
+        """
+        plants = self.plants
+        infections = []
+        for sources in rejected.values():
+            for cell in sources.tolist():
+                candidates = array_engine.plants_in_cells(plants, array_engine.coffee_neighbors(plants, cell))
+                healthy = candidates[plants.infection[candidates] < 0.0001]
+                if healthy.size:
+                    target = int(healthy[self.rng.integers(0, healthy.size)])
+                    plants.infection[target] = plants.config.days
+                    infections.append((target, cell))
+        return self.route(infections)
+
+    def healthy_count(self) -> int:
+        """Number of healthy own plants."""
+        return int(np.count_nonzero(self.owned & (self.plants.infection < 0.0001)))
+
+    def draw_global(self, n_healthy: int) -> np.ndarray:
+        """Draw the three targets of global_infection among ``n_healthy`` healthy plants of all tiles."""
+        return np.array([self.rng.integers(0, n_healthy) for _ in range(3)])
+
+    def use_rng(self, rng: np.random.Generator) -> None:
+        """Draw from ``rng`` from now on."""
+        self.rng = rng
+
+    def infect_healthy(self, ranks: np.ndarray) -> None:
+        """Infect the own healthy plants with the given ranks (in plant order)."""
+        healthy = np.flatnonzero(self.owned & (self.plants.infection < 0.0001))
+        self.plants.infection[healthy[ranks]] = self.plants.config.days
+
+    def infect(self, plants: np.ndarray) -> None:
+        """Infect the given plants (local indices)."""
+        self.plants.infection[plants] = self.plants.config.days
+
+    def summary(self) -> Tuple[float, int, int]:
+        """(infectivity score, infected cells, infected plants) of the own plants."""
+        plants = self.plants
+        infected = self.owned & (plants.infection > 0.001)
+        cells = np.count_nonzero(np.bincount(plants.cell[infected], minlength=plants.n_cells))
+        return float(plants.infectivity[self.owned].sum()), int(cells), int(np.count_nonzero(infected))
+
+    def plan_jump(self, n_days: int) -> Optional[np.ndarray]:
+        """
+        Compute a fast_forward of the own plants by ``n_days`` days and keep it until
+        commit_jump; return the infectivity score of every skipped day, or None.
+        """
+        infected = np.flatnonzero(self.owned & (self.plants.infection > 0.0001))
+        jump = array_engine.advance_infections(self.plants.infection[infected], self.plants.resistance[infected],
+                                               n_days, self.plants.config)
+        self._jump = None if jump is None else (infected, jump[0])
+        return None if jump is None else jump[1]
+
+    def commit_jump(self, apply: bool) -> None:
+        """Apply (or drop) the jump computed by plan_jump."""
+        if apply and self._jump is not None:
+            infected, infection = self._jump
+            self.plants.infection[infected] = infection
+            array_engine.define_infectivity(self.plants, infected)
+        self._jump = None
+
+    def infected_cells(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Grid positions of the own cells with infected plants."""
+        plants = self.plants
+        cells = np.unique(plants.cell[self.owned & (plants.infection > 0.0001)])
+        return plants.landscape.rows[cells], plants.landscape.cols[cells]
+
+    def returns(self) -> float:
+        """Update production from infection and return the production of the own plants."""
+        array_engine.get_production(self.plants, self.owned)
+        return float(self.plants.production[self.owned].sum())
+
+
+def _serve(conn: Any, spec: TileSpec) -> None:
+    """Worker loop: build the tile, then answer (method, args) calls until None arrives."""
+    tile = Tile(spec)
+    conn.send(None)
+    while True:
+        call = conn.recv()
+        if call is None:
+            break
+        name, args = call
+        conn.send(getattr(tile, name)(*args))
+    conn.close()
+
+
+def tile_specs(landscape: SparseLandscape, config: SimulationConfig,
+               rngs: List[np.random.Generator]) -> Tuple[List[TileSpec], np.ndarray, np.ndarray]:
+    """
+    Partition the coffee cells into config.tiles (rows, columns) rectangular tiles of
+    near-equal size and work out the halo of every tile.
+
+    Returns
+    -------
+    tuple
+        (one TileSpec per tile, owning tile of every coffee cell, local index of every
+        coffee cell within its owning tile).
+    """
+    tile_rows, tile_cols = config.tiles
+    row_edges = [part[0] for part in np.array_split(np.arange(landscape.shape[0]), tile_rows)[1:]]
+    col_edges = [part[0] for part in np.array_split(np.arange(landscape.shape[1]), tile_cols)[1:]]
+    owner = (np.searchsorted(row_edges, landscape.rows, side="right") * tile_cols
+             + np.searchsorted(col_edges, landscape.cols, side="right"))
+
+    # (receiving tile, owning tile, cell) of every coffee cell next to another tile
+    source = np.repeat(np.arange(landscape.n_cells), np.diff(landscape.indptr))
+    target = landscape.indices
+    crossing = owner[source] != owner[target]
+    halo = np.unique(np.stack([owner[source[crossing]], owner[target[crossing]], target[crossing]]), axis=1)
+
+    n_tiles = tile_rows * tile_cols
+    cells = []
+    for t in range(n_tiles):
+        own = np.flatnonzero(owner == t)
+        cells.append(np.union1d(own, halo[2, halo[0] == t]))
+    local = np.empty(landscape.n_cells, dtype=np.int64)
+    for t in range(n_tiles):
+        own = owner[cells[t]] == t
+        local[cells[t][own]] = np.flatnonzero(own)
+
+    specs = []
+    for t in range(n_tiles):
+        send = {}
+        recv = {}
+        for other in range(n_tiles):
+            out = halo[2, (halo[0] == other) & (halo[1] == t)]
+            into = halo[2, (halo[0] == t) & (halo[1] == other)]
+            if out.size:
+                send[other] = local[out]
+            if into.size:
+                recv[other] = np.searchsorted(cells[t], into)
+        specs.append(TileSpec(landscape.shape, landscape.rows[cells[t]], landscape.cols[cells[t]],
+                              owner[cells[t]] == t, send, recv, config, rngs[t]))
+    return specs, owner, local
+
+
+class TiledPlants:
+    """
+    Coordinator side of a tiled run: the worker processes of all tiles, plus the
+    coffee cells of the landscape to map grid positions and plants to tiles.
+
+    Use as a context manager, or call close, to stop the workers.
+    """
+
+    def __init__(self, landscape: SparseLandscape, config: SimulationConfig,
+                 rng: Optional[np.random.Generator] = None) -> None:
+        rng = rng or default_rng
+        self.landscape = landscape
+        self.config = config
+        specs, self.owner, self.local = tile_specs(landscape, config, rng.spawn(int(np.prod(config.tiles))))
+        self._conns = []
+        self._workers = []
+        for spec in specs:
+            conn, child = mp.Pipe()
+            worker = mp.Process(target=_serve, args=(child, spec), daemon=True)
+            worker.start()
+            child.close()
+            self._conns.append(conn)
+            self._workers.append(worker)
+        for conn in self._conns:
+            conn.recv()
+
+    @classmethod
+    def from_landscape(cls, landscape: pd.DataFrame, config: SimulationConfig,
+                       rng: Optional[np.random.Generator] = None) -> "TiledPlants":
+        """Start the workers for a boolean landscape from make_landscape (True = coffee)."""
+        return cls(SparseLandscape.from_mask(landscape, config.boundary == "toroidal"), config, rng)
+
+    @property
+    def n_tiles(self) -> int:
+        return len(self._conns)
+
+    def call(self, name: str, *args: Any) -> List[Any]:
+        """Call a Tile method with the same arguments on every tile, in parallel."""
+        return self.call_each(name, [args] * self.n_tiles)
+
+    def call_one(self, t: int, name: str, *args: Any) -> Any:
+        """Call a Tile method on tile ``t`` only."""
+        self._conns[t].send((name, args))
+        return self._conns[t].recv()
+
+    def call_each(self, name: str, args: List[tuple]) -> List[Any]:
+        """Call a Tile method with per-tile arguments on every tile, in parallel."""
+        for conn, a in zip(self._conns, args):
+            conn.send((name, a))
+        return [conn.recv() for conn in self._conns]
+
+    def exchange(self, name: str, outgoing: List[Dict[int, np.ndarray]], *args: Any) -> List[Any]:
+        """
+        Deliver the per-destination messages of every tile (tile -> {destination: data})
+        with a call of Tile method ``name``, which receives {sender: data}.
+        """
+        incoming = [{} for _ in range(self.n_tiles)]
+        for sender, messages in enumerate(outgoing):
+            for t, data in messages.items():
+                incoming[t][sender] = data
+        return self.call_each(name, [args + (messages,) for messages in incoming])
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        for conn in self._conns:
+            conn.send(None)
+            conn.close()
+        for worker in self._workers:
+            worker.join()
+        self._conns = []
+        self._workers = []
+
+    def __enter__(self) -> "TiledPlants":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def daily_summary(plants: TiledPlants, day: int) -> List[float]:
+    """Return [infectivity_score, infected_cells, infected_plants, day] over all tiles."""
+    score, cells, infected = np.sum(plants.call("summary"), axis=0)
+    return [float(score), int(cells), int(infected), day]
+
+
+def initial_infection(plants: TiledPlants, rng: Optional[np.random.Generator] = None) -> None:
+    """
+    Randomly select one plant and one plant in an adjacent coffee cell to become
+    infected. Draws follow array_engine.initial_infection.
+    """
+    rng = rng or default_rng
+    ppc = plants.config.plants_per_cell
+    a = int(rng.integers(0, plants.landscape.n_cells * ppc))
+    targets = [a]
+    neighbors = (plants.landscape.neighbors(a // ppc)[:, np.newaxis] * ppc + np.arange(ppc)).ravel()
+    if len(neighbors) > 0:
+        targets.append(int(neighbors[rng.integers(0, min(8, len(neighbors)))]))
+    per_tile = [[] for _ in range(plants.n_tiles)]
+    for g in targets:
+        per_tile[plants.owner[g // ppc]].append(plants.local[g // ppc] * ppc + g % ppc)
+    plants.call_each("infect", [(np.array(p, dtype=np.int64),) for p in per_tile])
+    if plants.n_tiles == 1:
+        # the only tile makes all later draws, in the order of the arrays engine
+        plants.call_one(0, "use_rng", rng)
+
+
+def global_infection(plants: TiledPlants, healthy: List[int], total_score: float) -> None:
+    """
+    Infect three random healthy plants anywhere in the landscape when the total
+    infection score is high enough. Tile 0 draws the targets as
+    array_engine.global_infection does, over the healthy plants of all tiles in tile
+    order.
+    """
+    n_healthy = sum(healthy)
+    if n_healthy > 100 and total_score >= 0.5:
+        picks = plants.call_one(0, "draw_global", n_healthy)
+        offsets = np.cumsum([0] + healthy)
+        tile = np.searchsorted(offsets, picks, side="right") - 1
+        plants.call_each("infect_healthy", [(picks[tile == t] - offsets[t],) for t in range(plants.n_tiles)])
+
+
+def neighbor_cell_infection(plants: TiledPlants) -> None:
+    """
+    Run the "cell" neighbour rule on every tile and resolve the infections of halo
+    plants with their owners until none is rejected (see the module docstring).
+    """
+    outgoing = plants.call("spread", "cell")
+    while any(outgoing):
+        rejected, halos = zip(*plants.exchange("receive_infections", outgoing))
+        plants.exchange("receive_halo", list(halos))
+        outgoing = plants.exchange("redraw", list(rejected))
+
+
+def each_day(plants: TiledPlants, day: int, neighbor_mode: Optional[str] = None,
+             rng: Optional[np.random.Generator] = None, weather: Optional[np.ndarray] = None) -> List[float]:
+    """
+    Tiled equivalent of array_engine.each_day; see the module docstring for the phases.
+
+    Parameters
+    ----------
+    plants : TiledPlants
+        Running tiles.
+    day : int
+        Current day number.
+    neighbor_mode : str, optional
+        Neighbour spread rule, "cell" or "convolution"; defaults to the config's.
+    rng : np.random.Generator, optional
+        Random generator of the replicate, for the weather.
+    weather : np.ndarray, optional
+        The day's row of a weather_schedule; drawn with weather_effects if not given.
+
+    Returns
+    -------
+    List[float]
+        [infectivity_score, infected_cells, infected_plants, day_number]
+    """
+    neighbor_mode = neighbor_mode or plants.config.neighbor_spread
+    if neighbor_mode not in ("cell", "convolution"):
+        raise ValueError(f"unknown neighbour spread rule: {neighbor_mode}")
+    rng = rng or default_rng
+    if weather is None:
+        weather = weather_effects(day, plants.config, rng)
+    halos, scores = zip(*plants.call("progress", weather))
+    if weather[0] and weather[1]:
+        plants.exchange("receive_halo", list(halos))
+        if neighbor_mode == "convolution":
+            plants.exchange("receive_weights", plants.call("spread", neighbor_mode))
+        else:
+            neighbor_cell_infection(plants)
+        if weather[2]:
+            global_infection(plants, plants.call("healthy_count"), sum(scores))
+    return daily_summary(plants, day)
+
+
+def fast_forward(plants: TiledPlants, day: int, n_days: int) -> Optional[List[List[float]]]:
+    """
+    Tiled equivalent of array_engine.fast_forward: every tile advances its own plants
+    in one jump, unless one of them has to be stepped day by day.
+    """
+    scores = plants.call("plan_jump", n_days)
+    apply = all(s is not None for s in scores)
+    plants.call("commit_jump", apply)
+    if not apply:
+        return None
+    _, infected_cells, infected_plants, _ = daily_summary(plants, day)
+    scores = np.sum(scores, axis=0)
+    return [[float(score), infected_cells, infected_plants, day + k] for k, score in enumerate(scores)]
+
+
+def infection_map(plants: TiledPlants) -> np.ndarray:
+    """Tiled equivalent of model.infection_map: 0 non-coffee, 1 coffee, 2 coffee with infected plants."""
+    landscaped = plants.landscape.to_dense().astype(np.uint8)
+    for rows, cols in plants.call("infected_cells"):
+        landscaped[rows, cols] = 2
+    return landscaped
+
+
+def composition(plants: TiledPlants) -> np.ndarray:
+    """Tiled equivalent of array_engine.composition; every tile counts its own infected cells."""
+    infected = sum(rows.size for rows, _ in plants.call("infected_cells"))
+    rows, cols = plants.landscape.shape
+    n_cells = plants.landscape.n_cells
+    return np.array([rows * cols - n_cells, n_cells - infected, infected], dtype=np.int64)
+
+
+def calculate_returns(plants: TiledPlants) -> float:
+    """Update production from infection and return the total production of all tiles."""
+    return float(sum(plants.call("returns")))